@@ -0,0 +1,40 @@
+"""Add ban watchlist tables
+
+Revision ID: 3f1c9a2d7e64
+Revises: b57e50910191
+Create Date: 2026-10-18 12:04:31.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1c9a2d7e64'
+down_revision: Union[str, None] = 'b57e50910191'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('watchlist',
+                    sa.Column('id', sa.Integer, primary_key=True, autoincrement=True),
+                    sa.Column('userid', sa.BigInteger, nullable=False),
+                    sa.Column('steamid', sa.BigInteger, nullable=False),
+                    sa.UniqueConstraint('userid', 'steamid'))
+    op.create_index('ix_watchlist_userid', 'watchlist', ['userid'])
+    op.create_index('ix_watchlist_steamid', 'watchlist', ['steamid'])
+
+    op.create_table('ban_states',
+                    sa.Column('steamid', sa.BigInteger, primary_key=True, autoincrement=False),
+                    sa.Column('state', sa.Integer, nullable=False),
+                    sa.Column('changed_at', sa.Integer))
+
+
+def downgrade() -> None:
+    op.drop_table('ban_states')
+    op.drop_index('ix_watchlist_steamid', 'watchlist')
+    op.drop_index('ix_watchlist_userid', 'watchlist')
+    op.drop_table('watchlist')
@@ -0,0 +1,33 @@
+"""Add stats snapshots table
+
+Revision ID: 8d2e4b71c0a9
+Revises: 3f1c9a2d7e64
+Create Date: 2026-10-18 13:21:07.542310
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d2e4b71c0a9'
+down_revision: Union[str, None] = '3f1c9a2d7e64'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('stats_snapshots',
+                    sa.Column('id', sa.Integer, primary_key=True, autoincrement=True),
+                    sa.Column('steamid', sa.BigInteger, nullable=False),
+                    sa.Column('taken_at', sa.Integer, nullable=False),
+                    sa.Column('is_keyframe', sa.Boolean, nullable=False),
+                    sa.Column('data', sa.LargeBinary, nullable=False))
+    op.create_index('ix_stats_snapshots_steamid', 'stats_snapshots', ['steamid'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_stats_snapshots_steamid', 'stats_snapshots')
+    op.drop_table('stats_snapshots')
@@ -0,0 +1,29 @@
+"""User ids are now bigints
+
+Revision ID: a5c0d3e9f214
+Revises: 8d2e4b71c0a9
+Create Date: 2026-10-18 18:21:47.530912
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a5c0d3e9f214'
+down_revision: Union[str, None] = '8d2e4b71c0a9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Telegram user ids don't fit into 32 bits, which only SQLite doesn't mind
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.alter_column('userid', type_=sa.BigInteger, existing_type=sa.Integer)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.alter_column('userid', type_=sa.Integer, existing_type=sa.BigInteger)
@@ -0,0 +1,271 @@
+"""
+Local benchmarks for the performance-sensitive parts of the bot.
+
+Usage: python benchmark.py <name>
+"""
+
+import asyncio
+from pathlib import Path
+import random
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+
+from bottypes.columns import IntHashIndex
+from bottypes.compact_sessions import CompactSessionTable
+from bottypes.sessions import UserSession, UserSessions
+from bottypes.user_directory import UserDirectory, UserRecord, write_users
+from db import db_session, SQLiteBackend, User as DBUser
+from utypes.faceit import FaceitAPI, FaceitStubServer, FaceitUnavailable
+from utypes.game_data import LeaderboardStats
+from utypes.leaderboard_store import LeaderboardStore, LEADERBOARD_BOARDS
+from utypes.protobufs import parse_detail_data, ScoreLeaderboardData
+from utypes.protobufs.leaderboard import ScoreLeaderboardDataEntry
+
+
+async def faceit():
+    """FACEIT lookup latency while the FACEIT API is healthy, slow or down."""
+
+    steamids = [76561198000000000 + i for i in range(20)]
+
+    async with FaceitStubServer(delay=10) as server:
+        for mode in ('ok', 'slow', 'down'):
+            server.mode = mode
+            faceit_api = FaceitAPI(base_url=server.base_url, timeout=1)
+
+            latencies = []
+            unavailable = 0
+            for steamid in steamids:
+                start = time.perf_counter()
+                try:
+                    await faceit_api.get_player(steamid)
+                except FaceitUnavailable:
+                    unavailable += 1
+                latencies.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            for steamid in steamids:
+                try:
+                    await faceit_api.get_player(steamid)
+                except FaceitUnavailable:
+                    pass
+            cached_time = time.perf_counter() - start
+
+            print(f'{mode:>4}: {len(steamids)} lookups, total {sum(latencies):.3f}s, '
+                  f'max {max(latencies) * 1000:.1f}ms, median {sorted(latencies)[len(latencies) // 2] * 1000:.1f}ms, '
+                  f'{unavailable} unavailable, breaker {faceit_api.breaker.state}; '
+                  f'repeated lookups {cached_time * 1000:.1f}ms')
+            await faceit_api.close()
+
+
+def _betterproto_detail_data(detail_data: str) -> dict[int, int]:
+    """The previous way of parsing ``detailData``."""
+
+    data = ScoreLeaderboardData().parse(bytes.fromhex(detail_data[2:].rstrip('0')))
+    return {entry.tag: entry.val for entry in data.matchentries}
+
+
+def leaderboard_decoder():
+    """Decoding ``detailData`` of a full 1000 entries leaderboard."""
+
+    rng = random.Random(730)
+    board = []
+    for _ in range(1000):
+        entries = [ScoreLeaderboardDataEntry(16, rng.randrange(2000)),  # wins
+                   ScoreLeaderboardDataEntry(17, rng.randrange(50)),  # ties
+                   ScoreLeaderboardDataEntry(18, rng.randrange(2000)),  # losses
+                   ScoreLeaderboardDataEntry(19, rng.getrandbits(32)),  # last wins
+                   ScoreLeaderboardDataEntry(20, rng.randrange(1_700_000_000, 1_750_000_000)),  # timestamp
+                   ScoreLeaderboardDataEntry(21, rng.choice((1, 2, 3, 4, 5, 7, 9)))]  # region
+        message = bytes(ScoreLeaderboardData(matchentries=entries))
+        board.append('0x' + message.hex() + '00' * rng.randrange(4))
+
+    for detail_data in board:
+        assert parse_detail_data(detail_data) == _betterproto_detail_data(detail_data)
+
+    for name, parse in (('betterproto', _betterproto_detail_data), ('hand-rolled', parse_detail_data)):
+        runs = 10
+        total = timeit.timeit(lambda: [parse(detail_data) for detail_data in board], number=runs)
+        print(f'{name:>11}: {total / runs * 1000:.2f}ms per {len(board)} entries')
+
+
+def leaderboard_search():
+    """Player search across every full leaderboard."""
+
+    rng = random.Random(730)
+    alphabet = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_-'
+    boards = {}
+    for board in LEADERBOARD_BOARDS:
+        boards[board] = [LeaderboardStats(rank, 40000 - rank * 7,
+                                          ''.join(rng.choices(alphabet, k=rng.randrange(3, 16))),
+                                          rng.randrange(2000), rng.randrange(50), rng.randrange(2000),
+                                          {}, 0, rng.choice(('NA', 'EU', 'AS')))
+                         for rank in range(1, 5001)]
+
+    start = time.perf_counter()
+    store = LeaderboardStore.from_stats(boards)
+    print(f'index of {sum(map(len, boards.values()))} players built in {(time.perf_counter() - start) * 1000:.1f}ms')
+
+    queries = [person.name[:rng.randrange(1, 5)] for person in rng.sample(boards['world'], 1000)]
+    runs = 5
+    total = timeit.timeit(lambda: [store.search(query) for query in queries], number=runs)
+    print(f'search: {total / runs / len(queries) * 1_000_000:.1f}µs per query (up to 10 results)')
+
+    total = timeit.timeit(lambda: [store.page(board, 42) for board in LEADERBOARD_BOARDS], number=1000)
+    print(f'page: {total / 1000 / len(LEADERBOARD_BOARDS) * 1_000_000:.1f}µs per page')
+
+
+async def sessions_flush():
+    """Writing user sessions back to the db, with every, some or none of them changed."""
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        await db_session.init(Path(tmp_dir) / 'users.db')
+
+        count = 20000
+        async with db_session.create_session() as db_sess:
+            dbusers = [DBUser(userid=i, language='en', current_menu_id='main', previous_menu_id='main')
+                       for i in range(count)]
+            db_sess.add_all(dbusers)
+            await db_sess.commit()
+
+        sessions = UserSessions({dbuser.userid: UserSession(dbuser) for dbuser in dbusers})
+
+        for changed in (count, count // 10, 0):
+            for session in random.Random(730).sample(list(sessions.values()), changed):
+                session.current_menu_id = f'menu{changed}'
+                session.last_bot_pm_id = changed
+
+            start = time.perf_counter()
+            await sessions.sync_with_db()
+            print(f'{changed:>5} of {count} sessions changed: flushed in {(time.perf_counter() - start) * 1000:.1f}ms')
+
+
+async def _insert_committing(record: UserRecord):
+    """A new user the way they were registered before the db writer: own session, own commit."""
+
+    async with db_session.create_session() as db_sess:
+        db_sess.add(DBUser(**record._asdict()))
+        await db_sess.commit()
+
+
+async def sessions_db():
+    """Session flush and registration throughput with the default and the tuned SQLite setup."""
+
+    count = 20000
+    registrations = 2000
+    records = [UserRecord(i, 'main', 'main', 'en', None) for i in range(count)]
+    new_records = [UserRecord(count + i, None, None, 'en', i) for i in range(registrations)]
+
+    for setup, pragmas in (('default', {}), ('tuned', None)):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            await db_session.init(SQLiteBackend.from_file(Path(tmp_dir) / 'users.db', pragmas=pragmas))
+            await write_users([record._asdict() for record in records])
+
+            sessions = UserSessions({record.userid: UserSession(record) for record in records})
+            for session in sessions.values():
+                session.current_menu_id = 'settings'
+            start = time.perf_counter()
+            await sessions.sync_with_db()
+            print(f'{setup:>7}: flush of {count} sessions {(time.perf_counter() - start) * 1000:.1f}ms')
+
+            for name, register in (('own commits', _insert_committing),
+                                   ('db writer', lambda record: write_users([record._asdict()], overwrite=False))):
+                batch, new_records = new_records, [record._replace(userid=record.userid + registrations)
+                                                   for record in new_records]
+                start = time.perf_counter()
+                results = await asyncio.gather(*(register(record) for record in batch), return_exceptions=True)
+                elapsed = time.perf_counter() - start
+                failed = sum(isinstance(result, Exception) for result in results)
+                print(f'{setup:>7}: {registrations} concurrent registrations, {name}: '
+                      f'{(registrations - failed) / elapsed:.0f}/s, {failed} failed')
+
+            await db_session.close()
+
+
+def _traced(build) -> tuple[object, int]:
+    """The result of ``build`` and the memory it holds."""
+
+    tracemalloc.start()
+    result = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size
+
+
+def sessions_memory():
+    """
+    Memory of a million resident sessions, of the directory of all users and of the unique users set:
+    the dict based structures vs the compact ones. A bot with a million resident sessions needs all three.
+    """
+
+    count = 1_000_000
+    rng = random.Random(730)
+    menu_ids = [None, 'main', 'extra_features', 'profile_info', 'game_leaderboard', 'settings', 'language']
+    lang_codes = ['en', 'ru', 'uk', 'en', 'tr', 'fa', 'be', 'uz', 'it', None]
+    records = [UserRecord(100_000_000 + i * 37, rng.choice(menu_ids), rng.choice(menu_ids),
+                          rng.choice(lang_codes), rng.randrange(1, 1_000_000))
+               for i in range(1, count + 1)]
+    user_ids = [record.userid for record in rng.sample(records, 100_000)]
+
+    def build_dict():
+        return UserSessions({record.userid: UserSession(record) for record in records})
+
+    def build_table():
+        table = CompactSessionTable()
+        for record in records:
+            table.add(record.userid, record)
+        return table
+
+    for name, build in (('UserSessions', build_dict), ('CompactSessionTable', build_table)):
+        sessions, size = _traced(build)
+        access = timeit.timeit(lambda: [sessions[user_id].current_menu_id for user_id in user_ids], number=1)
+        print(f'{name:>19}: {size / 2 ** 20:6.1f}MiB for {count} sessions, '
+              f'{access / len(user_ids) * 1_000_000:.2f}µs per access')
+        del sessions
+
+    def build_records():  # the directory used to keep a record object per user
+        return {record.userid: UserRecord(*record) for record in records}
+
+    def build_directory():
+        directory = UserDirectory()
+        directory.store(records)
+        return directory
+
+    for name, build in (('dict of UserRecord', build_records), ('UserDirectory', build_directory)):
+        directory, size = _traced(build)
+        print(f'{name:>19}: {size / 2 ** 20:6.1f}MiB for {len(directory)} known users')
+        del directory
+
+    for name, build in (('set', set), ('IntHashIndex', IntHashIndex)):
+        def build_users():
+            users = build()
+            for record in records:
+                users.add(record.userid)
+            return users
+
+        users, size = _traced(build_users)
+        print(f'{name:>19}: {size / 2 ** 20:6.1f}MiB for {len(users)} unique users')
+        del users
+
+
+BENCHMARKS = {'faceit': faceit,
+              'leaderboard_decoder': leaderboard_decoder,
+              'leaderboard_search': leaderboard_search,
+              'sessions_db': sessions_db,
+              'sessions_flush': sessions_flush,
+              'sessions_memory': sessions_memory}
+
+
+def main():
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        print(f'--- {name} ---')
+        result = BENCHMARKS[name]()
+        if asyncio.iscoroutine(result):
+            asyncio.run(result)
+
+
+if __name__ == '__main__':
+    main()
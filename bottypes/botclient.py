@@ -18,6 +18,9 @@ from pyropatch import pyropatch  # do not delete!!
 from .extended_ik import ExtendedIKM
 from .logger import BotLogger
 from .menu import Menu, NavMenu, FuncMenu
+from .columns import IntHashIndex
+from .compact_sessions import CompactSessionTable
+from .user_directory import UserDirectory
 from .sessions import UserSession, UserSessions
 from .stats import BotRegularStats
 
@@ -33,13 +36,20 @@ class BotClient(Client):
 
     WILDCARD = '_'
 
-    def __init__(self, *args, logger: BotLogger, navigate_back_callback: str, commands_prefix: str = '/', **kwargs):
+    def __init__(self, *args, logger: BotLogger, navigate_back_callback: str, commands_prefix: str = '/',
+                 max_sessions: int = None, compact_sessions: bool = False, **kwargs):
         super().__init__(*args, **kwargs)
 
         self.logger = logger
         self.navigate_back_callback = navigate_back_callback
 
-        self._sessions: UserSessions = UserSessions()
+        self.user_directory = UserDirectory()
+        if compact_sessions:  # for very large numbers of resident sessions
+            self._sessions: UserSessions | CompactSessionTable = CompactSessionTable(max_sessions=max_sessions,
+                                                                                    directory=self.user_directory)
+        else:
+            self._sessions = UserSessions(max_sessions=max_sessions, directory=self.user_directory)
+        self._directory_loading: asyncio.Task | None = None
 
         self._commands: dict[str, tuple | dict] = {}
         self.commands_prefix = commands_prefix
@@ -56,14 +66,17 @@ class BotClient(Client):
         self.startup_dt = None
 
         self.rstats = BotRegularStats()
+        if compact_sessions:
+            self.rstats.unique_users_served = IntHashIndex()
 
     @property
-    def sessions(self) -> UserSessions:
+    def sessions(self) -> UserSessions | CompactSessionTable:
         return self._sessions
 
     async def start(self):
         await super().start()
         self.startup_dt = dt.datetime.now(dt.UTC)
+        self._directory_loading = asyncio.create_task(self.user_directory.load())
 
     async def mainloop(self):
         # ESSENTIALS FOR MAINLOOP
@@ -98,6 +111,7 @@ class BotClient(Client):
 
     async def dump_sessions(self):
         await self.clear_timeout_sessions()
+        await self.user_directory.write_pending()
         await self._sessions.sync_with_db()
 
     async def clear_timeout_sessions(self):
@@ -295,9 +309,7 @@ class BotClient(Client):
             return
 
         user = callback_query.from_user
-        session = self.sessions.get(user.id)
-        if session is None:
-            session = await self.register_session(user, callback_query.message)
+        session = await self.register_session(user, callback_query.message)  # existing sessions are only touched
 
         if callback_query.message.chat.id != self.logger.log_channel_id:
             await self.log_callback(session, callback_query)
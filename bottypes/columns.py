@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import numpy as np
+
+
+__all__ = ('IntHashIndex', 'InternTable')
+
+
+class IntHashIndex:
+    """
+    Hash map of positive integer keys to int32 values with open addressing, kept in two numpy arrays.
+
+    A dict of a million ids holds a million int objects on top of its table, this takes 12 bytes per slot.
+    Also works as a set of ids (``add``).
+    """
+
+    __slots__ = ('_keys', '_values', '_len', '_used')
+
+    _EMPTY = 0
+    _DELETED = -1
+    MIN_CAPACITY = 1024
+    MAX_LOAD = 0.7
+
+    def __init__(self, capacity: int = MIN_CAPACITY):
+        self._keys = np.zeros(capacity, np.int64)
+        self._values = np.zeros(capacity, np.int32)
+        self._len = 0
+        self._used = 0  # keys and deleted slots
+
+    def __len__(self):
+        return self._len
+
+    def _slot(self, key: int) -> int:
+        """Slot of the key or, if it's missing, a slot to put it to."""
+
+        keys = self._keys
+        mask = len(keys) - 1
+        i = ((key * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) >> 32 & mask  # Fibonacci hashing
+        first_deleted = None
+        while True:
+            slot_key = keys.item(i)
+            if slot_key == key:
+                return i
+            if slot_key == self._EMPTY:
+                return i if first_deleted is None else first_deleted
+            if slot_key == self._DELETED and first_deleted is None:
+                first_deleted = i
+            i = (i + 1) & mask
+
+    def get(self, key: int, default: int = None) -> int | None:
+        i = self._slot(key)
+        return self._values.item(i) if self._keys.item(i) == key else default
+
+    def __contains__(self, key: int):
+        return self._keys.item(self._slot(key)) == key
+
+    def __getitem__(self, key: int) -> int:
+        if (value := self.get(key)) is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: int, value: int):
+        i = self._slot(key)
+        slot_key = self._keys.item(i)
+        if slot_key != key:
+            self._len += 1
+            if slot_key == self._EMPTY:
+                self._used += 1
+            self._keys[i] = key
+        self._values[i] = value
+
+        if self._used > len(self._keys) * self.MAX_LOAD:
+            self._resize(max(self.MIN_CAPACITY, 1 << (self._len * 2 - 1).bit_length()))  # load of 1/2 at most
+
+    def add(self, key: int):
+        self[key] = 0
+
+    def __delitem__(self, key: int):
+        i = self._slot(key)
+        if self._keys.item(i) != key:
+            raise KeyError(key)
+        self._keys[i] = self._DELETED
+        self._len -= 1
+
+    def clear(self):
+        self.__init__()
+
+    def _resize(self, capacity: int):
+        keys, values = self._keys, self._values
+        present = keys > 0
+        self.__init__(capacity)
+        for key, value in zip(keys[present].tolist(), values[present].tolist()):
+            self[key] = value
+
+    @property
+    def nbytes(self) -> int:
+        return self._keys.nbytes + self._values.nbytes
+
+
+class InternTable:
+    """
+    Stores repeated values (menu ids, language codes) once, so columns can hold their small integer indices.
+
+    Indices are never reused, so tables can be shared by everyone storing the same kind of values.
+    """
+
+    __slots__ = ('values', '_indices')
+
+    def __init__(self, values=()):
+        self.values = []
+        self._indices = {}
+        for value in values:
+            self.index(value)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, i: int):
+        return self.values[i]
+
+    def index(self, value) -> int:
+        if (i := self._indices.get(value)) is None:
+            i = self._indices[value] = len(self.values)
+            self.values.append(value)
+        return i
@@ -0,0 +1,291 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+
+import numpy as np
+from pyrogram.types import Message, User
+
+from .columns import IntHashIndex
+from .sessions import UserSession, UserSessions
+from .user_directory import UserDirectory, UserRecord, write_users
+
+
+__all__ = ('CompactSessionTable', 'CompactUserSession')
+
+
+class CompactUserSession:
+    """
+    ``UserSession`` interface over a row of ``CompactSessionTable``, created on access.
+
+    The row is looked up by the user id every time, since rows move when other sessions are dropped.
+    """
+
+    __slots__ = ('_table', 'user_id')
+
+    def __init__(self, table: CompactSessionTable, user_id: int):
+        self._table = table
+        self.user_id = user_id
+
+    def _get(self, column: str):
+        return self._table.columns[column].item(self._table.index[self.user_id])
+
+    def _set(self, column: str, value):
+        row = self._table.index[self.user_id]
+        values = self._table.columns[column]
+        if values.item(row) != value:
+            values[row] = value
+            self._table.columns['is_dirty'][row] = True
+
+    @property
+    def timestamp(self) -> float:
+        return self._get('timestamp')
+
+    @property
+    def current_menu_id(self) -> str | None:
+        return self._table.menu_ids[self._get('current_menu')]
+
+    @current_menu_id.setter
+    def current_menu_id(self, value: str | None):
+        self._set('current_menu', self._table.intern_menu_id(value))
+
+    @property
+    def previous_menu_id(self) -> str | None:
+        return self._table.menu_ids[self._get('previous_menu')]
+
+    @previous_menu_id.setter
+    def previous_menu_id(self, value: str | None):
+        self._set('previous_menu', self._table.intern_menu_id(value))
+
+    @property
+    def lang_code(self) -> str | None:
+        return self._table.lang_codes[self._get('lang')]
+
+    @property
+    def locale(self):
+        return self._table.locales[self._get('lang')]
+
+    @property
+    def last_bot_pm_id(self) -> int | None:
+        return self._get('last_bot_pm_id') or None
+
+    @last_bot_pm_id.setter
+    def last_bot_pm_id(self, value: int | None):
+        self._set('last_bot_pm_id', value or 0)
+
+    @property
+    def rate_limit(self):
+        return self._table.rate_limit(self.user_id)
+
+    @property
+    def is_dirty(self) -> bool:
+        return self._get('is_dirty')
+
+    def update_lang(self, lang_code: str):
+        self._set('lang', self._table.intern_lang_code(lang_code))
+
+    def to_row(self) -> dict:
+        return self._table.to_rows([self._table.index[self.user_id]])[0]
+
+    async def sync_with_db(self):
+        await self._table.flush([self._table.index[self.user_id]])
+
+
+class CompactSessionTable:
+    """
+    Drop-in replacement for ``UserSessions`` for very large numbers of resident sessions.
+
+    Sessions are rows of typed columns: menu ids and languages are stored as indices into interned tables,
+    missing menu ids and message ids as 0. Users are found by an ``IntHashIndex`` of their ids.
+    Rate limit buckets are only kept for users who have made lookups.
+    """
+
+    COLUMNS = {'user_id': np.int64,
+               'timestamp': np.float64,  # monotonic, of the last access
+               'current_menu': np.int16,
+               'previous_menu': np.int16,
+               'lang': np.uint16,
+               'last_bot_pm_id': np.int32,
+               'is_dirty': np.bool_}
+    MIN_CAPACITY = 1024
+    SESSIONS_LIFETIME = UserSessions.SESSIONS_LIFETIME
+    EVICTION_LOW_WATER = UserSessions.EVICTION_LOW_WATER
+
+    def __init__(self, *, max_sessions: int = None, directory: UserDirectory = None):
+        self.max_sessions = max_sessions
+        self.directory = directory if directory is not None else UserDirectory()
+        self._eviction: asyncio.Task | None = None
+
+        self.columns = {column: np.zeros(self.MIN_CAPACITY, dtype) for column, dtype in self.COLUMNS.items()}
+        self.index = IntHashIndex()  # user id: row
+        self._len = 0
+
+        self.menu_ids = self.directory.menu_ids  # shared, so rows of both use the same indices
+        self.lang_codes = self.directory.lang_codes
+        self.locales = []  # of lang_codes
+
+        self._rate_limits = {}
+
+    def __len__(self):
+        return self._len
+
+    def __contains__(self, user_id: int):
+        return user_id in self.index
+
+    def get(self, user_id: int) -> CompactUserSession | None:
+        return CompactUserSession(self, user_id) if user_id in self.index else None
+
+    def __getitem__(self, user_id: int) -> CompactUserSession:
+        self.columns['timestamp'][self.index[user_id]] = time.monotonic()
+        return CompactUserSession(self, user_id)
+
+    def intern_menu_id(self, menu_id: str | None) -> int:
+        return self.menu_ids.index(menu_id)
+
+    def intern_lang_code(self, lang_code: str | None) -> int:
+        from functions import locale
+
+        i = self.lang_codes.index(lang_code)
+        while len(self.locales) <= i:  # the directory interns languages too
+            self.locales.append(locale(self.lang_codes[len(self.locales)]))
+        return i
+
+    def rate_limit(self, user_id: int):
+        from utypes.ratelimit import TokenBucket
+
+        if (bucket := self._rate_limits.get(user_id)) is None:
+            bucket = self._rate_limits[user_id] = TokenBucket.per_minute(UserSession.LOOKUPS_BURST,
+                                                                         UserSession.LOOKUPS_PER_MINUTE)
+        return bucket
+
+    def add(self, user_id: int, record: UserRecord) -> CompactUserSession:
+        if self._len == len(self.columns['user_id']):
+            self.columns = {column: np.resize(values, len(values) * 2) for column, values in self.columns.items()}
+
+        row = self._len
+        values = {'user_id': user_id,
+                  'timestamp': time.monotonic(),
+                  'current_menu': self.intern_menu_id(record.current_menu_id),
+                  'previous_menu': self.intern_menu_id(record.previous_menu_id),
+                  'lang': self.intern_lang_code(record.language),
+                  'last_bot_pm_id': record.last_bot_pm_id or 0,
+                  'is_dirty': False}
+        for column, value in values.items():
+            self.columns[column][row] = value
+
+        self.index[user_id] = row
+        self._len += 1
+        return CompactUserSession(self, user_id)
+
+    def _remove(self, rows: np.ndarray):
+        """Remove the rows, moving the last rows into their places."""
+
+        user_ids = self.columns['user_id']
+        for row in sorted(rows.tolist(), reverse=True):  # so the last row is never one that's being removed
+            last = self._len - 1
+            user_id = user_ids.item(row)
+            del self.index[user_id]
+            self._rate_limits.pop(user_id, None)
+            if row != last:
+                for values in self.columns.values():
+                    values[row] = values[last]
+                self.index[user_ids.item(row)] = row
+            self._len -= 1
+
+    def to_rows(self, rows) -> list[dict]:
+        """Values for ``write_users``, like ``UserSession.to_row``."""
+
+        columns = {column: values[rows].tolist() for column, values in self.columns.items()}
+        menu_ids, lang_codes = self.menu_ids, self.lang_codes
+        return [{'current_menu_id': menu_ids[current_menu],
+                 'previous_menu_id': menu_ids[previous_menu],
+                 'language': lang_codes[lang],
+                 'last_bot_pm_id': last_bot_pm_id or None,
+                 'userid': user_id}
+                for user_id, current_menu, previous_menu, lang, last_bot_pm_id
+                in zip(columns['user_id'], columns['current_menu'], columns['previous_menu'], columns['lang'],
+                       columns['last_bot_pm_id'])]
+
+    async def flush(self, rows=None) -> int:
+        """Write the changed sessions among the rows (all of them by default) to the db."""
+
+        is_dirty = self.columns['is_dirty']
+        rows = np.arange(self._len) if rows is None else np.asarray(rows, dtype=np.intp)
+        rows = rows[is_dirty[rows]]
+        if not len(rows):
+            return 0
+
+        user_ids = self.columns['user_id'][rows].tolist()  # rows may move while writing
+        to_write = self.to_rows(rows)
+        is_dirty[rows] = False
+        try:
+            await write_users(to_write)
+        except BaseException:
+            for user_id in user_ids:
+                if (row := self.index.get(user_id)) is not None:
+                    is_dirty[row] = True
+            raise
+
+        return len(to_write)
+
+    async def sync_with_db(self):
+        synced = await self.flush()
+        logging.info(f'CompactSessionTable synced with db! {synced} of {len(self)} sessions were changed.')
+
+    async def _drop(self, rows: np.ndarray):
+        """Write the sessions to the db and remove them, unless they get used in the meantime."""
+
+        user_ids = self.columns['user_id'][rows].tolist()
+        accessed = self.columns['timestamp'][rows].tolist()
+        await self.flush(rows)
+
+        timestamps = self.columns['timestamp']
+        rows = [row for user_id, timestamp in zip(user_ids, accessed)
+                if (row := self.index.get(user_id)) is not None and timestamps.item(row) == timestamp]
+        self.directory.update(self.to_rows(rows))
+        self._remove(np.array(rows, dtype=np.intp))
+
+    async def register_session(self, user: User, message: Message) -> CompactUserSession:
+        if user.id in self.index:
+            return self[user.id]
+
+        record = await self.directory.get(user.id) or self.directory.register(user, message)
+        self.add(user.id, record)
+        self._schedule_eviction()
+        return self[user.id]
+
+    _schedule_eviction = UserSessions._schedule_eviction
+
+    async def evict(self):
+        """Drop the least recently used sessions down to ``EVICTION_LOW_WATER`` of ``max_sessions``."""
+
+        excess = self._len - int(self.max_sessions * self.EVICTION_LOW_WATER)
+        if excess <= 0:
+            return
+
+        try:
+            await self._drop(np.argpartition(self.columns['timestamp'][:self._len], excess - 1)[:excess])
+        except Exception:
+            logging.exception('Failed to evict sessions')
+            return
+        logging.info(f'Evicted least recently used sessions, {len(self)} are left')
+
+    async def clear_timeout_sessions(self):
+        """Clear all sessions that exceed given timeout."""
+
+        expire_before = time.monotonic() - self.SESSIONS_LIFETIME.total_seconds()
+        await self._drop(np.flatnonzero(self.columns['timestamp'][:self._len] < expire_before))
+
+        full = [user_id for user_id, bucket in self._rate_limits.items() if bucket.tokens >= bucket.capacity]
+        for user_id in full:  # a new bucket would be the same
+            del self._rate_limits[user_id]
+
+    def clear(self):
+        if self._eviction is not None:
+            self._eviction.cancel()
+        self.__init__(max_sessions=self.max_sessions, directory=self.directory)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(values.nbytes for values in self.columns.values()) + self.index.nbytes
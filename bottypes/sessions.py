@@ -1,45 +1,65 @@
 from __future__ import annotations
 
+import asyncio
+from collections import OrderedDict
 import datetime as dt
+from itertools import islice, takewhile
 import logging
+import time
 
 from pyrogram.types import Message, User
-from sqlalchemy.future import select
 
-from db import db_session, User as DBUser
+from .user_directory import UserDirectory, UserRecord, write_users
 
 
 __all__ = ('UserSession', 'UserSessions')
 
 
 class UserSession:
-    __slots__ = ('dbuser_id', 'timestamp', 'current_menu_id',
+    """
+    Changes of the fields stored in the db (``SYNCED_FIELDS``) mark the session as dirty,
+    so only sessions that have actually changed get written back.
+    """
+
+    __slots__ = ('user_id', 'timestamp', 'current_menu_id',
                  'previous_menu_id', 'lang_code', 'last_bot_pm_id',
-                 'locale')
+                 'locale', 'rate_limit', 'is_dirty')
 
-    def __init__(self, dbuser: DBUser):
-        from functions import locale
+    LOOKUPS_BURST = 5
+    LOOKUPS_PER_MINUTE = 10
+    SYNCED_FIELDS = {'current_menu_id': 'current_menu_id',  # session attribute: UserRecord field
+                     'previous_menu_id': 'previous_menu_id',
+                     'lang_code': 'language',
+                     'last_bot_pm_id': 'last_bot_pm_id'}
 
-        self.dbuser_id = dbuser.id
-        self.timestamp = dt.datetime.now().timestamp()
-        self.current_menu_id = dbuser.current_menu_id
-        self.previous_menu_id = dbuser.previous_menu_id
-        self.lang_code = dbuser.language
-        self.last_bot_pm_id = dbuser.last_bot_pm_id
+    def __init__(self, record: UserRecord):
+        from functions import locale
+        from utypes.ratelimit import TokenBucket
+
+        self.user_id = record.userid
+        self.timestamp = time.monotonic()  # of the last access
+        self.current_menu_id = record.current_menu_id
+        self.previous_menu_id = record.previous_menu_id
+        self.lang_code = record.language
+        self.last_bot_pm_id = record.last_bot_pm_id
         self.locale = locale(self.lang_code)
+        self.rate_limit = TokenBucket.per_minute(self.LOOKUPS_BURST, self.LOOKUPS_PER_MINUTE)
+        self.is_dirty = False
+
+    def __setattr__(self, name, value):
+        if name in self.SYNCED_FIELDS and getattr(self, name, value) != value:
+            object.__setattr__(self, 'is_dirty', True)
+        object.__setattr__(self, name, value)
+
+    def to_row(self) -> dict:
+        """Values for ``write_users``."""
+
+        row = {column: getattr(self, field) for field, column in self.SYNCED_FIELDS.items()}
+        row['userid'] = self.user_id
+        return row
 
     async def sync_with_db(self):
-        async with db_session.create_session() as db_sess:
-            # noinspection PyTypeChecker
-            query = select(DBUser).where(DBUser.id == self.dbuser_id)
-            dbuser = (await db_sess.execute(query)).scalar()
-            dbuser.current_menu_id = self.current_menu_id
-            dbuser.previous_menu_id = self.previous_menu_id
-            dbuser.language = self.lang_code
-            dbuser.last_bot_pm_id = self.last_bot_pm_id
-
-            logging.info(f'UserSession synced with db! {dbuser=}')
-            await db_sess.commit()
+        await UserSessions.flush([self])
 
     def update_lang(self, lang_code: str):
         from functions import locale
@@ -48,58 +68,110 @@ class UserSession:
         self.locale = locale(self.lang_code)
 
 
-class UserSessions(dict[int, UserSession]):
+class UserSessions(OrderedDict[int, UserSession]):
+    """
+    Sessions ordered by their last access, least recently used first.
+
+    Expired sessions are all at the start, so a sweep stops at the first fresh one.
+    With ``max_sessions`` set, going over it starts a background eviction of the least recently used sessions
+    down to ``EVICTION_LOW_WATER`` of it, so handlers never wait for the db and evictions come in batches.
+    Users come from the ``directory``, which gets the latest values of the dropped sessions.
+    """
+
     SESSIONS_LIFETIME = dt.timedelta(hours=1)
+    EVICTION_LOW_WATER = 0.9
+
+    def __init__(self, *args, max_sessions: int = None, directory: UserDirectory = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_sessions = max_sessions
+        self.directory = directory if directory is not None else UserDirectory()
+        self._eviction: asyncio.Task | None = None
 
     def __getitem__(self, key: int):
         item = super().__getitem__(key)
-        item.timestamp = dt.datetime.now().timestamp()
+        item.timestamp = time.monotonic()
+        self.move_to_end(key)
         return item
 
+    @classmethod
+    async def flush(cls, sessions) -> int:
+        """
+        Write the changed sessions to the db with ``write_users``.
+
+        Returns:
+            The number of written sessions.
+        """
+
+        dirty = [session for session in sessions if session.is_dirty]
+        if not dirty:
+            return 0
+
+        rows = []
+        for session in dirty:  # changes made while the rows are being written mark the session dirty again
+            rows.append(session.to_row())
+            session.is_dirty = False
+
+        try:
+            await write_users(rows)
+        except BaseException:
+            for session in dirty:
+                session.is_dirty = True
+            raise
+
+        return len(rows)
+
     async def sync_with_db(self):
-        async with db_session.create_session() as db_sess:
-            for session in self.values():
-                # noinspection PyTypeChecker
-                query = select(DBUser).where(DBUser.id == session.dbuser_id)
-                dbuser = (await db_sess.execute(query)).scalar()
-                dbuser.current_menu_id = session.current_menu_id
-                dbuser.previous_menu_id = session.previous_menu_id
-                dbuser.language = session.lang_code
-                dbuser.last_bot_pm_id = session.last_bot_pm_id
-
-            logging.info(f'UserSessions synced with db! {len(self)} sessions were synced.')
-            await db_sess.commit()
+        synced = await self.flush(list(self.values()))
+        logging.info(f'UserSessions synced with db! {synced} of {len(self)} sessions were changed.')
 
     async def register_session(self, user: User, message: Message) -> UserSession:
         if user.id in self:
             return self[user.id]
 
-        logging.info(f'Registering session with user {user.id=}, {user.username=}, {user.language_code=}')
+        record = await self.directory.get(user.id) or self.directory.register(user, message)
+        self[user.id] = UserSession(record)
+        self._schedule_eviction()
+        return self[user.id]
 
-        async with db_session.create_session() as db_sess:
-            query = select(DBUser).where(DBUser.userid == user.id)
-            dbuser = (await db_sess.execute(query)).scalar()
-            if dbuser is None:
-                dbuser = DBUser(userid=user.id,
-                                language=user.language_code,
-                                last_bot_pm_id=message.id if message else None)
-                db_sess.add(dbuser)
-                await db_sess.commit()
-                logging.info(f'New record in db! {dbuser=}')
-            else:
-                logging.info(f'Got existing record in db. {dbuser=}')
+    def _schedule_eviction(self):
+        if (self.max_sessions is not None and len(self) > self.max_sessions
+                and (self._eviction is None or self._eviction.done())):
+            self._eviction = asyncio.create_task(self.evict())
 
-        self[user.id] = UserSession(dbuser)
+    async def evict(self):
+        """Drop the least recently used sessions down to ``EVICTION_LOW_WATER`` of ``max_sessions``."""
 
-        return self[user.id]
+        excess = len(self) - int(self.max_sessions * self.EVICTION_LOW_WATER)
+        if excess <= 0:
+            return
 
-    async def clear_timeout_sessions(self):
-        """Clear all sessions that exceed given timeout."""
+        try:
+            await self._drop(list(islice(self.items(), excess)))
+        except Exception:
+            logging.exception('Failed to evict sessions')
+            return
+        logging.info(f'Evicted least recently used sessions, {len(self)} are left')
 
-        now = dt.datetime.now()
+    def clear(self):
+        if self._eviction is not None:
+            self._eviction.cancel()
+        super().clear()
 
-        for _id, session in self.copy().items():
-            session_time = dt.datetime.fromtimestamp(session.timestamp)
-            if (now - session_time) > self.SESSIONS_LIFETIME:
-                await session.sync_with_db()
+    async def _drop(self, items: list[tuple[int, UserSession]]):
+        """Write the sessions to the db and remove them, unless they get used in the meantime."""
+
+        accessed = [session.timestamp for _, session in items]
+        await self.flush([session for _, session in items])
+
+        dropped = []
+        for (_id, session), timestamp in zip(items, accessed):
+            if self.get(_id) is session and session.timestamp == timestamp:
                 del self[_id]
+                dropped.append(session.to_row())
+        self.directory.update(dropped)
+
+    async def clear_timeout_sessions(self):
+        """Clear all sessions that exceed given timeout."""
+
+        expire_before = time.monotonic() - self.SESSIONS_LIFETIME.total_seconds()
+        await self._drop(list(takewhile(lambda item: item[1].timestamp < expire_before, self.items())))
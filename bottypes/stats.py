@@ -11,5 +11,5 @@ class BotRegularStats:
     def clear(self):
         self.callback_queries_handled = 0
         self.inline_queries_handled = 0
-        self.unique_users_served = set()
+        self.unique_users_served.clear()
         self.exceptions_caught = 0
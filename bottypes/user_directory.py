@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+import asyncio
+import datetime as dt
+import logging
+from typing import NamedTuple
+
+import numpy as np
+from pyrogram.types import Message, User
+from sqlalchemy import bindparam
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.future import select
+
+from db import db_session, User as DBUser
+from .columns import IntHashIndex, InternTable
+
+
+__all__ = ('UserDirectory', 'UserRecord', 'write_users')
+
+
+WRITE_BATCH_SIZE = 1000
+
+_INSERTS = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
+_compiled_writes = {}
+
+
+class UserRecord(NamedTuple):
+    """The part of a ``db.User`` row the sessions are made of. Field names are the column names."""
+
+    userid: int
+    current_menu_id: str | None
+    previous_menu_id: str | None
+    language: str | None
+    last_bot_pm_id: int | None
+
+
+def _compiled_write(dialect, overwrite: bool):
+    """Insert by ``userid``, which overwrites existing rows or leaves them be."""
+
+    key = (dialect.name, overwrite)
+    if (compiled := _compiled_writes.get(key)) is None:
+        table = DBUser.__table__
+        statement = (_INSERTS[dialect.name](table)
+                     .values({column: bindparam(column) for column in UserRecord._fields})
+                     .inline())  # no RETURNING of the ids
+        if overwrite:
+            statement = statement.on_conflict_do_update(
+                index_elements=[table.c.userid],
+                set_={column: statement.excluded[column] for column in UserRecord._fields[1:]})
+        else:
+            statement = statement.on_conflict_do_nothing(index_elements=[table.c.userid])
+        compiled = _compiled_writes[key] = statement.compile(dialect=dialect)
+    return compiled
+
+
+async def write_users(rows: list[dict], *, overwrite: bool = True):
+    """
+    Write rows of ``UserRecord`` fields with the driver's executemany through the db writer.
+
+    Rows are matched by ``userid``, so users whose insert is still queued are written all the same.
+    With ``overwrite=False`` rows of users who are already in the db are skipped.
+    """
+
+    async def write(db_sess):
+        conn = await db_sess.connection()
+        compiled = _compiled_write(conn.dialect, overwrite)
+        params = rows
+        if compiled.positional:
+            params = [tuple(row[name] for name in compiled.positiontup) for row in rows]
+
+        for i in range(0, len(params), WRITE_BATCH_SIZE):
+            await conn.exec_driver_sql(str(compiled), params[i:i + WRITE_BATCH_SIZE])
+
+    await db_session.write(write)
+
+
+class UserDirectory:
+    """
+    Every known user by their id, so that first contacts don't query the db.
+
+    Users are rows of typed columns found by an ``IntHashIndex`` of their ids, with menu ids and languages
+    interned (the tables are shared with ``CompactSessionTable``) and a missing message id stored as 0.
+    ``load`` reads the users table in chunks, users asked for before it's done are selected one by one.
+    New users are inserted by a background task in batches, ``WRITE_DELAY`` after the first of them registers.
+    """
+
+    LOAD_CHUNK_SIZE = 10000
+    WRITE_DELAY = dt.timedelta(seconds=5)
+    COLUMNS = {'current_menu': np.int16,
+               'previous_menu': np.int16,
+               'lang': np.uint16,
+               'last_bot_pm_id': np.int32}
+    MIN_CAPACITY = 1024
+
+    def __init__(self):
+        self.index = IntHashIndex()  # user id: row
+        self.columns = {column: np.zeros(self.MIN_CAPACITY, dtype) for column, dtype in self.COLUMNS.items()}
+        self._len = 0
+        self.menu_ids = InternTable([None])
+        self.lang_codes = InternTable()
+
+        self._pending: set[int] = set()  # ids of users yet to be inserted
+        self._writer: asyncio.Task | None = None
+        self.is_loaded = False
+
+    def __len__(self):
+        return self._len
+
+    def __contains__(self, user_id: int):
+        return user_id in self.index
+
+    def _record(self, user_id: int, row: int) -> UserRecord:
+        columns = self.columns
+        return UserRecord(user_id,
+                          self.menu_ids[columns['current_menu'].item(row)],
+                          self.menu_ids[columns['previous_menu'].item(row)],
+                          self.lang_codes[columns['lang'].item(row)],
+                          columns['last_bot_pm_id'].item(row) or None)
+
+    def store(self, records, *, overwrite: bool = True):
+        """Add the users or, with ``overwrite``, update the ones already known."""
+
+        rows, values = [], []
+        for record in records:
+            if (row := self.index.get(record.userid)) is None:
+                if self._len == len(self.columns['lang']):
+                    self.columns = {column: np.resize(values, len(values) * 2)
+                                    for column, values in self.columns.items()}
+                row = self.index[record.userid] = self._len
+                self._len += 1
+            elif not overwrite:
+                continue
+            rows.append(row)
+            values.append((self.menu_ids.index(record.current_menu_id),
+                           self.menu_ids.index(record.previous_menu_id),
+                           self.lang_codes.index(record.language),
+                           record.last_bot_pm_id or 0))
+
+        if rows:
+            for values, column in zip(zip(*values), self.COLUMNS):
+                self.columns[column][rows] = values
+
+    async def load(self):
+        """Read all users, a chunk per transaction so writers aren't held up."""
+
+        columns = [DBUser.__table__.c[field] for field in UserRecord._fields]
+        last_id = 0
+        while True:
+            async with db_session.create_session() as db_sess:
+                query = (select(DBUser.id, *columns)
+                         .where(DBUser.id > last_id)
+                         .order_by(DBUser.id)
+                         .limit(self.LOAD_CHUNK_SIZE))
+                rows = (await db_sess.execute(query)).all()
+
+            # what's in memory is never older
+            self.store((UserRecord(*fields) for _id, *fields in rows), overwrite=False)
+            if len(rows) < self.LOAD_CHUNK_SIZE:
+                break
+            last_id = rows[-1].id
+
+        self.is_loaded = True
+        logging.info(f'User directory loaded, {len(self)} users')
+
+    async def get(self, user_id: int) -> UserRecord | None:
+        if (row := self.index.get(user_id)) is not None:
+            return self._record(user_id, row)
+        if self.is_loaded:
+            return None
+
+        columns = [DBUser.__table__.c[field] for field in UserRecord._fields]
+        async with db_session.create_session() as db_sess:
+            row = (await db_sess.execute(select(*columns).where(DBUser.userid == user_id))).first()
+        if row is None:
+            return None
+        self.store([UserRecord(*row)], overwrite=False)
+        return self._record(user_id, self.index[user_id])
+
+    @property
+    def nbytes(self) -> int:
+        return sum(values.nbytes for values in self.columns.values()) + self.index.nbytes
+
+    def register(self, user: User, message: Message | None) -> UserRecord:
+        """Add a new user, who gets inserted into the db by the background writer."""
+
+        record = UserRecord(user.id, None, None, user.language_code, message.id if message else None)
+        self.store([record])
+        self._pending.add(user.id)
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write_behind())
+
+        logging.info(f'New user {user.id=}, {user.username=}, {user.language_code=}')
+        return record
+
+    def update(self, rows: list[dict]):
+        """Keep the records of users whose sessions are dropped up to date, from ``write_users`` rows."""
+
+        self.store(UserRecord(**row) for row in rows)
+
+    async def write_pending(self) -> int:
+        """Insert the queued new users, returns their number."""
+
+        user_ids, self._pending = self._pending, set()
+        if not user_ids:
+            return 0
+
+        try:
+            await write_users([self._record(user_id, self.index[user_id])._asdict() for user_id in user_ids],
+                              overwrite=False)
+        except BaseException:
+            self._pending |= user_ids
+            raise
+
+        logging.info(f'Inserted {len(user_ids)} new users')
+        return len(user_ids)
+
+    async def _write_behind(self):
+        while self._pending:
+            await asyncio.sleep(self.WRITE_DELAY.total_seconds())
+            try:
+                await self.write_pending()
+            except Exception:
+                logging.exception('Failed to insert new users, retrying later')
@@ -1,7 +1,9 @@
 import asyncio
 import datetime as dt
 import logging
+from pathlib import Path
 import platform
+import time
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 import pandas as pd
@@ -14,11 +16,16 @@ if platform.system() == 'Linux':
 
 import config
 from functions import caching, utime
+from functions.jobs import AdaptiveInterval, JobRunner
 from l10n import locale
 from utypes import (ExchangeRate, DatacenterAtlas, Datacenter,
                     DatacenterRegion, DatacenterGroup, GameServers,
                     LeaderboardStats, State, SteamWebAPI,
-                    LEADERBOARD_API_REGIONS)
+                    is_maintenance_window, LEADERBOARD_API_REGIONS)
+from utypes.http_cache import HTTPCache
+from utypes.leaderboard_history import LeaderboardHistory
+from utypes.leaderboard_store import LeaderboardStore
+from utypes.transport import RetryPolicy
 
 
 DATACENTER_API_FIELDS = {
@@ -74,6 +81,12 @@ DEPRECATED_FIELDS = ['csgo_client_version',
 
 UNKNOWN_DC_STATE = {"capacity": "unknown", "load": "unknown"}
 
+LEADERBOARD_CONCURRENCY = 8  # the world board and every regional one at once
+LEADERBOARD_CACHED_TOP = 10
+
+VOLATILE_FIELDS = ('sessions_logon_state', 'matchmaking_scheduler_state', 'steam_community_state',
+                   'online_servers', 'online_players', 'searching_players', 'datacenters')
+
 
 execution_start_dt = dt.datetime.now()
 
@@ -90,6 +103,7 @@ logging.basicConfig(level=logging.INFO,
                     datefmt="%H:%M:%S — %d/%m/%Y")
 
 scheduler = AsyncIOScheduler()
+jobs = JobRunner(scheduler)
 bot = Client(config.BOT_CORE_MODULE_NAME,
              api_id=config.API_ID,
              api_hash=config.API_HASH,
@@ -97,7 +111,16 @@ bot = Client(config.BOT_CORE_MODULE_NAME,
              test_mode=config.TEST_MODE,
              no_updates=True,
              workdir=config.SESS_FOLDER)
-steam_webapi = SteamWebAPI(config.STEAM_API_KEY, headers=config.REQUESTS_HEADERS)
+http_cache = HTTPCache(getattr(config, 'HTTP_CACHE_FOLDER', Path(config.SESS_FOLDER) / 'http_cache'))
+leaderboard_store_path = getattr(config, 'LEADERBOARD_STORE_FILE_PATH',
+                                 Path(config.CORE_CACHE_FILE_PATH).with_name('leaderboard_store.npz'))
+leaderboard_history_path = getattr(config, 'LEADERBOARD_HISTORY_FILE_PATH',
+                                   Path(config.CORE_CACHE_FILE_PATH).with_name('leaderboard_history.npz'))
+steam_webapi = SteamWebAPI(getattr(config, 'STEAM_API_KEYS', None) or config.STEAM_API_KEY,
+                           lane='collectors', headers=config.REQUESTS_HEADERS, cache=http_cache)
+
+# GetGameServersStatus is refreshed by Steam about every minute, its timestamp tells when exactly
+poll_cadence = AdaptiveInterval(40, min_interval=10, max_interval=2 * 60, urgent_interval=15)
 
 MEOW_MEOW_MEOW_IN_A_ROW = 0
 
@@ -133,6 +156,24 @@ def remap_dc_group(info: dict, group: DatacenterGroup):
     return result
 
 
+def volatility(old_cache: dict, new_cache: dict) -> float:
+    """Share of ``VOLATILE_FIELDS`` that changed."""
+
+    changed = sum(old_cache.get(field) != new_cache.get(field) for field in VOLATILE_FIELDS)
+    return changed / len(VOLATILE_FIELDS)
+
+
+def save_leaderboards(boards: dict[str, list[LeaderboardStats]], generation: int):
+    previous = LeaderboardStore.cached(leaderboard_store_path)
+    store = LeaderboardStore.from_stats(boards, generation, previous=previous)
+    store.save(leaderboard_store_path)
+
+    history = LeaderboardHistory.load(leaderboard_history_path)
+    added = history.append(store)
+    history.save(leaderboard_history_path)
+    logging.info(f'Saved leaderboards generation {generation}, {added} new history records ({len(history)} total)')
+
+
 def remap_datacenters_info(info: dict) -> dict:
     dcs = DatacenterAtlas.available_dcs()
     
@@ -151,110 +192,109 @@ def remap_datacenters_info(info: dict) -> dict:
     return remapped_info
 
 
-@scheduler.scheduled_job('interval', seconds=40)
+# the next run is close anyway; the interval is only a fallback, every run reschedules the next one
+@jobs.scheduled_job('interval', seconds=poll_cadence.max_interval, retry=RetryPolicy(attempts=1),
+                    next_run_time=dt.datetime.now())
 async def update_cache_info():
-    # noinspection PyBroadException
-    try:
-        cache = caching.load_cache(config.CORE_CACHE_FILE_PATH)
+    cache = caching.load_cache(config.CORE_CACHE_FILE_PATH)
+    old_cache = cache.copy()
 
-        clear_from_deprecated_fields(cache)  # todo: I guess we can already delete that one?
+    clear_from_deprecated_fields(cache)  # todo: I guess we can already delete that one?
 
-        game_servers_data = GameServers.request(steam_webapi)
+    game_servers_data = await asyncio.to_thread(GameServers.request, steam_webapi)
+    if game_servers_data.api_timestamp == old_cache.get('api_timestamp'):  # Steam hasn't updated it yet
+        jobs.reschedule('update_cache_info', poll_cadence.update(game_servers_data.api_timestamp,
+                                                                 urgent=is_maintenance_window()))
+        return
 
-        for key, value in game_servers_data.asdict().items():
-            if key == 'datacenters':
-                continue
-            if isinstance(value, State):
-                value = value.literal
-            cache[key] = value
+    for key, value in game_servers_data.asdict().items():
+        if key == 'datacenters':
+            continue
+        if isinstance(value, State):
+            value = value.literal
+        cache[key] = value
 
-        cache['datacenters'] = remap_datacenters_info(game_servers_data.datacenters)
+    cache['datacenters'] = remap_datacenters_info(game_servers_data.datacenters)
 
-        if cache.get('online_players', 0) > cache.get('player_alltime_peak', 1):
-            if scheduler.get_job('players_peak') is None:
-                # to collect new peak for 15 minutes and then post the highest one
-                scheduler.add_job(alert_players_peak, id='players_peak',
-                                  next_run_time=dt.datetime.now() + dt.timedelta(minutes=15), coalesce=True)
-            cache['player_alltime_peak'] = cache['online_players']
+    if cache.get('online_players', 0) > cache.get('player_alltime_peak', 1):
+        if scheduler.get_job('players_peak') is None:
+            # to collect new peak for 15 minutes and then post the highest one
+            jobs.add_job(alert_players_peak, 'date', id='players_peak',
+                         run_date=dt.datetime.now() + dt.timedelta(minutes=15))
+        cache['player_alltime_peak'] = cache['online_players']
 
-        df = pd.read_csv(config.PLAYER_CHART_FILE_PATH, parse_dates=['DateTime'])
-        now = utime.utcnow()
-        end_date = f'{now:%Y-%m-%d %H:%M:%S}'
-        start_date = f'{(now - dt.timedelta(days=1)):%Y-%m-%d %H:%M:%S}'
-        mask = (df['DateTime'] > start_date) & (df['DateTime'] <= end_date)
-        player_24h_peak = int(df.loc[mask]['Players'].max())
+    df = pd.read_csv(config.PLAYER_CHART_FILE_PATH, parse_dates=['DateTime'])
+    now = utime.utcnow()
+    end_date = f'{now:%Y-%m-%d %H:%M:%S}'
+    start_date = f'{(now - dt.timedelta(days=1)):%Y-%m-%d %H:%M:%S}'
+    mask = (df['DateTime'] > start_date) & (df['DateTime'] <= end_date)
+    player_24h_peak = int(df.loc[mask]['Players'].max())
 
-        cache['player_24h_peak'] = player_24h_peak
+    cache['player_24h_peak'] = player_24h_peak
 
+    if cache != old_cache:
         caching.dump_cache(config.CORE_CACHE_FILE_PATH, cache)
-    except Exception:
-        logging.exception('Caught exception in the main thread!')
 
-        
-@scheduler.scheduled_job('cron', hour=execution_cron_hour, minute=execution_cron_minute)
+    jobs.reschedule('update_cache_info', poll_cadence.update(game_servers_data.api_timestamp,
+                                                             volatility=volatility(old_cache, cache),
+                                                             urgent=is_maintenance_window()))
+
+
+@jobs.scheduled_job('cron', hour=execution_cron_hour, minute=execution_cron_minute)
 async def unique_monthly():
-    # noinspection PyBroadException
-    try:
-        data = steam_webapi.csgo_get_monthly_player_count()
+    data = await asyncio.to_thread(steam_webapi.csgo_get_monthly_player_count)
 
-        cache = caching.load_cache(config.CORE_CACHE_FILE_PATH)
+    cache = caching.load_cache(config.CORE_CACHE_FILE_PATH)
 
-        if cache.get('monthly_unique_players') is None:
-            cache['monthly_unique_players'] = data
+    if cache.get('monthly_unique_players') is None:
+        cache['monthly_unique_players'] = data
 
-        if data != cache['monthly_unique_players']:
-            await send_alert('monthly_unique_players',
-                             (cache['monthly_unique_players'], data))
-            cache['monthly_unique_players'] = data
+    if data != cache['monthly_unique_players']:
+        await send_alert('monthly_unique_players',
+                         (cache['monthly_unique_players'], data))
+        cache['monthly_unique_players'] = data
 
-        caching.dump_cache(config.CORE_CACHE_FILE_PATH, cache)
-    except Exception:
-        logging.exception('Caught exception while gathering monthly players!')
-        await asyncio.sleep(45)
-        return await unique_monthly()
+    caching.dump_cache(config.CORE_CACHE_FILE_PATH, cache)
 
 
-@scheduler.scheduled_job('cron', hour=execution_cron_hour, minute=execution_cron_minute, second=15)
+@jobs.scheduled_job('cron', hour=execution_cron_hour, minute=execution_cron_minute, second=15)
 async def check_currency():
-    # noinspection PyBroadException
-    try:
-        new_prices = ExchangeRate.request(steam_webapi).asdict()
+    new_prices = (await asyncio.to_thread(ExchangeRate.request, steam_webapi)).asdict()
 
-        caching.dump_cache_changes(config.CORE_CACHE_FILE_PATH, {'key_price': new_prices})
-    except Exception:
-        logging.exception('Caught exception while gathering key price!')
-        await asyncio.sleep(45)
-        return await check_currency()
+    caching.dump_cache_changes(config.CORE_CACHE_FILE_PATH, {'key_price': new_prices})
 
 
-@scheduler.scheduled_job('cron', hour=execution_cron_hour, minute=execution_cron_minute, second=30)
+@jobs.scheduled_job('cron', hour=execution_cron_hour, minute=execution_cron_minute, second=30)
 async def fetch_leaderboard():
-    # noinspection PyBroadException
-    try:
-        world_leaderboard_stats = LeaderboardStats.request_world(steam_webapi.session)
-        new_data = {'world_leaderboard_stats': world_leaderboard_stats}
+    semaphore = asyncio.BoundedSemaphore(LEADERBOARD_CONCURRENCY)
+
+    async def fetch(request, *args):
+        async with semaphore:  # requesting and decoding happen in a worker thread
+            return await asyncio.to_thread(request, steam_webapi.session, *args, http_cache)
+
+    # if any board fails, none are saved, so the cache never mixes boards from different fetches
+    world_leaderboard_stats, *regional_leaderboards_stats = await asyncio.gather(
+        fetch(LeaderboardStats.request_world),
+        *(fetch(LeaderboardStats.request_regional, region) for region in LEADERBOARD_API_REGIONS)
+    )
+    generation = int(time.time())
 
-        for region in LEADERBOARD_API_REGIONS:
-            regional_leaderboard_stats = LeaderboardStats.request_regional(steam_webapi.session, region)
-            new_data[f'regional_leaderboard_stats_{region}'] = regional_leaderboard_stats
+    # full boards go to the store, the top is also kept in the cache for the leaderboard menu
+    boards = {'world': world_leaderboard_stats} | dict(zip(LEADERBOARD_API_REGIONS, regional_leaderboards_stats))
+    await asyncio.to_thread(save_leaderboards, boards, generation)
 
-        caching.dump_cache_changes(config.CORE_CACHE_FILE_PATH, new_data)
-    except Exception:
-        logging.exception('Caught exception fetching leaderboards!')
-        await asyncio.sleep(45)
-        return await fetch_leaderboard()
+    new_data = {'leaderboard_generation': generation}
+    for board, stats in boards.items():
+        key = 'world_leaderboard_stats' if board == 'world' else f'regional_leaderboard_stats_{board}'
+        new_data[key] = [person.asdict() for person in stats[:LEADERBOARD_CACHED_TOP]]
+
+    caching.dump_cache_changes(config.CORE_CACHE_FILE_PATH, new_data)
 
 
 async def alert_players_peak():
-    # noinspection PyBroadException
-    try:
-        cache = caching.load_cache(config.CORE_CACHE_FILE_PATH)
+    cache = caching.load_cache(config.CORE_CACHE_FILE_PATH)
 
-        await send_alert('online_players', cache['player_alltime_peak'])
-    except Exception:
-        logging.exception('Caught exception while alerting players peak!')
-        await asyncio.sleep(45)
-        return await alert_players_peak()
+    await send_alert('online_players', cache['player_alltime_peak'])
 
 
 async def send_alert(key, new_value):
@@ -279,6 +319,8 @@ async def send_alert(key, new_value):
 
 def main():
     try:
+        scheduler.add_job(jobs.log_metrics, 'interval', hours=6)
+        scheduler.add_job(http_cache.log_stats, 'interval', hours=6)
         scheduler.start()
         bot.run()
     except TypeError:  # catching TypeError because Pyrogram propogates it at stop for some reason
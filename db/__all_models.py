@@ -1 +1 @@
-from . import users
+from . import stats_history, users, watchlist
@@ -1 +1,5 @@
+from . import stats_history, users, watchlist
+from .backends import backend_for, PostgresBackend, SQLiteBackend, StorageBackend
+from .stats_history import StatsSnapshot
 from .users import User
+from .watchlist import BanState, WatchedProfile
@@ -0,0 +1,101 @@
+from pathlib import Path
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url, URL
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+
+__all__ = ('backend_for', 'PostgresBackend', 'SQLiteBackend', 'StorageBackend')
+
+
+class StorageBackend:
+    """
+    How to connect to one kind of db. URLs without a driver get the backend's async one.
+
+    Everything above the engine is shared, so the backends only differ in engine options and connection setup.
+    """
+
+    DRIVER: str
+
+    def __init__(self, url: str | URL):
+        url = make_url(url)
+        if url.drivername == url.get_backend_name():
+            url = url.set(drivername=f'{url.drivername}+{self.DRIVER}')
+        self.url = url
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.url.render_as_string(hide_password=True)!r})'
+
+    def engine_options(self) -> dict:
+        return {}
+
+    def setup(self, engine: AsyncEngine):
+        """Hook up per-connection setup."""
+
+    def create_engine(self) -> AsyncEngine:
+        engine = create_async_engine(self.url, echo=False, **self.engine_options())
+        self.setup(engine)
+        return engine
+
+
+class SQLiteBackend(StorageBackend):
+    """A single file, WAL lets readers run alongside the writer."""
+
+    DRIVER = 'aiosqlite'
+    # with WAL, NORMAL only syncs on checkpoints
+    PRAGMAS = {'journal_mode': 'WAL',
+               'synchronous': 'NORMAL',
+               'mmap_size': 256 * 2 ** 20,
+               'cache_size': -64 * 2 ** 10,  # KiB
+               'busy_timeout': 5000}  # ms
+
+    def __init__(self, url: str | URL, *, pragmas: dict = None):
+        super().__init__(url)
+        self.pragmas = self.PRAGMAS if pragmas is None else pragmas
+
+    @classmethod
+    def from_file(cls, db_file: Path, *, pragmas: dict = None):
+        return cls(f'sqlite:///{db_file}?check_same_thread=False', pragmas=pragmas)
+
+    def setup(self, engine: AsyncEngine):
+        @event.listens_for(engine.sync_engine, 'connect')
+        def on_connect(dbapi_connection, _):
+            dbapi_connection.isolation_level = None  # transactions are begun below, so savepoints work
+            for name, value in self.pragmas.items():
+                dbapi_connection.execute(f'PRAGMA {name}={value}')
+
+        @event.listens_for(engine.sync_engine, 'begin')
+        def on_begin(conn):
+            conn.exec_driver_sql('BEGIN')
+
+
+class PostgresBackend(StorageBackend):
+    """A server, for when the tables outgrow a single file. Connections are pooled and checked before use."""
+
+    DRIVER = 'asyncpg'
+    POOL_SIZE = 10
+    MAX_OVERFLOW = 10
+    POOL_RECYCLE = 3600  # s
+
+    def engine_options(self) -> dict:
+        return {'pool_size': self.POOL_SIZE,
+                'max_overflow': self.MAX_OVERFLOW,
+                'pool_recycle': self.POOL_RECYCLE,
+                'pool_pre_ping': True}
+
+
+_BACKENDS = {'sqlite': SQLiteBackend, 'postgresql': PostgresBackend}
+
+
+def backend_for(database: Path | str | StorageBackend) -> StorageBackend:
+    """The backend for a db url, anything else is taken for a path to an SQLite file."""
+
+    if isinstance(database, StorageBackend):
+        return database
+    if '://' not in str(database):
+        return SQLiteBackend.from_file(database)
+
+    url = make_url(database)
+    if (backend := _BACKENDS.get(url.get_backend_name())) is None:
+        raise ValueError(f'Unsupported database: {url.get_backend_name()}')
+    return backend(url)
@@ -1,36 +1,110 @@
+import asyncio
 import logging
 from pathlib import Path
+from typing import Awaitable, Callable, TypeVar
 
 from sqlalchemy.orm import DeclarativeBase, Session
-from sqlalchemy.ext.asyncio import AsyncAttrs, async_sessionmaker, create_async_engine
+from sqlalchemy.ext.asyncio import AsyncAttrs, AsyncEngine, AsyncSession, async_sessionmaker
+
+from .backends import backend_for, StorageBackend
+
+
+T = TypeVar('T')
 
 
 class SqlAlchemyBase(AsyncAttrs, DeclarativeBase):
     pass
 
 
+WRITE_BATCH_SIZE = 100  # writes per commit
+
+_engine: AsyncEngine | None = None
 _factory: async_sessionmaker | None = None
+_writes: asyncio.Queue | None = None
+_writer: asyncio.Task | None = None
+
 
+async def init(database: Path | str | StorageBackend):
+    """Connect to a db url or an SQLite file, see ``backend_for``, and create missing tables."""
 
-async def init(db_file: Path):
-    global _factory
+    global _engine, _factory
 
     if _factory:
         return
 
-    conn_str = f'sqlite+aiosqlite:///{db_file}?check_same_thread=False'
-    logging.info(f'Connecting to database in {conn_str}')
+    backend = backend_for(database)
+    logging.info(f'Connecting to database with {backend}')
 
-    engine = create_async_engine(conn_str, echo=False)
+    _engine = backend.create_engine()
 
     # noinspection PyUnresolvedReferences
     from . import __all_models
 
-    async with engine.begin() as conn:
+    async with _engine.begin() as conn:
         await conn.run_sync(SqlAlchemyBase.metadata.create_all)
 
-    _factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+    _factory = async_sessionmaker(bind=_engine, expire_on_commit=False)
+
+
+async def close():
+    """Wait for the queued writes and close all connections."""
+
+    global _engine, _factory, _writes, _writer
+
+    if _writes is not None:
+        await _writes.join()
+        _writer.cancel()
+    if _engine is not None:
+        await _engine.dispose()
+    _engine = _factory = _writes = _writer = None
 
 
 def create_session() -> Session:
     return _factory()
+
+
+async def write(job: Callable[[AsyncSession], Awaitable[T]]) -> T:
+    """
+    Run ``job`` in the writer, which commits the writes queued together at once.
+
+    Jobs get a session to write with and mustn't commit it themselves. Every job runs in a savepoint,
+    so one that raises only rolls back its own changes, and the exception is raised here.
+    """
+
+    global _writes, _writer
+
+    if _writer is None or _writer.done():
+        _writes = asyncio.Queue()
+        _writer = asyncio.create_task(_write_batches(_writes))
+
+    future = asyncio.get_running_loop().create_future()
+    _writes.put_nowait((job, future))
+    return await future
+
+
+async def _write_batches(writes: asyncio.Queue):
+    while True:
+        batch = [await writes.get()]
+        while len(batch) < WRITE_BATCH_SIZE and not writes.empty():
+            batch.append(writes.get_nowait())
+
+        results = []
+        try:
+            async with _factory() as db_sess:
+                for job, future in batch:
+                    try:
+                        async with db_sess.begin_nested():
+                            results.append((future, await job(db_sess), None))
+                    except Exception as e:
+                        results.append((future, None, e))
+                await db_sess.commit()
+        except Exception as e:
+            results = [(future, None, e) for _, future in batch]
+
+        for future, result, exc in results:
+            if not future.done():  # unless the caller got cancelled
+                if exc is not None:
+                    future.set_exception(exc)
+                else:
+                    future.set_result(result)
+            writes.task_done()
@@ -0,0 +1,18 @@
+import sqlalchemy as sa
+from sqlalchemy_serializer import SerializerMixin
+
+from .db_session import SqlAlchemyBase
+
+
+class StatsSnapshot(SqlAlchemyBase, SerializerMixin):
+    __tablename__ = 'stats_snapshots'
+
+    id = sa.Column(sa.Integer, primary_key=True, autoincrement=True)
+    steamid = sa.Column(sa.BigInteger, index=True, nullable=False)
+    taken_at = sa.Column(sa.Integer, nullable=False)
+    is_keyframe = sa.Column(sa.Boolean, nullable=False)
+    data = sa.Column(sa.LargeBinary, nullable=False)
+
+    def __repr__(self):
+        return (f'<StatsSnapshot(id={self.id}, steamid={self.steamid}, taken_at={self.taken_at}, '
+                f'is_keyframe={self.is_keyframe}, size={len(self.data)})>')
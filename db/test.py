@@ -0,0 +1,111 @@
+import asyncio
+import os
+
+from pyrogram.types import User
+import pytest
+from sqlalchemy.future import select
+
+from bottypes.user_directory import UserDirectory, UserRecord, write_users
+from db import backend_for, db_session, User as DBUser
+from db.db_session import SqlAlchemyBase
+
+
+@pytest.fixture(params=['sqlite', 'postgresql'])
+def database(request, tmp_path):
+    """
+    Every test runs against both backends. PostgreSQL needs an empty db given in ``TEST_POSTGRES_URL``.
+    """
+
+    if request.param == 'sqlite':
+        return tmp_path / 'users.db'
+
+    url = os.environ.get('TEST_POSTGRES_URL')
+    if url is None:
+        pytest.skip('TEST_POSTGRES_URL is not set')
+    return url
+
+
+def run(database, test):
+    async def inner():
+        await db_session.init(backend_for(database))
+        try:
+            await test()
+        finally:
+            async with db_session.create_session() as db_sess:
+                await (await db_sess.connection()).run_sync(SqlAlchemyBase.metadata.drop_all)
+                await db_sess.commit()
+            await db_session.close()
+
+    asyncio.run(inner())
+
+
+async def stored_users() -> list[UserRecord]:
+    columns = [DBUser.__table__.c[field] for field in UserRecord._fields]
+    async with db_session.create_session() as db_sess:
+        return [UserRecord(*row) for row in await db_sess.execute(select(*columns).order_by(DBUser.userid))]
+
+
+def test_write_users(database):
+    """
+    Test to check that users are upserted by their ids, which don't fit into 32 bits.
+    """
+
+    async def test():
+        records = [UserRecord(6_000_000_000 + i, 'main', None, 'en', i) for i in range(3)]
+        await write_users([record._asdict() for record in records])
+        assert await stored_users() == records
+
+        changed = records[0]._replace(current_menu_id='settings', language='uk')
+        await write_users([changed._asdict()])
+        assert await stored_users() == [changed, *records[1:]]
+
+        await write_users([records[0]._asdict()], overwrite=False)
+        assert await stored_users() == [changed, *records[1:]]
+
+    run(database, test)
+
+
+def test_writer(database):
+    """
+    Test to check that a failing write is rolled back alone when writes are committed together.
+    """
+
+    async def test():
+        async def failing(db_sess):
+            db_sess.add(DBUser(userid=1, language='en'))
+            raise RuntimeError
+
+        async def succeeding(db_sess):
+            db_sess.add(DBUser(userid=2, language='en'))
+            return 2
+
+        results = await asyncio.gather(db_session.write(failing), db_session.write(succeeding),
+                                       return_exceptions=True)
+        assert isinstance(results[0], RuntimeError)
+        assert results[1] == 2
+        assert [record.userid for record in await stored_users()] == [2]
+
+    run(database, test)
+
+
+def test_user_directory(database):
+    """
+    Test to check that the directory loads every user and inserts the new ones.
+    """
+
+    async def test():
+        records = [UserRecord(i, None, None, 'en', None) for i in range(1, 26)]
+        await write_users([record._asdict() for record in records])
+
+        directory = UserDirectory()
+        directory.LOAD_CHUNK_SIZE = 10
+        await directory.load()
+        assert len(directory) == len(records)
+        assert await directory.get(5) == records[4]
+        assert await directory.get(100) is None
+
+        directory.register(User(id=100, username='new', language_code='uk'), None)
+        assert await directory.write_pending() == 1
+        assert (await stored_users())[-1] == UserRecord(100, None, None, 'uk', None)
+
+    run(database, test)
@@ -8,7 +8,7 @@ class User(SqlAlchemyBase, SerializerMixin):
     __tablename__ = 'users'
 
     id = sa.Column(sa.Integer, primary_key=True, autoincrement=True)
-    userid = sa.Column(sa.Integer, unique=True)
+    userid = sa.Column(sa.BigInteger, unique=True)
     current_menu_id = sa.Column(sa.String)
     previous_menu_id = sa.Column(sa.String)
     language = sa.Column(sa.String)
@@ -0,0 +1,29 @@
+import sqlalchemy as sa
+from sqlalchemy_serializer import SerializerMixin
+
+from .db_session import SqlAlchemyBase
+
+
+class WatchedProfile(SqlAlchemyBase, SerializerMixin):
+    __tablename__ = 'watchlist'
+    __table_args__ = (sa.UniqueConstraint('userid', 'steamid'),)
+
+    id = sa.Column(sa.Integer, primary_key=True, autoincrement=True)
+    userid = sa.Column(sa.BigInteger, index=True, nullable=False)
+    steamid = sa.Column(sa.BigInteger, index=True, nullable=False)
+
+    def __repr__(self):
+        return f'<WatchedProfile(id={self.id}, userid={self.userid}, steamid={self.steamid})>'
+
+
+class BanState(SqlAlchemyBase, SerializerMixin):
+    """Last known ban status of the watched profile, packed into a single integer."""
+
+    __tablename__ = 'ban_states'
+
+    steamid = sa.Column(sa.BigInteger, primary_key=True, autoincrement=False)
+    state = sa.Column(sa.Integer, nullable=False)
+    changed_at = sa.Column(sa.Integer)
+
+    def __repr__(self):
+        return f'<BanState(steamid={self.steamid}, state={self.state})>'
@@ -1,2 +1 @@
-from . import decorators, info_formatters
 from .locale import locale
@@ -1,5 +1,7 @@
 import json
+import os
 from pathlib import Path
+import tempfile
 from typing import Any
 
 
@@ -12,8 +14,18 @@ def load_cache(path: Path) -> dict[str, Any]:
 
 
 def dump_cache(path: Path, cache: dict[str, Any]):
-    with open(path, 'w', encoding='utf-8') as f:
-        json.dump(cache, f, indent=4, ensure_ascii=False)
+    """Replaces the file atomically, so readers get either the old or the new cache, but never a partial one."""
+
+    path = Path(path)
+    with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=path.parent,
+                                     prefix=f'.{path.name}.', suffix='.tmp', delete=False) as f:
+        try:
+            json.dump(cache, f, indent=4, ensure_ascii=False)
+        except BaseException:
+            f.close()
+            os.remove(f.name)
+            raise
+    os.replace(f.name, path)
 
 
 def dump_cache_changes(path: Path, changes: dict[str, Any]):
@@ -5,12 +5,18 @@ from zoneinfo import ZoneInfo
 
 from babel.dates import format_datetime as babel_format_datetime
 from jinja2 import Environment, FileSystemLoader
+import numpy as np
+from steam.steamid import SteamID
 
 from l10n import Locale
 from .locale import get_refined_lang_code
 from utypes import (DatacenterState, DatacenterRegionState, DatacenterGroupState,
                     DatacenterStateVariation, GameVersionData, ServerStatusData,
-                    MatchmakingStatsData, States, LeaderboardStats)
+                    MatchmakingStatsData, States, LeaderboardStats, ProfileInfo, StatsComparison)
+from utypes.leaderboard_analytics import LeaderboardAnalytics, RATING_TIERS, WIN_RATE_QUANTILES
+from utypes.leaderboard_store import LeaderboardRow
+from utypes.stats_history import StatsProgress
+from utypes.watchlist import BanChange
 
 
 MINUTE = 60
@@ -27,6 +33,7 @@ CLOCKS = ('🕛', '🕐', '🕑', '🕒', '🕓', '🕔',
 env = Environment(loader=FileSystemLoader(Path(__file__).parent.parent))
 game_stats_template = env.get_template('game_stats_template.html')
 
+STEAM_PROFILE_LINK = 'https://steamcommunity.com/profiles/{}'
 WEB_LEADERBOARD_LINK = 'https://csleaderboards.net/premier'
 WEB_LEADERBOARD_REGIONS = {'africa': 'af',
                            'asia': 'as',
@@ -182,7 +189,82 @@ def format_user_game_stats(stats, locale: Locale) -> str:
     return rendered_page.format(*stats)
 
 
-def format_game_world_leaderboard(data: list[LeaderboardStats], locale: Locale) -> str:
+COMPARISON_GENERAL_STATS = (
+    ('total_time_played', 'user_gamestats_playtime', '{:,.1f}'),
+    ('total_kills', 'user_gamestats_kills', '{:,.0f}'),
+    ('total_deaths', 'user_gamestats_deaths', '{:,.0f}'),
+    ('kd_ratio', 'user_gamestats_kd_ratio', '{:.2f}'),
+    ('total_matches_played', 'user_gamestats_matches_played', '{:,.0f}'),
+    ('matches_win_percentage', 'user_gamestats_win_percentage', '{:g}%'),
+    ('hit_accuracy', 'user_gamestats_aim_accuracy', '{:g}%'),
+    ('headshots_percentage', 'user_gamestats_hs_percentage', '{:g}%'),
+    ('total_mvps', 'user_gamestats_mvp_rewards', '{:,.0f}'),
+)
+COMPARISON_WEAPONS = {'ak47': 'AK-47', 'm4a1': 'M4A4 / M4A1-S', 'awp': 'AWP', 'glock': 'Glock-18',
+                      'hkp2000': 'USP-S / P2000', 'p250': 'P250', 'elite': 'Dual Berettas',
+                      'fiveseven': 'Five-SeveN', 'tec9': 'Tec-9', 'deagle': 'Desert Eagle',
+                      'mac10': 'MAC-10', 'mp7': 'MP7', 'mp9': 'MP9', 'ump45': 'UMP-45', 'bizon': 'PP-Bizon',
+                      'p90': 'P90', 'famas': 'FAMAS', 'galilar': 'Galil AR', 'aug': 'AUG', 'sg556': 'SG 553',
+                      'ssg08': 'SSG 08', 'scar20': 'SCAR-20', 'g3sg1': 'G3SG1', 'nova': 'Nova', 'mag7': 'MAG-7',
+                      'sawedoff': 'Sawed-Off', 'xm1014': 'XM1014', 'negev': 'Negev', 'm249': 'M249'}
+COMPARISON_WEAPONS_SHOWN = 8
+
+
+def format_user_game_stats_comparison(comparison: StatsComparison, locale: Locale) -> str:
+    def format_row(label: str, field: str, fmt: str):
+        values = (fmt.format(value) for value in comparison.column(field))
+        values = (f'**{value}**' if leads else value for value, leads in zip(values, comparison.leading(field)))
+        return f'• {label} {" | ".join(values)}\n'
+
+    players = ' | '.join(f'[{steamid}]({STEAM_PROFILE_LINK.format(steamid)})' for steamid in comparison.steamids)
+    text = f'{locale.user_gamestats_compare_header}\n{players}\n\n'
+
+    for field, label_key, fmt in COMPARISON_GENERAL_STATS:
+        text += format_row(locale.get(label_key), field, fmt)
+
+    # the most used weapons among all compared players
+    weapons = list(COMPARISON_WEAPONS)
+    weapon_kills = np.stack([comparison.column(f'total_kills_{weapon}') for weapon in weapons]).sum(axis=1)
+    top_weapons = [weapons[i] for i in np.argsort(-weapon_kills, kind='stable')[:COMPARISON_WEAPONS_SHOWN]
+                   if weapon_kills[i]]
+
+    if top_weapons:
+        text += f'\n**{locale.user_gamestats_gun_stats}**\n'
+    for weapon in top_weapons:
+        text += format_row(f'{COMPARISON_WEAPONS[weapon]}:', f'{weapon}_accuracy', '{:g}%')
+
+    return text
+
+
+def format_stats_progress(progress: StatsProgress, locale: Locale) -> str:
+    since = format_datetime(dt.datetime.fromtimestamp(progress.since, dt.timezone.utc), locale)
+    text = f'{locale.user_gamestats_progress_header.format(since)}\n'
+
+    for field, label_key, fmt in COMPARISON_GENERAL_STATS:
+        if change := progress.change(field):
+            text += f'• {locale.get(label_key)} {fmt.replace("{:", "{:+").format(change)}\n'
+
+    return text
+
+
+def format_leaderboard_movement(person: LeaderboardStats | LeaderboardRow) -> str:
+    """Rank and rating change since the previous leaderboard generation, like `▲3 (+125)`."""
+
+    rank_delta = getattr(person, 'rank_delta', 0)  # only the full leaderboards know it
+    if rank_delta is None:
+        return ' 🆕'
+
+    text = ''
+    if rank_delta > 0:
+        text += f' ▲{rank_delta}'
+    elif rank_delta < 0:
+        text += f' ▼{-rank_delta}'
+    if rating_delta := getattr(person, 'rating_delta', 0):
+        text += f' ({rating_delta:+,})'
+    return text
+
+
+def format_game_world_leaderboard(data: list[LeaderboardStats | LeaderboardRow], locale: Locale) -> str:
     text = f'{locale.game_leaderboard_header_world}\n\n'
     link_text = locale.game_leaderboard_detailed_link.format(WEB_LEADERBOARD_LINK)
 
@@ -190,18 +272,21 @@ def format_game_world_leaderboard(data: list[LeaderboardStats], locale: Locale)
         text += f'{locale.data_not_found}\n\n{link_text}'
         return text
 
+    rank_span = max(2, len(str(data[-1].rank)))
     for person in data:
         name = person.name.replace('`', r"'")  # escape for formatting
-        name_span_limit = 19
+        name_span_limit = 21 - rank_span
         if len(name) > name_span_limit:
             name = name[:name_span_limit - 2] + '...'
-        text += f'`{person.rank:2d}.` `{name:<{name_span_limit}}` `{person.rating:>6,}` `{person.region}`\n'
+        text += (f'`{person.rank:{rank_span}d}.` `{name:<{name_span_limit}}` `{person.rating:>6,}` `{person.region}`'
+                 f'{format_leaderboard_movement(person)}\n')
 
     text += f'\n{link_text}'
     return text
 
 
-def format_game_regional_leaderboard(region: str, data: list[LeaderboardStats], locale: Locale) -> str:
+def format_game_regional_leaderboard(region: str, data: list[LeaderboardStats | LeaderboardRow],
+                                     locale: Locale) -> str:
     text = f'{locale.game_leaderboard_header_regional}\n\n'
     link = WEB_LEADERBOARD_LINK + f'?lb={WEB_LEADERBOARD_REGIONS.get(region, region)}'
     link_text = locale.game_leaderboard_detailed_link.format(link)
@@ -210,12 +295,179 @@ def format_game_regional_leaderboard(region: str, data: list[LeaderboardStats],
         text += f'{locale.data_not_found}\n\n{link_text}'
         return text
 
+    rank_span = max(2, len(str(data[-1].rank)))
     for person in data:
         name = person.name.replace('`', r"'")  # escape for formatting
-        name_span_limit = 21
+        name_span_limit = 23 - rank_span
         if len(name) > name_span_limit:
             name = name[:name_span_limit - 2] + '...'
-        text += f'`{person.rank:2d}.` `{name:<{name_span_limit}}` `{person.rating:>6,}`\n'
+        text += (f'`{person.rank:{rank_span}d}.` `{name:<{name_span_limit}}` `{person.rating:>6,}`'
+                 f'{format_leaderboard_movement(person)}\n')
 
     text += f'\n{link_text}'
     return text
+
+
+def format_game_leaderboard_page(board: str, data: list[LeaderboardRow], page: int, pages_count: int,
+                                 locale: Locale) -> str:
+    if board == 'world':
+        text = format_game_world_leaderboard(data, locale)
+    else:
+        text = format_game_regional_leaderboard(board, data, locale)
+
+    return f'{text}\n\n{locale.game_leaderboard_page.format(page + 1, pages_count)}'
+
+
+RATING_TIERS_MARKS = ('⚪️', '🩵', '🔵', '🟣', '🩷', '🔴', '🟡')
+
+
+def format_leaderboard_analytics(analytics: LeaderboardAnalytics, locale: Locale) -> str:
+    def board_title(board: str) -> str:
+        return locale.game_leaderboard_world if board == 'world' else locale.get(f'regions_{board}')
+
+    text = f'{locale.game_leaderboard_analytics_header}\n\n'
+    if not analytics.map_wins and not analytics.rating_tiers:
+        return text + locale.data_not_found
+
+    if analytics.map_wins:
+        text += f'{locale.game_leaderboard_analytics_maps.format(analytics.top)}\n'
+        for map_name, share in sorted(analytics.map_wins.items(), key=lambda item: -item[1]):
+            bar = '█' * round(share * 40)
+            text += f'`{map_name.capitalize():<8}` `{share:>6.1%}` {bar}\n'
+        text += '\n'
+
+    if analytics.rating_tiers:
+        text += f'{locale.game_leaderboard_analytics_ratings}\n'
+        text += ' '.join(f'{mark} {tier // 1000}k+' for mark, tier in zip(RATING_TIERS_MARKS, RATING_TIERS)) + '\n'
+        for region, shares in analytics.rating_tiers.items():
+            tiers = ' '.join(f'{mark}{share:.0%}' for mark, share in zip(RATING_TIERS_MARKS, shares) if share >= 0.005)
+            text += f'• {board_title(region)}: {tiers}\n'
+        text += '\n'
+
+    if analytics.win_rates:
+        quantiles = ' / '.join(f'{quantile:.0%}' for quantile in WIN_RATE_QUANTILES)
+        text += f'{locale.game_leaderboard_analytics_win_rates.format(quantiles)}\n'
+        for board, win_rates in analytics.win_rates.items():
+            text += f'• {board_title(board)}: ' + ' / '.join(f'{win_rate:.1%}' for win_rate in win_rates) + '\n'
+
+    return text.rstrip()
+
+
+def format_leaderboard_search_row(row: LeaderboardRow, locale: Locale) -> str:
+    name = row.name.replace('`', "'")  # escape for formatting
+    name_span_limit = 16
+    if len(name) > name_span_limit:
+        name = name[:name_span_limit - 2] + '...'
+    board = locale.game_leaderboard_world if row.board == 'world' else locale.get(f'regions_{row.board}')
+    return (f'`{row.rank:4d}.` `{name:<{name_span_limit}}` `{row.rating:>6,}` {board}'
+            f'{format_leaderboard_movement(row)}\n')
+
+
+def format_leaderboard_search_lines(query: str, total: int, lines: list[str], locale: Locale) -> str:
+    """Search results out of rows already rendered with ``format_leaderboard_search_row``."""
+
+    query = query.replace('`', "'")
+    return f'{locale.game_leaderboard_search_header.format(query, total)}\n\n' + ''.join(lines)
+
+
+def format_leaderboard_search(query: str, total: int, rows: list[LeaderboardRow], locale: Locale) -> str:
+    return format_leaderboard_search_lines(query, total, [format_leaderboard_search_row(row, locale) for row in rows],
+                                           locale)
+
+
+def format_lobby_scan(profiles: list[ProfileInfo], locale: Locale) -> str:
+    text = f'{locale.user_lobbyscan_header.format(len(profiles))}\n\n'
+
+    for i, profile in enumerate(profiles, 1):
+        name = profile.persona_name.replace('`', "'")  # escape for formatting
+        name_span_limit = 16
+        if len(name) > name_span_limit:
+            name = name[:name_span_limit - 2] + '...'
+
+        is_banned = profile.vac_bans or profile.game_bans or profile.community_ban or profile.trade_ban
+        mark = '⛔️' if is_banned else '✅'
+
+        if profile.faceit_unavailable:
+            faceit = '?'
+        elif profile.faceit_lvl:
+            faceit = f'{profile.faceit_lvl} ({profile.faceit_elo})'
+        else:
+            faceit = '—'
+
+        text += (f'`{i:2d}.` `{name:<{name_span_limit}}` {mark} '
+                 f'VAC {profile.vac_bans} · GB {profile.game_bans} · FACEIT {faceit} '
+                 f'[↗]({STEAM_PROFILE_LINK.format(profile.steamid64)})\n')
+
+    return text
+
+
+def format_profile_card(profile: ProfileInfo, locale: Locale) -> str:
+    """Compact card for inline profile lookups."""
+
+    name = (profile.persona_name or str(profile.steamid64)).replace('`', "'")  # escape for formatting
+    text = f'👤 `{name}` [↗]({STEAM_PROFILE_LINK.format(profile.steamid64)})\n`{profile.steamid64}`\n\n'
+
+    if profile.account_created:
+        created = babel_format_datetime(dt.datetime.fromtimestamp(profile.account_created), 'dd MMM yyyy',
+                                        locale=get_refined_lang_code(locale)).title()
+    else:
+        created = locale.states_unknown
+    text += f'📅 {locale.user_profilecard_account_created.format(created)}\n'
+
+    is_banned = profile.vac_bans or profile.game_bans or profile.community_ban or profile.trade_ban
+    text += f'{"⛔️" if is_banned else "✅"} VAC {profile.vac_bans} · GB {profile.game_bans}'
+    if profile.community_ban or profile.trade_ban:
+        text += f' · {locale.user_profilecard_restricted}'
+    text += '\n'
+
+    if profile.faceit_unavailable:
+        faceit = locale.user_profileinfo_unavailable
+    elif profile.faceit_lvl:
+        faceit = f'{profile.faceit_lvl} ({profile.faceit_elo})'
+    else:
+        faceit = '—'
+    text += f'🎮 FACEIT {faceit}'
+    if profile.faceit_ban:
+        text += ' ⛔️'
+
+    return text
+
+
+def format_profile_card_pending(_id: SteamID | None, query: str, locale: Locale) -> str:
+    """What is known about the profile before it's looked up: only what is decoded from the SteamID, if anything."""
+
+    if _id is None:  # a vanity link, it's resolved by Steam
+        query = query.replace('`', "'")
+        return f'👤 `{query}`\n\n{locale.user_profilecard_loading}'
+
+    return (f'👤 [{_id.as_64}]({STEAM_PROFILE_LINK.format(_id.as_64)})\n'
+            f'`{_id.as_steam2}` · `{_id.as_steam3}`\n\n'
+            f'{locale.user_profilecard_loading}')
+
+
+def format_watchlist(steamids: list[int], locale: Locale) -> str:
+    if not steamids:
+        return locale.user_watchlist_empty
+
+    return '\n'.join(f'`{i:2d}.` [{steamid}]({STEAM_PROFILE_LINK.format(steamid)})'
+                     for i, steamid in enumerate(steamids, 1))
+
+
+def format_ban_change(change: BanChange, locale: Locale) -> str:
+    def format_count(old: int, new: int):
+        if old == new:
+            return new or locale.user_profileinfo_none
+        return f'{old} → **{new}**'
+
+    def format_flag(old: bool, new: bool):
+        text = locale.user_profileinfo_banned if new else locale.user_profileinfo_none
+        return text if old == new else f'**{text}**'
+
+    old, new = change.old, change.new
+    profile = f'[{change.steamid}]({STEAM_PROFILE_LINK.format(change.steamid)})'
+
+    return locale.user_watchlist_ban_changed.format(profile,
+                                                    format_count(old.game_bans, new.game_bans),
+                                                    format_count(old.vac_bans, new.vac_bans),
+                                                    format_flag(old.community_ban, new.community_ban),
+                                                    format_flag(old.trade_ban, new.trade_ban))
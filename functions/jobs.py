@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+import datetime as dt
+import inspect
+import logging
+import threading
+import time
+from typing import Callable
+
+from apscheduler.jobstores.base import JobLookupError
+from apscheduler.schedulers.base import BaseScheduler
+
+from utypes.transport import RetryPolicy
+
+
+__all__ = ('AdaptiveInterval', 'JobMetrics', 'JobRunner')
+
+
+MINUTE = 60
+
+
+class JobMetrics:
+    __slots__ = ('runs', 'failures', 'retries', 'skipped', 'total_duration', 'max_duration', 'last_duration')
+
+    def __init__(self):
+        self.runs = 0
+        self.failures = 0
+        self.retries = 0
+        self.skipped = 0  # because the previous run was still going
+        self.total_duration = 0.
+        self.max_duration = 0.
+        self.last_duration = 0.
+
+    def record(self, duration: float, ok: bool):
+        self.runs += 1
+        if not ok:
+            self.failures += 1
+        self.total_duration += duration
+        self.max_duration = max(self.max_duration, duration)
+        self.last_duration = duration
+
+    @property
+    def average_duration(self) -> float:
+        return self.total_duration / self.runs if self.runs else 0.
+
+
+class AdaptiveInterval:
+    """
+    Poll interval that follows how often the upstream data actually changes.
+
+    The upstream update period is estimated from the timestamps the upstream reports.
+    After an update the next poll is aimed right after the next expected one, while the timestamp
+    doesn't advance the interval backs off, and volatile data or an ``urgent`` period make it poll faster.
+    """
+
+    BACKOFF_FACTOR = 1.5
+    SMOOTHING = 0.3  # of the period estimate
+    SLACK = 2  # seconds to give the upstream after its expected update
+
+    def __init__(self, default: float, *, min_interval: float, max_interval: float, urgent_interval: float = None):
+        self.default = default
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.urgent_interval = urgent_interval or min_interval
+
+        self.interval = default
+        self.period: float | None = None
+        self._last_timestamp: float | None = None
+
+    def update(self, upstream_timestamp: float, *, volatility: float = 0., urgent: bool = False) -> float:
+        """
+        Get the delay before the next poll.
+
+        Args:
+            upstream_timestamp: When the upstream data was last updated, as reported by the upstream.
+            volatility: Share of the watched values that changed since the previous poll, from 0 to 1.
+            urgent: Poll at least every ``urgent_interval`` seconds.
+        """
+
+        if upstream_timestamp == self._last_timestamp:
+            delay = self.interval * self.BACKOFF_FACTOR
+        else:
+            if self._last_timestamp is not None and upstream_timestamp > self._last_timestamp:
+                observed = upstream_timestamp - self._last_timestamp
+                if self.period is None:
+                    self.period = observed
+                else:
+                    self.period += self.SMOOTHING * (observed - self.period)
+            self._last_timestamp = upstream_timestamp
+
+            if self.period is None:
+                delay = self.default
+            else:
+                delay = upstream_timestamp + self.period + self.SLACK - time.time()
+            delay *= 1 - volatility / 2
+
+        if urgent:
+            delay = min(delay, self.urgent_interval)
+
+        self.interval = min(max(delay, self.min_interval), self.max_interval)
+        return self.interval
+
+
+class JobRunner:
+    """
+    Runs jobs on an APScheduler scheduler with bounded retries and per-job metrics.
+
+    A failed job is retried as a one-off scheduled job after a backoff with jitter (see ``RetryPolicy``),
+    so neither the stack nor a scheduler thread is held while waiting. A job never overlaps with itself:
+    a run that starts while the previous one (or its retry) is still going is skipped.
+    Works with both sync and async jobs.
+    """
+
+    DEFAULT_RETRY = RetryPolicy(attempts=5, base_delay=45, max_delay=15 * MINUTE)
+
+    def __init__(self, scheduler: BaseScheduler, *, retry: RetryPolicy = None):
+        self.scheduler = scheduler
+        self.retry = retry or self.DEFAULT_RETRY
+        self.metrics: dict[str, JobMetrics] = {}
+
+        self._locks: dict[str, threading.Lock] = {}
+
+    def scheduled_job(self, trigger: str, *, id: str = None, retry: RetryPolicy = None, **trigger_args):
+        """Decorator version of ``add_job``, like ``scheduler.scheduled_job``."""
+
+        def decorator(func: Callable):
+            self.add_job(func, trigger, id=id, retry=retry, **trigger_args)
+            return func
+
+        return decorator
+
+    def add_job(self, func: Callable, trigger: str = None, *, id: str = None, retry: RetryPolicy = None,
+                args: tuple = (), kwargs: dict = None, **trigger_args):
+        job_id = id or func.__name__
+        retry = retry or self.retry
+
+        self.metrics.setdefault(job_id, JobMetrics())
+        self._locks.setdefault(job_id, threading.Lock())
+
+        run = self._wrap(func, job_id, retry, args, kwargs or {})
+        return self.scheduler.add_job(run, trigger, id=job_id, name=job_id, replace_existing=True, **trigger_args)
+
+    def _wrap(self, func: Callable, job_id: str, retry: RetryPolicy, args: tuple, kwargs: dict):
+        if inspect.iscoroutinefunction(func):
+            async def run(attempt: int = 1):
+                if not self._start(job_id):
+                    return
+
+                start = time.perf_counter()
+                try:
+                    await func(*args, **kwargs)
+                except Exception:
+                    self._failed(job_id, run, retry, attempt, time.perf_counter() - start)
+                else:
+                    self._succeeded(job_id, time.perf_counter() - start)
+                finally:
+                    self._locks[job_id].release()
+        else:
+            def run(attempt: int = 1):
+                if not self._start(job_id):
+                    return
+
+                start = time.perf_counter()
+                try:
+                    func(*args, **kwargs)
+                except Exception:
+                    self._failed(job_id, run, retry, attempt, time.perf_counter() - start)
+                else:
+                    self._succeeded(job_id, time.perf_counter() - start)
+                finally:
+                    self._locks[job_id].release()
+
+        return run
+
+    def _start(self, job_id: str) -> bool:
+        if self._locks[job_id].acquire(blocking=False):
+            return True
+
+        self.metrics[job_id].skipped += 1
+        logging.warning(f'Job {job_id} is still running, skipping this run')
+        return False
+
+    def _succeeded(self, job_id: str, duration: float):
+        self.metrics[job_id].record(duration, ok=True)
+
+        try:  # the regular run has made the pending retry useless
+            self.scheduler.remove_job(f'{job_id}:retry')
+        except JobLookupError:
+            pass
+
+    def _failed(self, job_id: str, run: Callable, retry: RetryPolicy, attempt: int, duration: float):
+        """Must be called from an ``except`` block."""
+
+        metrics = self.metrics[job_id]
+        metrics.record(duration, ok=False)
+
+        if attempt >= retry.attempts:
+            logging.exception(f'Job {job_id} failed after {attempt} attempts, waiting for the next run')
+            return
+
+        delay = retry.delay(attempt - 1)
+        logging.exception(f'Job {job_id} failed (attempt {attempt}/{retry.attempts}), retrying in {delay:.0f}s')
+
+        metrics.retries += 1
+        self.scheduler.add_job(run, 'date', id=f'{job_id}:retry', name=f'{job_id}:retry', replace_existing=True,
+                               run_date=dt.datetime.now() + dt.timedelta(seconds=delay),
+                               kwargs={'attempt': attempt + 1})
+
+    def reschedule(self, job_id: str, delay: float):
+        """Move the next run of the job to ``delay`` seconds from now."""
+
+        self.scheduler.modify_job(job_id, next_run_time=dt.datetime.now() + dt.timedelta(seconds=delay))
+
+    def log_metrics(self):
+        for job_id, metrics in self.metrics.items():
+            logging.info(f'Job {job_id}: {metrics.runs} runs, {metrics.failures} failed, '
+                         f'{metrics.retries} retried, {metrics.skipped} skipped, '
+                         f'{metrics.average_duration:.2f}s on average, {metrics.max_duration:.2f}s at most')
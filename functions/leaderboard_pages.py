@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import logging
+from pathlib import Path
+import time
+
+from l10n import Locale
+from utypes.leaderboard_analytics import LeaderboardAnalytics
+from utypes.leaderboard_store import LeaderboardStore
+from . import info_formatters
+from .locale import locale
+
+
+__all__ = ['LeaderboardPages']
+
+
+class LeaderboardPages:
+    """
+    Leaderboard page texts, rendered for every (board, page, locale) as soon as a new generation is saved.
+    The analytics page and the search result row of every player are rendered along with them.
+
+    Paging is then a dict lookup and a search only joins rendered rows.
+    Texts for locales that weren't rendered beforehand are rendered on demand.
+    """
+
+    PAGE_SIZE = 10
+    ANALYTICS_TOP = 100
+    SEARCH_LIMIT = 10
+
+    _shared: dict[Path, LeaderboardPages] = {}
+
+    def __init__(self, path: str | Path, lang_codes):
+        self.path = path
+        self.lang_codes = tuple(lang_codes)
+
+        self.generation: int | None = None
+        self._store = LeaderboardStore({})
+        self._pages: dict[tuple[str, int, str], str] = {}
+        self._pages_counts: dict[str, int] = {}
+        self._analytics: LeaderboardAnalytics | None = None
+        self._analytics_pages: dict[str, str] = {}
+        self._search_rows: dict[tuple[str, str], list[str]] = {}  # (board, lang code): rendered row of every player
+
+    @classmethod
+    def shared(cls, path: str | Path, lang_codes) -> LeaderboardPages:
+        """One instance per store file, so the bot's menus and inline queries use the same rendered texts."""
+
+        path = Path(path)
+        if path not in cls._shared:
+            cls._shared[path] = cls(path, lang_codes)
+        return cls._shared[path]
+
+    def _render(self, store: LeaderboardStore, board: str, page: int, pages_count: int, _locale: Locale) -> str:
+        rows = store.page(board, page, self.PAGE_SIZE)
+        return info_formatters.format_game_leaderboard_page(board, rows, page, pages_count, _locale)
+
+    def refresh(self) -> bool:
+        """Render the pages if a new generation was saved. Returns whether it was."""
+
+        store = LeaderboardStore.cached(self.path)
+        if store.generation == self.generation:
+            return False
+
+        start = time.perf_counter()
+        pages_counts = {board: table.pages_count(self.PAGE_SIZE) for board, table in store.tables.items()}
+        locales = [locale(lang_code) for lang_code in self.lang_codes]
+
+        pages = {}
+        search_rows = {}
+        for board, table in store.tables.items():
+            rows = table.page(0, len(table))
+            pages_count = pages_counts[board]
+            for _locale in locales:
+                for page in range(pages_count):
+                    page_rows = rows[page * self.PAGE_SIZE:(page + 1) * self.PAGE_SIZE]
+                    pages[board, page, _locale.lang_code] = info_formatters.format_game_leaderboard_page(
+                        board, page_rows, page, pages_count, _locale
+                    )
+                search_rows[board, _locale.lang_code] = [info_formatters.format_leaderboard_search_row(row, _locale)
+                                                         for row in rows]
+
+        analytics = LeaderboardAnalytics.compute(store, self.ANALYTICS_TOP)
+        analytics_pages = {_locale.lang_code: info_formatters.format_leaderboard_analytics(analytics, _locale)
+                           for _locale in locales}
+
+        # swapped at once, so readers never mix pages of different generations
+        self._store, self._pages, self._pages_counts, self.generation = store, pages, pages_counts, store.generation
+        self._analytics, self._analytics_pages = analytics, analytics_pages
+        self._search_rows = search_rows
+        logging.info(f'Rendered {len(pages)} leaderboard pages of generation {store.generation} '
+                     f'in {time.perf_counter() - start:.2f}s')
+        return True
+
+    def get(self, board: str, page: int, _locale: Locale) -> tuple[str | None, int, int]:
+        """
+        Returns:
+            The text, the page number clamped to the existing pages and the number of pages.
+            The text is ``None`` if there are no pages of the board yet.
+        """
+
+        store, pages, pages_count = self._store, self._pages, self._pages_counts.get(board, 0)
+        if not pages_count:
+            return None, 0, 0
+
+        page = min(max(page, 0), pages_count - 1)
+        text = pages.get((board, page, _locale.lang_code))
+        if text is None:
+            text = self._render(store, board, page, pages_count, _locale)
+        return text, page, pages_count
+
+    def analytics(self, _locale: Locale) -> str | None:
+        """The analytics page or ``None`` if there are no leaderboards yet."""
+
+        analytics, pages = self._analytics, self._analytics_pages
+        if analytics is None:
+            return None
+
+        text = pages.get(_locale.lang_code)
+        if text is None:
+            text = info_formatters.format_leaderboard_analytics(analytics, _locale)
+        return text
+
+    def search(self, query: str, _locale: Locale) -> tuple[int, str | None]:
+        """
+        Returns:
+            The total number of found players and the search results, ``None`` if no player was found.
+        """
+
+        store, search_rows = self._store, self._search_rows
+        total, found = store.locate(query, self.SEARCH_LIMIT)
+        if not total:
+            return 0, None
+
+        lines = []
+        for board, row_i in found:
+            rendered = search_rows.get((board, _locale.lang_code))
+            if rendered is not None:
+                lines.append(rendered[row_i])
+            else:
+                lines.append(info_formatters.format_leaderboard_search_row(store.tables[board].row(row_i), _locale))
+        return total, info_formatters.format_leaderboard_search_lines(query, total, lines, _locale)
@@ -1,6 +1,7 @@
 import asyncio
 import datetime as dt
 import logging
+from pathlib import Path
 import platform
 import sys
 import time
@@ -24,6 +25,7 @@ if platform.system() == 'Linux':
 import config
 from functions import caching, locale, utime
 from utypes import GameVersion, States, GameVersionData
+from utypes.http_cache import HTTPCache
 
 VALVE_TIMEZONE = ZoneInfo('America/Los_Angeles')
 loc = locale('ru')
@@ -86,6 +88,9 @@ cs = CSGOClient(client)
 gevent_scheduler = GeventScheduler()
 async_scheduler = AsyncIOScheduler()
 
+# steam.inf is polled until it changes, the cache turns most of these polls into empty 304 responses
+http_cache = HTTPCache(getattr(config, 'HTTP_CACHE_FOLDER', Path(config.SESS_FOLDER) / 'http_cache'))
+
 going_to_shutdown = False  # can be used in jobs to safely call sys.exit() afterwards
 
 
@@ -263,9 +268,11 @@ async def get_game_version_loop(cs2_client_version: int | None) -> GameVersionDa
         while time.time() < timeout_start + timeout:
             data = await get_game_version(session, cs2_client_version)
             if data:
+                http_cache.log_stats()
                 return data
             logging.warning('Failed to pull the game version data, retry in 45 seconds...')
             await asyncio.sleep(45)
+    http_cache.log_stats()
     # xPaw: Zzz...
     # because of this, we retry in an hour
     logging.warning('Reached a timeout while trying to pull the game version data, retry in an hour...')
@@ -276,7 +283,7 @@ async def get_game_version_loop(cs2_client_version: int | None) -> GameVersionDa
 async def get_game_version(session: requests.Session, cs2_client_version: int | None) -> GameVersionData | None:
     # noinspection PyBroadException
     try:
-        data = GameVersion.request(session)
+        data = GameVersion.request(session, http_cache)
 
         if cs2_client_version is None:  # *somehow* don't have anything cached
             logging.info('Successfully pulled the game version data.')
@@ -41,10 +41,16 @@ ss_markup = ExtendedIKM([
 # Profile Information
 _profile_info = ExtendedIKB(LK.user_profileinfo_title)
 _cs_stats = ExtendedIKB(LK.user_gamestats_button_title)
+_compare_stats = ExtendedIKB(LK.user_gamestats_compare_button_title)
+_lobby_scan = ExtendedIKB(LK.user_lobbyscan_button_title)
+_watchlist = ExtendedIKB(LK.user_watchlist_button_title)
 
 profile_markup = ExtendedIKM([
     [_profile_info],
     [_cs_stats],
+    [_compare_stats],
+    [_lobby_scan],
+    [_watchlist],
     [back_button]
 ])
 
@@ -246,6 +252,8 @@ _leaderboard_as = ExtendedIKB(LK.regions_asia)
 _leaderboard_au = ExtendedIKB(LK.regions_australia)
 _leaderboard_china = ExtendedIKB(LK.regions_china)
 _leaderboard_af = ExtendedIKB(LK.regions_africa)
+_leaderboard_analytics = ExtendedIKB(LK.game_leaderboard_analytics_button_title)
+_leaderboard_search = ExtendedIKB(LK.game_leaderboard_search_button_title, selectable=False)
 
 leaderboard_markup = ExtendedIKM([
     [_leaderboard_global],
@@ -253,9 +261,29 @@ leaderboard_markup = ExtendedIKM([
     [_leaderboard_eu, _leaderboard_as],
     [_leaderboard_au, _leaderboard_af],
     [_leaderboard_china],
+    [_leaderboard_analytics, _leaderboard_search],
     [back_button]
 ])
 
+LEADERBOARD_PAGE_CALLBACK = 'leaderboard_page'
+
+
+def leaderboard_pages_markup(board: str, page: int, pages_count: int) -> ExtendedIKM:
+    """``leaderboard_markup`` with buttons to the previous and the next page of the board."""
+
+    def page_button(text: str, to_page: int):
+        return ExtendedIKB(text, f'{LEADERBOARD_PAGE_CALLBACK}:{board}:{to_page}', translatable=False, selectable=False)
+
+    pages_row = []
+    if page > 0:
+        pages_row.append(page_button('◀️', page - 1))
+    pages_row.append(page_button(f'{page + 1}/{pages_count}', page))
+    if page + 1 < pages_count:
+        pages_row.append(page_button('▶️', page + 1))
+
+    *rows, back_row = leaderboard_markup.inline_keyboard
+    return ExtendedIKM([*rows[:-1], pages_row, rows[-1], back_row])  # right above the search button
+
 # Crosshair
 
 _generate_crosshair = ExtendedIKB(LK.crosshair_generate, LK.crosshair_generate)
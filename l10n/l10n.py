@@ -245,6 +245,19 @@ class Locale(SLocale):
     game_leaderboard_header_world: str
     game_leaderboard_header_regional: str
     game_leaderboard_detailed_link: str
+    game_leaderboard_page: str  # Page {} of {}
+    game_leaderboard_analytics_button_title: str
+    game_leaderboard_analytics_header: str
+    game_leaderboard_analytics_maps: str  # among the world's top {}
+    game_leaderboard_analytics_ratings: str
+    game_leaderboard_analytics_win_rates: str  # quantiles ({})
+    game_leaderboard_search_button_title: str
+    game_leaderboard_search_text: str
+    game_leaderboard_search_header: str  # starts with «{}»: {} found
+    game_leaderboard_search_not_found: str
+    game_leaderboard_inline_description: str
+    game_leaderboard_search_inline_title: str
+    game_leaderboard_search_inline_title_notfound: str
 
     # guns info
     gun_button_text: str
@@ -388,10 +401,17 @@ class Locale(SLocale):
     user_gamestats_snipers_stats: str
 
     user_gamestats_share: str
+    user_gamestats_compare_button_title: str
+    user_gamestats_compare_example: str  # from 2 to {} profiles
+    user_gamestats_compare_header: str
+    user_gamestats_compare_count_error: str  # from 2 to {} profiles
+    user_gamestats_progress_header: str  # Since your last check ({}):
     user_invalidlink_error: str
     user_invalidrequest_error: str
     user_nostatsavailable_error: str
     user_telegraph_error: str
+    user_ratelimited_error: str
+    user_steamunavailable_error: str
     user_privateprofile_error: str
     user_profileinfo_title: str
     user_profileinfo_text: str
@@ -399,6 +419,23 @@ class Locale(SLocale):
     user_profileinfo_notfound: str
     user_profileinfo_none: str
     user_profileinfo_banned: str
+    user_profileinfo_unavailable: str
+    user_profilecard_inline_title: str
+    user_profilecard_inline_description: str
+    user_profilecard_account_created: str
+    user_profilecard_restricted: str
+    user_profilecard_loading: str
+    user_lobbyscan_button_title: str
+    user_lobbyscan_example: str
+    user_lobbyscan_header: str  # Lobby scan, {} players
+    user_lobbyscan_notfound_error: str
+    user_watchlist_button_title: str
+    user_watchlist_text: str  # Your ban watchlist: {}
+    user_watchlist_empty: str
+    user_watchlist_limit_error: str  # up to {} profiles
+    user_watchlist_added: str
+    user_watchlist_removed: str
+    user_watchlist_ban_changed: str
 
     # valve
     valve_hqtime_button_title: str
@@ -6,6 +6,7 @@ from json import JSONDecodeError
 import traceback
 from typing import TYPE_CHECKING
 import logging
+from pathlib import Path
 from zoneinfo import ZoneInfo
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
@@ -13,7 +14,7 @@ from babel.dates import format_datetime
 from csxhair import Crosshair
 from pyrogram import filters
 from pyrogram.enums import ChatType, ChatAction, ParseMode
-from pyrogram.errors import MessageDeleteForbidden, MessageNotModified
+from pyrogram.errors import MessageDeleteForbidden, MessageNotModified, RPCError
 from pyrogram.types import CallbackQuery, Message
 # noinspection PyUnresolvedReferences
 from pyropatch import pyropatch  # do not delete!!
@@ -24,6 +25,7 @@ import config
 from db import db_session
 from functions import caching, info_formatters, utime
 from functions.decorators import ignore_message_not_modified
+from functions.leaderboard_pages import LeaderboardPages
 from functions.locale import get_available_languages
 import keyboards
 # noinspection PyPep8Naming
@@ -33,7 +35,11 @@ from utypes import (DatacenterAtlas, DatacenterVariation, ExchangeRate,
                     ProfileInfo,
                     States, UserGameStats, drop_cap_reset_timer)
 from utypes.gun_info import load_gun_infos
-from utypes.profiles import ErrorCode, ParseUserStatsError  # to clearly indicate relation
+from utypes.leaderboard_store import LEADERBOARD_BOARDS
+from utypes.profiles import (ErrorCode, ParseUserStatsError, STATS_COMPARE_MAX_PLAYERS,  # to clearly indicate relation
+                             api as steam_webapi, resolve_steamid)
+from utypes.stats_history import StatsHistory
+from utypes.watchlist import BanWatchlist, WatchlistFull
 
 if TYPE_CHECKING:
     from typing import Callable
@@ -43,12 +49,16 @@ if TYPE_CHECKING:
 
 
 GUNS_INFO = load_gun_infos(config.GUN_DATA_FILE_PATH)
+LEADERBOARD_STORE_FILE_PATH = getattr(config, 'LEADERBOARD_STORE_FILE_PATH',
+                                      Path(config.CORE_CACHE_FILE_PATH).with_name('leaderboard_store.npz'))
 AVAILABLE_LANGUAGES = get_available_languages()
 ALL_COMMANDS = ('start', 'help')
 ASK_TIMEOUT = 5 * 60
 ENGLISH_LOCALE = lc('en')
 VALVE_TIMEZONE = ZoneInfo('America/Los_Angeles')
 
+leaderboard_pages = LeaderboardPages.shared(LEADERBOARD_STORE_FILE_PATH, AVAILABLE_LANGUAGES)
+
 logging.basicConfig(level=logging.INFO,
                     format="%(asctime)s | %(threadName)s: %(message)s",
                     datefmt="%H:%M:%S — %d/%m/%Y")
@@ -61,7 +71,9 @@ bot = BotClient(config.BOT_NAME,
                 test_mode=config.TEST_MODE,
                 workdir=config.SESS_FOLDER,
                 logger=BotLogger(config.LOGCHANNEL),
-                navigate_back_callback=LK.bot_back,)
+                navigate_back_callback=LK.bot_back,
+                max_sessions=getattr(config, 'MAX_SESSIONS', None),
+                compact_sessions=getattr(config, 'COMPACT_SESSIONS', False))
 
 telegraph = Telegraph(access_token=config.TELEGRAPH_ACCESS_TOKEN)
 
@@ -347,7 +359,7 @@ async def user_profile_info_process(client: BotClient, session: UserSession, bot
     await client.send_chat_action(bot_message.chat.id, ChatAction.TYPING)
 
     try:
-        info = await ProfileInfo.get(user_input.text)
+        info = await ProfileInfo.get(user_input.text, rate_limit=session.rate_limit)
     except ParseUserStatsError as e:
         await user_input.delete()
         error_msg = await user_info_handle_error(client, session, user_input, e)
@@ -368,7 +380,10 @@ async def user_profile_info_process(client: BotClient, session: UserSession, bot
     info.faceit_ban = session.locale.user_profileinfo_banned \
         if info.faceit_ban else session.locale.user_profileinfo_none
 
-    if info.faceit_lvl is None:
+    if info.faceit_unavailable:
+        info.faceit_url = info.faceit_ban = session.locale.user_profileinfo_unavailable
+        info.faceit_lvl = info.faceit_elo = session.locale.user_profileinfo_unavailable
+    elif info.faceit_lvl is None:
         info.faceit_lvl = session.locale.user_profileinfo_none
         info.faceit_elo = session.locale.user_profileinfo_none
 
@@ -413,7 +428,7 @@ async def user_game_stats_process(client: BotClient, session: UserSession, bot_m
     await client.send_chat_action(bot_message.chat.id, ChatAction.TYPING)
 
     try:
-        user_stats = await UserGameStats.get(user_input.text)
+        user_stats = await UserGameStats.get(user_input.text, rate_limit=session.rate_limit)
     except ParseUserStatsError as e:
         await user_input.delete()
         error_msg = await user_info_handle_error(client, session, user_input, e)
@@ -422,6 +437,12 @@ async def user_game_stats_process(client: BotClient, session: UserSession, bot_m
         await user_input.delete()
         raise e
 
+    try:
+        progress = await StatsHistory.record(user_stats)
+    except Exception:  # the stats are already here, they're shown without the progress
+        logging.exception(f'Failed to record stats of {user_stats.steamid}')
+        progress = None
+
     steamid, *stats = user_stats
     stats_page_title = session.locale.user_gamestats_page_title.format(steamid)
     stats_page_text = info_formatters.format_user_game_stats(stats, session.locale)
@@ -439,7 +460,138 @@ async def user_game_stats_process(client: BotClient, session: UserSession, bot_m
                             switch_inline_query=telegraph_response['url'])
     markup_share = ExtendedIKM([[share_btn]])
 
-    await user_input.reply(telegraph_response['url'], reply_markup=markup_share)
+    text = telegraph_response['url']
+    if progress is not None and not progress.is_empty:
+        text += '\n\n' + info_formatters.format_stats_progress(progress, session.locale)
+
+    await user_input.reply(text, reply_markup=markup_share)
+    return await user_input.reply(session.locale.bot_loading)
+
+
+@bot.navmenu(LK.user_gamestats_compare_button_title, came_from=profile_info)
+async def user_game_stats_compare(client: BotClient, session: UserSession, bot_message: Message,
+                                  last_error: str = None):
+    text = session.locale.user_gamestats_compare_example.format(STATS_COMPARE_MAX_PLAYERS) \
+        if last_error is None else last_error
+    text += '\n\n' + session.locale.bot_use_cancel
+
+    steam_urls = await client.ask_message_silently(bot_message, text, timeout=ASK_TIMEOUT)
+
+    return await user_game_stats_compare_process(client, session, bot_message, steam_urls)
+
+
+@bot.message_process(of=user_game_stats_compare)
+async def user_game_stats_compare_process(client: BotClient, session: UserSession, bot_message: Message,
+                                          user_input: Message):
+    if user_input.text == '/cancel':
+        await user_input.delete()
+        return await profile_info(client, session, bot_message)
+
+    users = list(dict.fromkeys((user_input.text or '').replace(',', ' ').split()))
+    if not 2 <= len(users) <= STATS_COMPARE_MAX_PLAYERS:
+        await user_input.delete()
+        error_msg = session.locale.user_gamestats_compare_count_error.format(STATS_COMPARE_MAX_PLAYERS)
+        return await user_game_stats_compare(client, session, bot_message, last_error=error_msg)
+
+    await bot_message.edit(session.locale.bot_loading)
+    await client.send_chat_action(bot_message.chat.id, ChatAction.TYPING)
+
+    try:
+        players = await UserGameStats.get_many(users, rate_limit=session.rate_limit)
+    except ParseUserStatsError as e:
+        await user_input.delete()
+        error_msg = await user_info_handle_error(client, session, user_input, e)
+        return await user_game_stats_compare(client, session, bot_message, last_error=error_msg)
+    except Exception as e:
+        await user_input.delete()
+        raise e
+
+    comparison = UserGameStats.compare(players)
+    text = info_formatters.format_user_game_stats_comparison(comparison, session.locale)
+
+    await user_input.reply(text, disable_web_page_preview=True)
+    return await user_input.reply(session.locale.bot_loading)
+
+
+@bot.navmenu(LK.user_lobbyscan_button_title, came_from=profile_info)
+async def user_lobby_scan(client: BotClient, session: UserSession, bot_message: Message, last_error: str = None):
+    text = session.locale.user_lobbyscan_example if last_error is None else last_error
+    text += '\n\n' + session.locale.bot_use_cancel
+
+    status_dump = await client.ask_message_silently(bot_message, text, timeout=ASK_TIMEOUT)
+
+    return await user_lobby_scan_process(client, session, bot_message, status_dump)
+
+
+@bot.message_process(of=user_lobby_scan)
+async def user_lobby_scan_process(client: BotClient, session: UserSession, bot_message: Message, user_input: Message):
+    if user_input.text == '/cancel':
+        await user_input.delete()
+        return await profile_info(client, session, bot_message)
+
+    await bot_message.edit(session.locale.bot_loading)
+    await client.send_chat_action(bot_message.chat.id, ChatAction.TYPING)
+
+    try:
+        profiles = await ProfileInfo.scan_lobby(user_input.text, rate_limit=session.rate_limit)
+    except ParseUserStatsError as e:
+        await user_input.delete()
+        if e.code == ErrorCode.INVALID_REQUEST:
+            error_msg = session.locale.user_lobbyscan_notfound_error
+        else:
+            error_msg = await user_info_handle_error(client, session, user_input, e)
+        return await user_lobby_scan(client, session, bot_message, last_error=error_msg)
+    except Exception as e:
+        await user_input.delete()
+        raise e
+
+    text = info_formatters.format_lobby_scan(profiles, session.locale)
+
+    await user_input.reply(text, disable_web_page_preview=True)
+    return await user_input.reply(session.locale.bot_loading)
+
+
+@bot.navmenu(LK.user_watchlist_button_title, came_from=profile_info)
+async def user_watchlist(client: BotClient, session: UserSession, bot_message: Message, last_error: str = None):
+    if last_error is None:
+        steamids = await BanWatchlist.get(bot_message.chat.id)
+        text = session.locale.user_watchlist_text.format(info_formatters.format_watchlist(steamids, session.locale))
+    else:
+        text = last_error
+    text += '\n\n' + session.locale.bot_use_cancel
+
+    steam_url = await client.ask_message_silently(bot_message, text, timeout=ASK_TIMEOUT,
+                                                  disable_web_page_preview=True)
+
+    return await user_watchlist_process(client, session, bot_message, steam_url)
+
+
+@bot.message_process(of=user_watchlist)
+async def user_watchlist_process(client: BotClient, session: UserSession, bot_message: Message, user_input: Message):
+    if user_input.text == '/cancel':
+        await user_input.delete()
+        return await profile_info(client, session, bot_message)
+
+    await bot_message.edit(session.locale.bot_loading)
+
+    try:
+        _id = await resolve_steamid(user_input.text, session.rate_limit)
+        added = await BanWatchlist.toggle(bot_message.chat.id, _id.as_64)
+    except ParseUserStatsError as e:
+        await user_input.delete()
+        error_msg = await user_info_handle_error(client, session, user_input, e)
+        return await user_watchlist(client, session, bot_message, last_error=error_msg)
+    except WatchlistFull:
+        await user_input.delete()
+        error_msg = session.locale.user_watchlist_limit_error.format(BanWatchlist.MAX_PER_USER)
+        return await user_watchlist(client, session, bot_message, last_error=error_msg)
+    except Exception as e:
+        await user_input.delete()
+        raise e
+
+    text = session.locale.user_watchlist_added if added else session.locale.user_watchlist_removed
+
+    await user_input.reply(text.format(f'`{_id.as_64}`'))
     return await user_input.reply(session.locale.bot_loading)
 
 
@@ -456,6 +608,10 @@ async def user_info_handle_error(_, session: UserSession, user_input: Message, e
                     session.locale.user_privateprofile_error
     elif exc.code == ErrorCode.NO_STATS_AVAILABLE:
         error_msg = session.locale.user_nostatsavailable_error
+    elif exc.code == ErrorCode.RATE_LIMITED:
+        error_msg = session.locale.user_ratelimited_error
+    elif exc.code == ErrorCode.STEAM_UNAVAILABLE:
+        error_msg = session.locale.user_steamunavailable_error
 
     return error_msg
 
@@ -551,10 +707,37 @@ async def send_game_version(_, session: UserSession, bot_message: Message):
 
 @bot.navmenu(LK.game_leaderboard_button_title, came_from=extra_features, ignore_message_not_modified=True)
 async def game_leaderboard(_, session: UserSession, bot_message: Message):
-    world_data = LeaderboardStats.cached_world_stats(config.CORE_CACHE_FILE_PATH)
-    text = info_formatters.format_game_world_leaderboard(world_data, session.locale)
+    return await show_leaderboard_page(session, bot_message, 'world')
 
-    await bot_message.edit(text, reply_markup=keyboards.leaderboard_markup(session.locale))
+
+@bot.callback_process(of=game_leaderboard)
+@ignore_message_not_modified  # the page counter and double taps edit the page into itself
+async def game_leaderboard_process(client: BotClient, session: UserSession, callback_query: CallbackQuery):
+    bot_message = callback_query.message
+
+    prefix, _, args = callback_query.data.partition(':')
+    board, _, page = args.partition(':')
+    if prefix != keyboards.LEADERBOARD_PAGE_CALLBACK or board not in LEADERBOARD_BOARDS or not page.isdigit():
+        return await unknown_request(client, session, bot_message, keyboards.leaderboard_markup)
+
+    return await show_leaderboard_page(session, bot_message, board, int(page))
+
+
+async def show_leaderboard_page(session: UserSession, bot_message: Message, board: str, page: int = 0):
+    text, page, pages_count = leaderboard_pages.get(board, page, session.locale)
+
+    if text is None:  # full leaderboards haven't been collected yet, but the top could be cached
+        if board == 'world':
+            data = LeaderboardStats.cached_world_stats(config.CORE_CACHE_FILE_PATH)
+            text = info_formatters.format_game_world_leaderboard(data, session.locale)
+        else:
+            data = LeaderboardStats.cached_regional_stats(config.CORE_CACHE_FILE_PATH, board)
+            text = info_formatters.format_game_regional_leaderboard(board, data, session.locale)
+        markup = keyboards.leaderboard_markup
+    else:
+        markup = keyboards.leaderboard_pages_markup(board, page, pages_count)
+
+    await bot_message.edit(text, reply_markup=markup(session.locale))
 
 
 @bot.funcmenu(LK.game_leaderboard_world, came_from=game_leaderboard)
@@ -597,6 +780,43 @@ async def game_leaderboard_southamerica(client: BotClient, session: UserSession,
     return await send_game_leaderboard(client, session, bot_message, LK.regions_southamerica)
 
 
+@bot.funcmenu(LK.game_leaderboard_analytics_button_title, came_from=game_leaderboard, ignore_message_not_modified=True)
+async def game_leaderboard_analytics(_, session: UserSession, bot_message: Message):
+    keyboards.leaderboard_markup.select_button_by_key(LK.game_leaderboard_analytics_button_title)
+
+    text = leaderboard_pages.analytics(session.locale) or session.locale.data_not_found
+    await bot_message.edit(text, reply_markup=keyboards.leaderboard_markup(session.locale))
+
+
+@bot.navmenu(LK.game_leaderboard_search_button_title, came_from=game_leaderboard)
+async def game_leaderboard_search(client: BotClient, session: UserSession, bot_message: Message,
+                                  last_error: str = None):
+    text = session.locale.game_leaderboard_search_text if last_error is None else last_error
+    text += '\n\n' + session.locale.bot_use_cancel
+
+    query = await client.ask_message_silently(bot_message, text, timeout=ASK_TIMEOUT)
+
+    return await game_leaderboard_search_process(client, session, bot_message, query)
+
+
+@bot.message_process(of=game_leaderboard_search)
+async def game_leaderboard_search_process(client: BotClient, session: UserSession, bot_message: Message,
+                                          user_input: Message):
+    if user_input.text == '/cancel':
+        await user_input.delete()
+        return await game_leaderboard(client, session, bot_message)
+
+    query = (user_input.text or '').strip()
+    _, text = leaderboard_pages.search(query, session.locale)
+    if text is None:
+        await user_input.delete()
+        error_msg = session.locale.game_leaderboard_search_not_found
+        return await game_leaderboard_search(client, session, bot_message, last_error=error_msg)
+
+    await user_input.reply(text)
+    return await user_input.reply(session.locale.bot_loading)
+
+
 @bot.navmenu(LK.game_leaderboard_button_title, came_from=game_leaderboard, ignore_message_not_modified=True)
 async def send_game_leaderboard(_, session: UserSession, bot_message: Message,
                                 region: str = LK.game_leaderboard_world):
@@ -607,15 +827,7 @@ async def send_game_leaderboard(_, session: UserSession, bot_message: Message,
     await bot_message.edit(session.locale.bot_loading,
                            reply_markup=keyboards.leaderboard_markup(session.locale))
 
-    region = region.split('_')[-1]
-    if region == 'world':
-        data = LeaderboardStats.cached_world_stats(config.CORE_CACHE_FILE_PATH)
-        text = info_formatters.format_game_world_leaderboard(data, session.locale)
-    else:
-        data = LeaderboardStats.cached_regional_stats(config.CORE_CACHE_FILE_PATH, region)
-        text = info_formatters.format_game_regional_leaderboard(region, data, session.locale)
-
-    await bot_message.edit(text, reply_markup=keyboards.leaderboard_markup(session.locale))
+    return await show_leaderboard_page(session, bot_message, region.split('_')[-1])
 
 
 # cat: Crosshair editor
@@ -934,11 +1146,20 @@ async def regular_stats_report(client: BotClient):
             f'• Callback queries handled: {client.rstats.callback_queries_handled}\n'
             f'• Inline queries handled: {client.rstats.inline_queries_handled}\n'
             f'• Exceptions caught: {client.rstats.exceptions_caught}\n'
+            f'• Steam API calls left today: {sum(key["calls_left"] for key in steam_webapi.keys.usage())} '
+            f'({len(steam_webapi.keys)} keys)\n'
             f'\n'
             f'📁 **Other stats:**\n'
             f'\n'
             f'• Bot started up at: {client.startup_dt:%Y-%m-%d %H:%M:%S} (UTC)\n'
             f'• Is working for: {info_formatters.format_timedelta(now - client.startup_dt)}')
+
+    if endpoints_metrics := steam_webapi.metrics():
+        text += '\n\n🌐 **Steam API endpoints:**\n\n'
+        for endpoint, metrics in endpoints_metrics.items():
+            text += (f'• {endpoint}: {metrics["success_rate"]:.1%} ok of {metrics["calls"]}, '
+                     f'{metrics["rejected"]} rejected, '
+                     f'p50 {metrics["latency_p50"] * 1000:.0f}ms, p95 {metrics["latency_p95"] * 1000:.0f}ms\n')
     await client.log(text, instant=True)
     client.rstats.clear()
 
@@ -953,9 +1174,29 @@ async def drop_cap_reset_in_10_minutes(client: BotClient):
     print(a)
 
 
+async def refresh_leaderboard_pages():
+    await asyncio.to_thread(leaderboard_pages.refresh)
+
+
+async def notify_about_ban_changes(client: BotClient):
+    changes = await BanWatchlist.sweep()
+
+    for change in changes:
+        for userid, lang_code in change.watchers:
+            text = info_formatters.format_ban_change(change, lc(lang_code))
+            try:
+                await client.send_message(userid, text, disable_web_page_preview=True)
+            except RPCError:
+                logging.exception(f'Failed to notify {userid=} about ban changes of {change.steamid}')
+
+
 async def main():
     scheduler = AsyncIOScheduler()
     scheduler.add_job(bot.clear_timeout_sessions, 'interval', minutes=30)
+    scheduler.add_job(notify_about_ban_changes, 'interval', minutes=30,
+                      args=(bot,))
+    scheduler.add_job(refresh_leaderboard_pages, 'interval', minutes=1,
+                      next_run_time=dt.datetime.now())
     scheduler.add_job(regular_stats_report, 'interval', hours=8,
                       args=(bot,))
     scheduler.add_job(drop_cap_reset_in_10_minutes, 'cron', day_of_week=1, hour=16, minute=49, second=59,
@@ -963,7 +1204,7 @@ async def main():
                       args=(bot,))
 
     try:
-        await db_session.init(config.USER_DB_FILE_PATH)
+        await db_session.init(getattr(config, 'DB_URL', None) or config.USER_DB_FILE_PATH)
         await bot.start()
         scheduler.start()
         await bot.log('Bot started.', instant=True)
@@ -977,6 +1218,7 @@ async def main():
         logging.info('Shutting down the bot...')
         await bot.log('Bot is shutting down...', instant=True)
         await bot.dump_sessions()
+        await db_session.close()
         await bot.stop(block=False)
 
 
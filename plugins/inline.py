@@ -1,22 +1,29 @@
 from __future__ import annotations
 
+import asyncio
 import datetime as dt
 import logging
+from pathlib import Path
 import re
 import traceback
 from typing import TYPE_CHECKING
 
 from pyrogram.enums import ChatType, ParseMode
-from pyrogram.types import InlineQuery, InlineQueryResultArticle, InputTextMessageContent
+from pyrogram.types import ChosenInlineResult, InlineQuery, InlineQueryResultArticle, InputTextMessageContent
 
 from bottypes import BotClient, UserSession
 import config
 from functions import info_formatters
+from functions.leaderboard_pages import LeaderboardPages
+from functions.locale import get_available_languages
 import keyboards
-from l10n import load_tags
+# noinspection PyPep8Naming
+from l10n import LocaleKeys as LK, load_tags
 from utypes import (DatacenterAtlas, DatacenterInlineResult, ExchangeRate,
-                    GameServers, GameVersion,
+                    GameServers, GameVersion, ProfileInfo,
                     drop_cap_reset_timer)
+from utypes.leaderboard_store import LEADERBOARD_BOARDS
+from utypes.profiles import ErrorCode, ParseUserStatsError, parse_steamid_offline
 
 if TYPE_CHECKING:
     from keyboards import ExtendedIKM
@@ -24,6 +31,24 @@ if TYPE_CHECKING:
 
 
 TAGS = load_tags()
+LEADERBOARD_STORE_FILE_PATH = getattr(config, 'LEADERBOARD_STORE_FILE_PATH',
+                                      Path(config.CORE_CACHE_FILE_PATH).with_name('leaderboard_store.npz'))
+LEADERBOARD_INLINE_BOARDS = {board: board for board in LEADERBOARD_BOARDS} | \
+                            {code: board for board, code in info_formatters.WEB_LEADERBOARD_REGIONS.items()}
+
+# rendered by the bot's refresh job, shared with the leaderboard menus
+leaderboard_pages = LeaderboardPages.shared(LEADERBOARD_STORE_FILE_PATH, get_available_languages())
+leaderboard_articles: dict[tuple[int, str], list[InlineQueryResultArticle]] = {}  # (generation, lang code): articles
+
+PROFILE_RESULT = 'profile'
+PROFILE_PENDING_RESULT = 'profile_pending'  # edited with the full card once it's chosen and looked up
+PROFILE_LOOKUP_DEADLINE = 3  # s, to answer the inline query well before it expires
+PROFILE_ERRORS = {ErrorCode.INVALID_LINK: LK.user_invalidlink_error,
+                  ErrorCode.PROFILE_IS_PRIVATE: LK.user_privateprofile_error,
+                  ErrorCode.RATE_LIMITED: LK.user_ratelimited_error,
+                  ErrorCode.STEAM_UNAVAILABLE: LK.user_steamunavailable_error}
+
+profile_lookups: dict[str, asyncio.Task[ProfileInfo]] = {}  # query: lookup in progress
 
 
 def log_exception_inline(func):
@@ -86,6 +111,54 @@ def dc_articles_factory(dcs: list[DatacenterInlineResult],
     return result
 
 
+def leaderboard_board_articles(locale: Locale) -> list[InlineQueryResultArticle]:
+    """Articles with the first page of every board, built once per generation and locale."""
+
+    key = (leaderboard_pages.generation, locale.lang_code)
+    if key in leaderboard_articles:
+        return leaderboard_articles[key]
+
+    if key[0] not in {generation for generation, _ in leaderboard_articles}:
+        leaderboard_articles.clear()  # a new generation was rendered
+
+    inline_btn = keyboards.markup_inline_button(locale)
+    articles = []
+    for board in LEADERBOARD_BOARDS:
+        text, _, _ = leaderboard_pages.get(board, 0, locale)
+        if text is None:
+            continue
+        articles.append(
+            InlineQueryResultArticle(
+                locale.game_leaderboard_world if board == 'world' else locale.get(f'regions_{board}'),
+                InputTextMessageContent(text, disable_web_page_preview=True),
+                board,
+                description=locale.game_leaderboard_inline_description,
+                reply_markup=inline_btn
+            )
+        )
+
+    if leaderboard_pages.generation is not None:  # nothing to remember before the first generation
+        leaderboard_articles[key] = articles
+    return articles
+
+
+def lookup_profile(query: str, session: UserSession) -> asyncio.Task[ProfileInfo]:
+    """Look the profile up in the background. Lookups of the same profile at the same time share one task."""
+
+    _id = parse_steamid_offline(query)
+    key = str(_id.as_64) if _id is not None else query.lower()
+
+    def done(task: asyncio.Task):
+        profile_lookups.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # nobody might be waiting anymore, the error is handled by whoever is
+
+    if (task := profile_lookups.get(key)) is None:
+        task = profile_lookups[key] = asyncio.create_task(ProfileInfo.get(query, rate_limit=session.rate_limit))
+        task.add_done_callback(done)
+    return task
+
+
 @BotClient.on_inline_query()
 async def sync_user_data_inline(client: BotClient, inline_query: InlineQuery):
     user = inline_query.from_user
@@ -104,6 +177,10 @@ async def sync_user_data_inline(client: BotClient, inline_query: InlineQuery):
         return await inline_exchange_rate(client, session, inline_query)
     if query.startswith('dc'):
         return await inline_datacenters(client, session, inline_query)
+    if query.lower() == 'lb' or query.lower().startswith('lb '):
+        return await inline_leaderboard(client, session, inline_query)
+    if query.lower().startswith('p '):
+        return await inline_profile(client, session, inline_query)
     if inline_query.chat_type == ChatType.PRIVATE and query.lower() == 'deadlock':
         return await inline_deadlock(client, session, inline_query)
     return await default_inline(client, session, inline_query)
@@ -283,6 +360,93 @@ async def inline_datacenters(_, session: UserSession, inline_query: InlineQuery)
     await inline_query.answer(resulted_articles, cache_time=10)
 
 
+@log_exception_inline
+async def inline_leaderboard(_, session: UserSession, inline_query: InlineQuery):
+    articles = leaderboard_board_articles(session.locale)
+
+    try:
+        query = inline_query.query.split(maxsplit=1)[1].strip()
+    except IndexError:  # no query, return every board
+        return await inline_query.answer(articles, cache_time=10)
+
+    if (board := LEADERBOARD_INLINE_BOARDS.get(query.lower())) is not None:
+        return await inline_query.answer([article for article in articles if article.id == board], cache_time=10)
+
+    total, text = leaderboard_pages.search(query, session.locale)
+    if text is None:
+        result = InlineQueryResultArticle(session.locale.game_leaderboard_search_inline_title_notfound,
+                                          InputTextMessageContent(session.locale.game_leaderboard_search_not_found),
+                                          description=session.locale.game_leaderboard_search_not_found)
+        return await inline_query.answer([result], cache_time=5)
+
+    result = InlineQueryResultArticle(session.locale.game_leaderboard_search_inline_title.format(total),
+                                      InputTextMessageContent(text),
+                                      description=query,
+                                      reply_markup=keyboards.markup_inline_button(session.locale))
+    await inline_query.answer([result], cache_time=10)
+
+
+@log_exception_inline
+async def inline_profile(_, session: UserSession, inline_query: InlineQuery):
+    """
+    Answers with the card of a recently looked up profile or looks the profile up. A lookup that takes longer
+    than ``PROFILE_LOOKUP_DEADLINE`` is answered with what can be decoded from the SteamID itself,
+    which is edited once the lookup is done, but only if inline feedback is enabled in BotFather.
+    """
+
+    query = inline_query.query.split(maxsplit=1)[1].strip()
+
+    _id = parse_steamid_offline(query)
+    try:
+        if (profile := ProfileInfo.cached(_id) if _id is not None else None) is None:
+            # the lookup goes on after the deadline, for the pending card to be edited with
+            profile = await asyncio.wait_for(asyncio.shield(lookup_profile(query, session)), PROFILE_LOOKUP_DEADLINE)
+        text = info_formatters.format_profile_card(profile, session.locale)
+        result_id = PROFILE_RESULT
+    except asyncio.exceptions.TimeoutError:
+        text = info_formatters.format_profile_card_pending(_id, query, session.locale)
+        result_id = PROFILE_PENDING_RESULT
+    except ParseUserStatsError as e:
+        if e.is_unknown:
+            raise e
+        text = session.locale.get(PROFILE_ERRORS.get(e.code, LK.user_invalidrequest_error))
+        result_id = PROFILE_RESULT
+
+    result = InlineQueryResultArticle(session.locale.user_profilecard_inline_title,
+                                      InputTextMessageContent(text, disable_web_page_preview=True),
+                                      result_id,
+                                      description=session.locale.user_profilecard_inline_description,
+                                      reply_markup=keyboards.markup_inline_button(session.locale))
+    await inline_query.answer([result], cache_time=5)
+
+
+@BotClient.on_chosen_inline_result()
+async def sync_chosen_inline_result(client: BotClient, chosen_result: ChosenInlineResult):
+    # inline_message_id is only there if the message has a keyboard and inline feedback is enabled
+    if chosen_result.result_id != PROFILE_PENDING_RESULT or chosen_result.inline_message_id is None:
+        return
+
+    session = await client.register_session(chosen_result.from_user)
+    return await edit_inline_profile(client, session, chosen_result)
+
+
+@log_exception_inline
+async def edit_inline_profile(client: BotClient, session: UserSession, chosen_result: ChosenInlineResult):
+    query = chosen_result.query.split(maxsplit=1)[1].strip()
+
+    try:
+        profile = await lookup_profile(query, session)
+        text = info_formatters.format_profile_card(profile, session.locale)
+    except ParseUserStatsError as e:
+        if e.is_unknown:
+            raise e
+        text = session.locale.get(PROFILE_ERRORS.get(e.code, LK.user_invalidrequest_error))
+
+    await client.edit_inline_text(chosen_result.inline_message_id, text,
+                                  disable_web_page_preview=True,
+                                  reply_markup=keyboards.markup_inline_button(session.locale))
+
+
 @log_exception_inline
 async def inline_deadlock(_, __, inline_query: InlineQuery):
     r = InlineQueryResultArticle('Deadlock?',
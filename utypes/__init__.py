@@ -1,6 +1,16 @@
 from .datacenters import *
 from .game_data import *
 from .gun_info import *
-from .profiles import *
 from .states import *
 from .steam_webapi import SteamWebAPI
+
+
+# profiles connect to the Web API with the key from the config, so they're only imported once they're used
+_PROFILES_NAMES = ('ErrorCode', 'ParseUserStatsError', 'ProfileInfo', 'StatsComparison', 'UserGameStats')
+
+
+def __getattr__(name: str):
+    if name in _PROFILES_NAMES:
+        from . import profiles
+        return getattr(profiles, name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from typing import NamedTuple
+from urllib.parse import parse_qs, urlsplit
+
+from cachetools import TTLCache
+import httpx
+
+from .ratelimit import TokenBucket
+from .transport import CircuitBreaker
+
+
+__all__ = ('FaceitAPI', 'FaceitData', 'FaceitUnavailable', 'FaceitStubServer')
+
+
+MINUTE = 60
+
+
+class FaceitUnavailable(Exception):
+    """Raised when FACEIT doesn't respond in time or the circuit breaker is open."""
+
+
+class FaceitData(NamedTuple):
+    url: str | None = None
+    elo: int | None = None
+    lvl: int | None = None
+    ban: bool | None = None
+
+
+class FaceitAPI:
+    """
+    Async FACEIT client with a connection pool, a per-player result cache and a circuit breaker.
+
+    If ``rate_limit`` is given, lookups that miss the cache are rejected as unavailable once it runs out.
+    """
+
+    BASE_URL = 'https://api.faceit.com'
+    PLAYER_PAGE_URL = 'https://faceit.com/en/players/{}'
+    DEFAULT_TIMEOUT = 5
+    DEFAULT_CACHE_TTL = 15 * MINUTE
+
+    def __init__(self, *,
+                 base_url: str = None,
+                 timeout: float = None,
+                 max_connections: int = 20,
+                 cache_size: int = 4096,
+                 cache_ttl: float = None,
+                 breaker: CircuitBreaker = None,
+                 rate_limit: TokenBucket = None):
+        self.base_url = base_url or self.BASE_URL
+        self.timeout = timeout or self.DEFAULT_TIMEOUT
+        self.breaker = breaker or CircuitBreaker()
+        self.rate_limit = rate_limit
+
+        self._cache: TTLCache[int, FaceitData] = TTLCache(cache_size, cache_ttl or self.DEFAULT_CACHE_TTL)
+        self._client = httpx.AsyncClient(base_url=self.base_url,
+                                         timeout=self.timeout,
+                                         limits=httpx.Limits(max_connections=max_connections,
+                                                             max_keepalive_connections=max_connections))
+
+    def cached(self, steamid64: int) -> FaceitData | None:
+        return self._cache.get(steamid64)
+
+    async def get_player(self, steamid64: int) -> FaceitData:
+        """
+        Get FACEIT data of the player by SteamID64.
+
+        Raises:
+            FaceitUnavailable: When FACEIT is slow or down, or the rate limit is exceeded.
+        """
+
+        if (data := self._cache.get(steamid64)) is not None:
+            return data
+
+        if self.rate_limit is not None and not self.rate_limit.has():
+            raise FaceitUnavailable
+
+        if not self.breaker.allows():
+            raise FaceitUnavailable
+
+        if self.rate_limit is not None:
+            self.rate_limit.consume()
+
+        try:
+            data = await self._request_player(steamid64)
+        except asyncio.CancelledError:
+            self.breaker.release()
+            raise
+        except Exception as e:  # transport errors as well as unexpected payloads
+            self.breaker.record_failure()
+            raise FaceitUnavailable from e
+
+        self.breaker.record_success()
+        self._cache[steamid64] = data
+        return data
+
+    async def _get_json(self, path: str, params: dict = None):
+        response = await self._client.get(path, params=params)
+        response.raise_for_status()
+        return response.json()
+
+    async def _request_player(self, steamid64: int) -> FaceitData:
+        results = (await self._get_json('/search/v2/players', {'query': steamid64}))['payload']['results']
+        if not results:
+            return FaceitData()
+
+        faceit_elo = faceit_lvl = None
+
+        cs2_users = [user for user in results for game in user['games'] if game['name'] == 'cs2']
+        if cs2_users:
+            user = cs2_users[0]
+            elo_data = (await self._get_json(f'/users/v1/users/{user["id"]}')).get('payload')
+
+            if elo_data:
+                elo_data = elo_data['games']['cs2']
+
+                faceit_elo = elo_data.get('faceit_elo', 0)
+                faceit_lvl = elo_data.get('skill_level', 0)
+        else:
+            user = results[0]
+
+        faceit_url = self.PLAYER_PAGE_URL.format(user['nickname'])
+        faceit_ban = ('banned' in user.get('status', ''))
+
+        return FaceitData(faceit_url, faceit_elo, faceit_lvl, faceit_ban)
+
+    async def close(self):
+        await self._client.aclose()
+
+
+# Local stand-in
+
+
+class FaceitStubServer:
+    """
+    Minimal local imitation of the FACEIT endpoints used by ``FaceitAPI``.
+
+    Made to measure profile latency when FACEIT is slow or down without touching the real thing.
+    ``mode`` can be switched on the fly: ``'ok'``, ``'slow'`` (responds after ``delay`` seconds)
+    or ``'down'`` (responds with 503).
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, *, mode: str = 'ok', delay: float = 10):
+        self.host = host
+        self.port = port
+        self.mode = mode
+        self.delay = delay
+        self.requests_served = 0
+
+        self._server: asyncio.Server | None = None
+
+    @property
+    def base_url(self) -> str:
+        return f'http://{self.host}:{self.port}'
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *_):
+        await self.stop()
+
+    @staticmethod
+    def _player_payload(path: str) -> dict:
+        url = urlsplit(path)
+        if url.path == '/search/v2/players':
+            query = parse_qs(url.query).get('query', [''])[0]
+            return {'payload': {'results': [{'id': query, 'nickname': f'stub_{query[-4:]}',
+                                             'status': 'AVAILABLE', 'games': [{'name': 'cs2'}]}]}}
+        return {'payload': {'games': {'cs2': {'faceit_elo': 2000, 'skill_level': 10}}}}
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while request_line := await reader.readline():
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):  # skip headers
+                    pass
+
+                self.requests_served += 1
+                if self.mode == 'slow':
+                    await asyncio.sleep(self.delay)
+
+                if self.mode == 'down':
+                    status, body = '503 Service Unavailable', b'{}'
+                else:
+                    path = request_line.decode().split()[1]
+                    status, body = '200 OK', json.dumps(self._player_payload(path)).encode()
+
+                writer.write(f'HTTP/1.1 {status}\r\n'
+                             f'Content-Type: application/json\r\n'
+                             f'Content-Length: {len(body)}\r\n'
+                             f'\r\n'.encode() + body)
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
@@ -8,9 +8,10 @@ from typing import NamedTuple, TYPE_CHECKING, Any
 from zoneinfo import ZoneInfo
 
 from functions import utime, caching
+from .http_cache import HTTPCache
 from .states import States
 from .steam_webapi import SteamWebAPI
-from .protobufs import ScoreLeaderboardData
+from .protobufs import parse_detail_data
 
 if TYPE_CHECKING:
     from pathlib import Path
@@ -23,7 +24,7 @@ __all__ = ('GameVersion', 'GameVersionData',
            'ExchangeRate', 'ExchangeRateData',
            'GameServers', 'OverallGameServersData', 'ServerStatusData', 'MatchmakingStatsData',
            'LeaderboardStats',
-           'drop_cap_reset_timer', 'LEADERBOARD_API_REGIONS')
+           'drop_cap_reset_timer', 'is_maintenance_window', 'LEADERBOARD_API_REGIONS')
 
 
 CS2_LEADERBOARD_API = 'https://api.steampowered.com/ICSGOServers_730/GetLeaderboardEntries/v1/' \
@@ -36,7 +37,6 @@ HOUR = 60 * MINUTE
 VALVE_TIMEZONE = ZoneInfo('America/Los_Angeles')
 
 
-SLD = ScoreLeaderboardData()
 MAPS = {1: 'ancient',
         2: 'nuke',
         3: 'dust2',
@@ -120,6 +120,13 @@ class ExchangeRateData(NamedTuple):
         return self._asdict()
 
 
+def is_maintenance_window(now: dt.datetime = None) -> bool:
+    """Whether it's the time of the weekly Steam maintenance (Tuesday night to Wednesday morning, UTC)."""
+
+    now = now or utime.utcnow()
+    return (now.weekday() == 1 and now.hour > 21) or (now.weekday() == 2 and now.hour < 4)
+
+
 @dataclass(frozen=True, slots=True)
 class BasicServerStatusData:
     info_requested_datetime: dt.datetime
@@ -127,12 +134,9 @@ class BasicServerStatusData:
     sessions_logon_state: State
 
     def is_maintenance(self):
-        now = utime.utcnow()
-
-        between_tuesday_and_wednesday = (now.weekday() == 1 and now.hour > 21) or (now.weekday() == 2 and now.hour < 4)
         game_coordinator_is_fine = (self.game_coordinator_state is States.NORMAL)
         sessions_logon_is_fine = (self.sessions_logon_state is States.NORMAL)
-        return between_tuesday_and_wednesday and not (game_coordinator_is_fine and sessions_logon_is_fine)
+        return is_maintenance_window() and not (game_coordinator_is_fine and sessions_logon_is_fine)
 
     def asdict(self):
         return dataclasses.asdict(self)
@@ -179,8 +183,14 @@ class GameVersion:
     CS2_VERSION_DATA_URL = 'https://raw.githubusercontent.com/SteamDatabase/GameTracking-CS2/master/game/csgo/steam.inf'
 
     @classmethod
-    def request(cls, session: requests.Session):
-        cs2_data = session.get(cls.CS2_VERSION_DATA_URL).text
+    def request(cls, session: requests.Session, cache: HTTPCache = None):
+        if cache is None:
+            return cls.parse(session.get(cls.CS2_VERSION_DATA_URL).content)
+        return cache.get(session, 'steam.inf', cls.CS2_VERSION_DATA_URL, cls.parse)
+
+    @classmethod
+    def parse(cls, data: bytes):
+        cs2_data = data.decode()
         config_entries = (line for line in cs2_data.split('\n') if line)
 
         options = {}
@@ -237,11 +247,8 @@ class ExchangeRate:
         r = webapi.get_asset_prices(730)['result']['assets']
         key_price = [item for item in r if item['classid'] == '1544098059'][0]['prices']
 
-        for currency in cls.UNDEFINED_CURRENCIES:
-            if currency in key_price:
-                del key_price[currency]
-
-        prices = {k: v / 100 for k, v in key_price.items()}
+        # the response can be shared with the HTTP cache, so it's not modified
+        prices = {k: v / 100 for k, v in key_price.items() if k not in cls.UNDEFINED_CURRENCIES}
         formatted_prices = {k: f'{v:.0f}' if v % 1 == 0 else f'{v:.2f}'
                             for k, v in prices.items()}
 
@@ -367,6 +374,7 @@ class LeaderboardStats(NamedTuple):
     last_wins: dict[str, int]
     timestamp: int
     region: str
+    last_wins_packed: int = 0  # recent wins on every map, 4 bits per map
 
     @classmethod
     def from_json(cls, data):
@@ -374,12 +382,8 @@ class LeaderboardStats(NamedTuple):
         rating = data['score'] >> 15
         name = data['name']
 
-        detail_data = data['detailData']
-        detail_data = detail_data[2:].rstrip('0')
-        detail_data = SLD.parse(bytes.fromhex(detail_data))
-
         last_wins = {map_name: 0 for map_name in MAPS.values()}
-        stats = {entry.tag: entry.val for entry in detail_data.matchentries}
+        stats = parse_detail_data(data['detailData'])
 
         wins = stats.get(16, -1)
         ties = stats.get(17, -1)
@@ -390,7 +394,7 @@ class LeaderboardStats(NamedTuple):
         timestamp = stats.get(20, -1)
         region = REGIONS.get(stats.get(21), 'unknown')
 
-        return cls(rank, rating, name, wins, ties, losses, last_wins, timestamp, region)
+        return cls(rank, rating, name, wins, ties, losses, last_wins, timestamp, region, stats.get(19, 0))
 
     @classmethod
     def converter(cls, data: list[Any]):
@@ -407,21 +411,26 @@ class LeaderboardStats(NamedTuple):
         return [LeaderboardStats.from_json(person) for person in data]
 
     @staticmethod
-    def request_world(session: requests.Session):
-        world_leaderboard_data = session.get(CS2_LEADERBOARD_API).json()
-        world_leaderboard_data = world_leaderboard_data['result']['entries']
-        world_leaderboard_data = world_leaderboard_data[:10]
+    def parse(data: bytes):
+        leaderboard_data = json.loads(data)['result']['entries']
+
+        return [LeaderboardStats.from_json(person) for person in leaderboard_data]
+
+    @staticmethod
+    def request(session: requests.Session, api_link: str, cache: HTTPCache = None) -> list[LeaderboardStats]:
+        """Get the full leaderboard."""
 
-        return [LeaderboardStats.from_json(person).asdict() for person in world_leaderboard_data]
+        if cache is None:
+            return LeaderboardStats.parse(session.get(api_link).content)
+        return cache.get(session, 'leaderboard', api_link, LeaderboardStats.parse)
 
     @staticmethod
-    def request_regional(session: requests.Session, region: str):
-        api_link = CS2_LEADERBOARD_API + f'_{region}'
-        regional_leaderboard_data = session.get(api_link).json()
-        regional_leaderboard_data = regional_leaderboard_data['result']['entries']
-        regional_leaderboard_data = regional_leaderboard_data[:10]
+    def request_world(session: requests.Session, cache: HTTPCache = None):
+        return LeaderboardStats.request(session, CS2_LEADERBOARD_API, cache)
 
-        return [LeaderboardStats.from_json(person).asdict() for person in regional_leaderboard_data]
+    @staticmethod
+    def request_regional(session: requests.Session, region: str, cache: HTTPCache = None):
+        return LeaderboardStats.request(session, CS2_LEADERBOARD_API + f'_{region}', cache)
 
     @staticmethod
     def cached_world_stats(filename: str | Path):
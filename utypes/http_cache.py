@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+from collections import defaultdict
+import hashlib
+import json
+import logging
+from pathlib import Path
+from typing import Any, Callable, NamedTuple
+
+import requests
+
+
+__all__ = ('HTTPCache', 'UpstreamStats')
+
+
+class _Entry(NamedTuple):
+    etag: str | None
+    last_modified: str | None
+    digest: str  # of the body
+
+
+class UpstreamStats:
+    __slots__ = ('requests', 'not_modified', 'unchanged')
+
+    def __init__(self):
+        self.requests = 0
+        self.not_modified = 0  # answered with 304
+        self.unchanged = 0  # answered with 200, but the same body
+
+    @property
+    def hits(self) -> int:
+        return self.not_modified + self.unchanged
+
+    @property
+    def hit_ratio(self) -> float:
+        return self.hits / self.requests if self.requests else 0.
+
+    def asdict(self) -> dict:
+        return {'requests': self.requests,
+                'not_modified': self.not_modified,
+                'unchanged': self.unchanged,
+                'hit_ratio': self.hit_ratio}
+
+
+class HTTPCache:
+    """
+    Stores response bodies with their validators (``ETag``, ``Last-Modified``) on disk
+    and makes requests conditional, so unchanged resources aren't downloaded again.
+
+    The parsed value of the latest body is kept in memory, so a 304 response (or a 200 one
+    with the same body, for upstreams without validators) returns it without parsing anything.
+    Bodies survive restarts; parsed values are rebuilt from them on first use.
+    """
+
+    def __init__(self, directory: str | Path):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        self.stats: defaultdict[str, UpstreamStats] = defaultdict(UpstreamStats)
+        self._entries: dict[str, _Entry] = {}
+        self._parsed: dict[str, tuple[str, Any]] = {}  # key: (body digest, value)
+
+    def _path(self, key: str, suffix: str) -> Path:
+        return self.directory / f'{hashlib.sha1(key.encode()).hexdigest()}.{suffix}'
+
+    def _entry(self, key: str) -> _Entry | None:
+        if key not in self._entries:
+            try:
+                with open(self._path(key, 'json'), encoding='utf-8') as f:
+                    self._entries[key] = _Entry(**json.load(f))
+            except (FileNotFoundError, json.JSONDecodeError, TypeError):
+                return None
+
+        return self._entries[key]
+
+    def _store(self, key: str, response: requests.Response, digest: str, body: bytes = None):
+        if body is not None:  # the body goes first, so the metadata never points to a missing one
+            self._path(key, 'body').write_bytes(body)
+
+        entry = _Entry(response.headers.get('ETag'), response.headers.get('Last-Modified'), digest)
+        with open(self._path(key, 'json'), 'w', encoding='utf-8') as f:
+            json.dump(entry._asdict(), f)
+        self._entries[key] = entry
+
+    def _value(self, key: str, entry: _Entry, parse: Callable[[bytes], Any]) -> Any:
+        digest, value = self._parsed.get(key, (None, None))
+        if digest != entry.digest:
+            value = parse(self._path(key, 'body').read_bytes())
+            self._parsed[key] = (entry.digest, value)
+        return value
+
+    def conditional_headers(self, key: str) -> dict[str, str]:
+        entry = self._entry(key)
+        if entry is None or not self._path(key, 'body').exists():
+            return {}
+
+        headers = {}
+        if entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry.last_modified:
+            headers['If-Modified-Since'] = entry.last_modified
+        return headers
+
+    def resolve(self, upstream: str, key: str, response: requests.Response, parse: Callable[[bytes], Any]) -> Any:
+        """
+        Get the parsed value for the response to a request sent with ``conditional_headers(key)``.
+
+        Only successful responses are stored, anything else is parsed and returned as is.
+        """
+
+        stats = self.stats[upstream]
+        stats.requests += 1
+
+        entry = self._entry(key)
+        if response.status_code == 304 and entry is not None:
+            stats.not_modified += 1
+            return self._value(key, entry, parse)
+
+        body = response.content
+        if response.status_code != 200:
+            return parse(body)
+
+        digest = hashlib.sha1(body).hexdigest()
+        if entry is not None and entry.digest == digest:
+            stats.unchanged += 1
+            self._store(key, response, digest)  # validators could've been changed
+            return self._value(key, entry, parse)
+
+        value = parse(body)
+        self._store(key, response, digest, body)
+        self._parsed[key] = (digest, value)
+        return value
+
+    def get(self, session: requests.Session, upstream: str, url: str, parse: Callable[[bytes], Any], *,
+            headers: dict = None, **kwargs) -> Any:
+        """Send a conditional GET request and get the parsed value of the (possibly cached) body."""
+
+        key = url
+        if params := kwargs.get('params'):
+            key += '?' + '&'.join(f'{k}={v}' for k, v in sorted(params.items()))
+
+        headers = (headers or {}) | self.conditional_headers(key)
+        response = session.get(url, headers=headers, **kwargs)
+        return self.resolve(upstream, key, response, parse)
+
+    def log_stats(self):
+        for upstream, stats in self.stats.items():
+            logging.info(f'HTTP cache of {upstream}: {stats.hit_ratio:.1%} hits of {stats.requests} requests '
+                         f'({stats.not_modified} not modified, {stats.unchanged} unchanged)')
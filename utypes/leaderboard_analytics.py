@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+from typing import NamedTuple
+
+import numpy as np
+
+from .game_data import MAPS
+from .leaderboard_store import LeaderboardStore, LEADERBOARD_API_REGIONS
+
+
+__all__ = ('LeaderboardAnalytics', 'RATING_TIERS', 'WIN_RATE_QUANTILES')
+
+
+RATING_TIERS = (0, 5000, 10000, 15000, 20000, 25000, 30000)  # lower bounds of CS Rating colors
+WIN_RATE_QUANTILES = (0.25, 0.5, 0.75)
+
+_MAP_IDS = np.array(list(MAPS), dtype=np.uint32)
+_MAP_SHIFTS = 28 - 4 * _MAP_IDS  # map N takes the N-th 4 bits, counting from the most significant ones
+
+
+class LeaderboardAnalytics(NamedTuple):
+    top: int  # number of the world's best players the map wins are counted among
+    map_wins: dict[str, float]  # share of recent wins on every map
+    rating_tiers: dict[str, np.ndarray]  # region: share of players in every tier of RATING_TIERS
+    win_rates: dict[str, np.ndarray]  # board: WIN_RATE_QUANTILES of the win rate
+
+    @staticmethod
+    def unpack_last_wins(packed: np.ndarray) -> np.ndarray:
+        """Recent wins on every map of MAPS, one row per player."""
+
+        return (packed.astype(np.uint32)[:, None] >> _MAP_SHIFTS) & 0xF
+
+    @classmethod
+    def compute(cls, store: LeaderboardStore, top: int = 100) -> LeaderboardAnalytics:
+        map_wins = {}
+        if (world := store.tables.get('world')) is not None:
+            wins = cls.unpack_last_wins(world.columns['last_wins_packed'][:top]).sum(axis=0)
+            shares = wins / wins.sum() if wins.sum() else np.zeros(len(MAPS))
+            map_wins = dict(zip(MAPS.values(), shares.tolist()))
+
+        rating_tiers = {}
+        for region in LEADERBOARD_API_REGIONS:
+            table = store.tables.get(region)
+            if table is None or not len(table):
+                continue
+            tiers = np.searchsorted(RATING_TIERS, table.columns['rating'], side='right') - 1
+            counts = np.bincount(np.maximum(tiers, 0), minlength=len(RATING_TIERS))
+            rating_tiers[region] = counts / len(table)
+
+        win_rates = {}
+        for board, table in store.tables.items():
+            wins, ties, losses = (table.columns[column].astype(np.int64) for column in ('wins', 'ties', 'losses'))
+            matches = wins + ties + losses
+            known = (wins >= 0) & (ties >= 0) & (losses >= 0) & (matches > 0)  # -1 if the field is missing
+            if known.any():
+                win_rates[board] = np.quantile(wins[known] / matches[known], WIN_RATE_QUANTILES)
+
+        return cls(min(top, len(world)) if world is not None else 0, map_wins, rating_tiers, win_rates)
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+
+from .leaderboard_store import LeaderboardStore, save_arrays, LEADERBOARD_BOARDS
+
+
+__all__ = ('LeaderboardHistory', 'LeaderboardRecord')
+
+
+DAY = 24 * 60 * 60
+
+
+class LeaderboardRecord(NamedTuple):
+    generation: int  # when it was fetched
+    rank: int
+    rating: int
+    timestamp: int  # of the player's last match
+
+
+class LeaderboardHistory:
+    """
+    Generations of the leaderboards, kept as rows of typed columns with names in a separate table.
+
+    A player only gets a new row when the ``timestamp`` of their entry changes, that is, after they've played,
+    so unchanged entries aren't stored again with every generation. Entries are matched to the records by name
+    and timestamp, which tells apart players who share a name. Rows older than ``RETENTION`` are dropped.
+    """
+
+    RETENTION = 90 * DAY
+    COLUMNS = {'generation': np.int64,
+               'board': np.uint8,  # index in LEADERBOARD_BOARDS
+               'name_id': np.int32,
+               'rank': np.int32,
+               'rating': np.int32,
+               'timestamp': np.int64}
+
+    __slots__ = ('columns', 'names')
+
+    def __init__(self, columns: dict[str, np.ndarray] = None, names: np.ndarray = None):
+        self.columns = columns or {column: np.empty(0, dtype) for column, dtype in self.COLUMNS.items()}
+        self.names = names if names is not None else np.empty(0, dtype=str)  # sorted and unique
+
+    def __len__(self):
+        return len(self.columns['generation'])
+
+    @classmethod
+    def load(cls, path: str | Path) -> LeaderboardHistory:
+        try:
+            with np.load(path, allow_pickle=False) as arrays:
+                return cls({column: arrays[column] for column in cls.COLUMNS}, arrays['names'])
+        except FileNotFoundError:
+            return cls()
+
+    def save(self, path: str | Path):
+        save_arrays(path, self.columns | {'names': self.names})
+
+    @staticmethod
+    def _recorded(columns: dict[str, np.ndarray], board_i: int,
+                  name_ids: np.ndarray, timestamps: np.ndarray) -> np.ndarray:
+        """A mask of the (name id, timestamp) pairs that the board already has a record of."""
+
+        rows = np.flatnonzero(columns['board'] == board_i)
+        # a pair is packed into a single integer: the name id and the index of the timestamp among all of them
+        unique_timestamps, timestamp_ids = np.unique(np.concatenate([columns['timestamp'][rows], timestamps]),
+                                                     return_inverse=True)
+        all_name_ids = np.concatenate([columns['name_id'][rows], name_ids]).astype(np.int64)
+        keys = all_name_ids * len(unique_timestamps) + timestamp_ids.ravel()
+        return np.isin(keys[len(rows):], keys[:len(rows)])
+
+    def append(self, store: LeaderboardStore) -> int:
+        """Add the entries of the store's generation whose timestamp has changed. Returns the number of added rows."""
+
+        new_names = np.unique(np.concatenate([self.names, *(table.names_array() for table in store.tables.values())]))
+        old_name_ids = np.searchsorted(new_names, self.names)
+        columns = self.columns | {'name_id': old_name_ids[self.columns['name_id']].astype(self.COLUMNS['name_id'])}
+
+        added = {column: [] for column in self.COLUMNS}
+        for board_i, board in enumerate(LEADERBOARD_BOARDS):
+            table = store.tables.get(board)
+            if table is None or not len(table):
+                continue
+
+            name_ids = np.searchsorted(new_names, table.names_array())
+            changed = ~self._recorded(columns, board_i, name_ids, table.columns['timestamp'])
+
+            count = int(changed.sum())
+            added['generation'].append(np.full(count, store.generation, self.COLUMNS['generation']))
+            added['board'].append(np.full(count, board_i, self.COLUMNS['board']))
+            added['name_id'].append(name_ids[changed].astype(self.COLUMNS['name_id']))
+            for column in ('rank', 'rating', 'timestamp'):
+                added[column].append(table.columns[column][changed].astype(self.COLUMNS[column]))
+
+        columns = {column: np.concatenate([values, *added[column]]) for column, values in columns.items()}
+        added_count = len(columns['generation']) - len(self)
+
+        # drop expired rows and the names nobody has anymore
+        kept = columns['generation'] >= store.generation - self.RETENTION
+        columns = {column: values[kept] for column, values in columns.items()}
+        used_name_ids, name_ids = np.unique(columns['name_id'], return_inverse=True)
+        columns['name_id'] = name_ids.astype(self.COLUMNS['name_id'])
+
+        self.columns = columns
+        self.names = new_names[used_name_ids]
+        return added_count
+
+    def player(self, board: str, name: str) -> list[LeaderboardRecord]:
+        """Records of the player on the board, oldest first."""
+
+        name_id = np.searchsorted(self.names, name)
+        if name_id == len(self.names) or self.names[name_id] != name:
+            return []
+
+        columns = self.columns
+        rows = np.flatnonzero((columns['board'] == LEADERBOARD_BOARDS.index(board)) & (columns['name_id'] == name_id))
+        rows = rows[np.argsort(columns['generation'][rows], kind='stable')]
+        return [LeaderboardRecord(*values) for values in zip(columns['generation'][rows].tolist(),
+                                                              columns['rank'][rows].tolist(),
+                                                              columns['rating'][rows].tolist(),
+                                                              columns['timestamp'][rows].tolist())]
@@ -0,0 +1,292 @@
+from __future__ import annotations
+
+import bisect
+import os
+from pathlib import Path
+import tempfile
+from typing import NamedTuple
+
+import numpy as np
+
+from .game_data import LeaderboardStats, LEADERBOARD_API_REGIONS, REGIONS
+
+
+__all__ = ('LeaderboardRow', 'LeaderboardStore', 'LeaderboardTable', 'match_names', 'name_occurrences',
+           'save_arrays', 'LEADERBOARD_BOARDS')
+
+
+LEADERBOARD_BOARDS = ('world', *LEADERBOARD_API_REGIONS)
+
+_REGION_NAMES = ('unknown', *(REGIONS.get(code, 'unknown') for code in range(1, max(REGIONS) + 1)))
+_REGION_CODES = {name: code for code, name in REGIONS.items()}
+
+NEW_ENTRY = np.iinfo(np.int32).min  # rank delta of players who weren't on the board before
+
+
+def name_occurrences(names: np.ndarray) -> np.ndarray:
+    """How many times each name occurs before its own position, 0 unless the name is taken by several players."""
+
+    order = np.argsort(names, kind='stable')
+    sorted_names = names[order]
+    occurrences = np.empty(len(names), dtype=np.intp)
+    occurrences[order] = np.arange(len(names)) - np.searchsorted(sorted_names, sorted_names)
+    return occurrences
+
+
+def match_names(sorted_names: np.ndarray, names: np.ndarray,
+                occurrences: np.ndarray = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Find names in a sorted array of names.
+
+    With ``occurrences`` (see ``name_occurrences``) a repeated name is matched to the same occurrence of it
+    in ``sorted_names``, which has to be sorted stably, rather than to the first one.
+
+    Returns:
+        A mask of the found names and their indices in ``sorted_names``.
+    """
+
+    if not len(sorted_names) or not len(names):
+        return np.zeros(len(names), dtype=bool), np.empty(0, dtype=np.intp)
+
+    positions = np.searchsorted(sorted_names, names)
+    if occurrences is not None:
+        positions += occurrences
+    in_bounds = positions < len(sorted_names)
+    found = in_bounds & (sorted_names[np.where(in_bounds, positions, 0)] == names)
+    return found, positions[found]
+
+
+def save_arrays(path: str | Path, arrays: dict[str, np.ndarray]):
+    """Save arrays to an .npz file, replacing it atomically."""
+
+    path = Path(path)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+class LeaderboardRow(NamedTuple):
+    board: str
+    rank: int
+    rating: int
+    name: str
+    wins: int
+    ties: int
+    losses: int
+    region: str
+    rank_delta: int | None = 0  # since the previous generation, positive is up; None if the player is new
+    rating_delta: int = 0
+
+
+class LeaderboardTable:
+    """
+    One full leaderboard: every numeric field is a typed column, names are a list of strings.
+
+    Rank and rating deltas since the previous generation are kept as columns too (see ``diff``).
+    """
+
+    COLUMNS = {'rank': np.int32,
+               'rating': np.int32,
+               'wins': np.int32,
+               'ties': np.int32,
+               'losses': np.int32,
+               'region': np.uint8,
+               'timestamp': np.int64,
+               'last_wins_packed': np.uint32,
+               'rank_delta': np.int32,
+               'rating_delta': np.int32}
+    _COMPUTED_COLUMNS = ('region', 'rank_delta', 'rating_delta')
+
+    __slots__ = ('board', 'columns', 'names')
+
+    def __init__(self, board: str, columns: dict[str, np.ndarray], names: list[str]):
+        self.board = board
+        self.columns = columns
+        self.names = names
+
+    @classmethod
+    def from_stats(cls, board: str, stats: list[LeaderboardStats]) -> LeaderboardTable:
+        columns = {column: np.fromiter((getattr(person, column) for person in stats), dtype, len(stats))
+                   for column, dtype in cls.COLUMNS.items() if column not in cls._COMPUTED_COLUMNS}
+        columns['region'] = np.fromiter((_REGION_CODES.get(person.region, 0) for person in stats),
+                                        cls.COLUMNS['region'], len(stats))
+        columns['rank_delta'] = np.zeros(len(stats), cls.COLUMNS['rank_delta'])
+        columns['rating_delta'] = np.zeros(len(stats), cls.COLUMNS['rating_delta'])
+        return cls(board, columns, [person.name for person in stats])
+
+    def names_array(self) -> np.ndarray:
+        return np.array(self.names, dtype=str)
+
+    def diff(self, previous: LeaderboardTable | None):
+        """
+        Fill the rank and rating deltas since the previous generation of the board. Players are matched by name,
+        players who share a name by the order they are in on the board.
+
+        Without the previous generation there is nothing to compare with, so the deltas stay zero.
+        """
+
+        if previous is None:
+            return
+
+        rank_delta = np.full(len(self), NEW_ENTRY, self.COLUMNS['rank_delta'])
+        rating_delta = np.zeros(len(self), self.COLUMNS['rating_delta'])
+
+        previous_names = previous.names_array()
+        order = np.argsort(previous_names, kind='stable')
+        names = self.names_array()
+        found, positions = match_names(previous_names[order], names, name_occurrences(names))
+        previous_rows = order[positions]
+
+        rank_delta[found] = previous.columns['rank'][previous_rows] - self.columns['rank'][found]
+        rating_delta[found] = self.columns['rating'][found] - previous.columns['rating'][previous_rows]
+
+        self.columns['rank_delta'] = rank_delta
+        self.columns['rating_delta'] = rating_delta
+
+    def __len__(self):
+        return len(self.names)
+
+    def row(self, i: int) -> LeaderboardRow:
+        columns = self.columns
+        rank_delta = int(columns['rank_delta'][i])
+        return LeaderboardRow(self.board,
+                              int(columns['rank'][i]),
+                              int(columns['rating'][i]),
+                              self.names[i],
+                              int(columns['wins'][i]),
+                              int(columns['ties'][i]),
+                              int(columns['losses'][i]),
+                              _REGION_NAMES[columns['region'][i]],
+                              None if rank_delta == NEW_ENTRY else rank_delta,
+                              int(columns['rating_delta'][i]))
+
+    def page(self, number: int, size: int = 10) -> list[LeaderboardRow]:
+        """Rows of the page, counting from 0."""
+
+        return [self.row(i) for i in range(number * size, min((number + 1) * size, len(self)))]
+
+    def pages_count(self, size: int = 10) -> int:
+        return -(-len(self) // size)
+
+    def to_arrays(self) -> dict[str, np.ndarray]:
+        """Columns and the names as a string table: UTF-8 bytes of every name and their end offsets."""
+
+        encoded = [name.encode() for name in self.names]
+        arrays = {f'{self.board}.{column}': values for column, values in self.columns.items()}
+        arrays[f'{self.board}.names'] = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        arrays[f'{self.board}.name_ends'] = np.cumsum([len(name) for name in encoded], dtype=np.int64)
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, board: str, arrays) -> LeaderboardTable:
+        ends = arrays[f'{board}.name_ends']
+        columns = {column: arrays[f'{board}.{column}'] if f'{board}.{column}' in arrays else np.zeros(len(ends), dtype)
+                   for column, dtype in cls.COLUMNS.items()}  # files saved before a column was added
+
+        blob = arrays[f'{board}.names'].tobytes()
+        ends = ends.tolist()
+        names = [blob[start:end].decode() for start, end in zip([0, *ends], ends)]
+        return cls(board, columns, names)
+
+
+class LeaderboardStore:
+    """
+    Full leaderboards of every region, saved by the collector and loaded by the bot.
+
+    Player search uses a prefix index over all boards: case-folded names sorted together with
+    their board and row, so a query is a binary search plus reading the matching rows.
+    """
+
+    __slots__ = ('tables', 'generation', '_index_names', '_index_boards', '_index_rows')
+
+    _loaded: dict[Path, tuple[float, LeaderboardStore]] = {}  # path: (mtime, store)
+
+    def __init__(self, tables: dict[str, LeaderboardTable], generation: int = 0):
+        self.tables = tables
+        self.generation = generation
+
+        entries = sorted((name.casefold(), board_i, row_i)
+                         for board_i, table in enumerate(tables.values())
+                         for row_i, name in enumerate(table.names))
+        self._index_names = [name for name, _, _ in entries]
+        self._index_boards = np.fromiter((board_i for _, board_i, _ in entries), np.uint8, len(entries))
+        self._index_rows = np.fromiter((row_i for _, _, row_i in entries), np.int32, len(entries))
+
+    @classmethod
+    def from_stats(cls, boards: dict[str, list[LeaderboardStats]], generation: int = 0, *,
+                   previous: LeaderboardStore = None) -> LeaderboardStore:
+        """Build a new generation, with rank and rating deltas since the ``previous`` one if it's passed."""
+
+        tables = {}
+        for board, stats in boards.items():
+            table = tables[board] = LeaderboardTable.from_stats(board, stats)
+            if previous is not None:
+                table.diff(previous.tables.get(board))
+        return cls(tables, generation)
+
+    def locate(self, query: str, limit: int = 10) -> tuple[int, list[tuple[str, int]]]:
+        """
+        Find players whose names start with the query, case-insensitively.
+
+        Returns:
+            The total number of matches and the board and row index of up to ``limit`` of them, ordered by name.
+        """
+
+        prefix = query.casefold()
+        if not prefix:
+            return 0, []
+
+        start = bisect.bisect_left(self._index_names, prefix)
+        end = bisect.bisect_left(self._index_names, prefix + '\U0010ffff', start)
+
+        boards = list(self.tables)
+        return end - start, [(boards[board_i], row_i)
+                             for board_i, row_i in zip(self._index_boards[start:min(end, start + limit)].tolist(),
+                                                       self._index_rows[start:min(end, start + limit)].tolist())]
+
+    def search(self, query: str, limit: int = 10) -> tuple[int, list[LeaderboardRow]]:
+        """Like ``locate``, but returns the rows themselves."""
+
+        total, found = self.locate(query, limit)
+        return total, [self.tables[board].row(row_i) for board, row_i in found]
+
+    def page(self, board: str, number: int, size: int = 10) -> list[LeaderboardRow]:
+        table = self.tables.get(board)
+        return table.page(number, size) if table is not None else []
+
+    def save(self, path: str | Path):
+        """Replaces the file atomically, like ``caching.dump_cache``."""
+
+        arrays = {'generation': np.array(self.generation, dtype=np.int64)}
+        for table in self.tables.values():
+            arrays |= table.to_arrays()
+
+        save_arrays(path, arrays)
+
+    @classmethod
+    def load(cls, path: str | Path) -> LeaderboardStore:
+        with np.load(path, allow_pickle=False) as arrays:
+            tables = {board: LeaderboardTable.from_arrays(board, arrays)
+                      for board in LEADERBOARD_BOARDS if f'{board}.rank' in arrays}
+            return cls(tables, int(arrays['generation']))
+
+    @classmethod
+    def cached(cls, path: str | Path) -> LeaderboardStore:
+        """Get the store saved at the path, only loading it again after the file has changed."""
+
+        path = Path(path)
+        try:
+            mtime = path.stat().st_mtime
+        except FileNotFoundError:
+            return cls({})
+
+        loaded_mtime, store = cls._loaded.get(path, (None, None))
+        if loaded_mtime != mtime:
+            store = cls.load(path)
+            cls._loaded[path] = (mtime, store)
+        return store
@@ -1,24 +1,44 @@
 from __future__ import annotations
 
-from dataclasses import astuple, dataclass
+import asyncio
+from dataclasses import astuple, dataclass, replace
 from enum import auto, StrEnum
+from operator import itemgetter
 import re
 from typing import NamedTuple
 
+from cachetools import TTLCache
+import numpy as np
 from steam import steamid
 from steam.steamid import SteamID
 import requests
 
 import config
-from .steam_webapi import SteamWebAPI
+from .faceit import FaceitAPI, FaceitData, FaceitUnavailable
+from .ratelimit import acquire_all, TokenBucket
+from .steam_webapi import SteamKeyRejected, SteamKeysExhausted, SteamWebAPI
+from .transport import EndpointUnavailable
 
 
-__all__ = ('ErrorCode', 'ParseUserStatsError', 'ProfileInfo', 'UserGameStats')
+__all__ = ('ErrorCode', 'ParseUserStatsError', 'ProfileInfo', 'StatsComparison', 'UserGameStats')
 
 STEAM_PROFILE_LINK_PATTERN = re.compile(r'(?:https?://)?steamcommunity\.com/(?:profiles|id)/[a-zA-Z0-9]+(/?)\w')
+STEAM_PROFILES_LINK_PATTERN = re.compile(r'(?:https?://)?steamcommunity\.com/profiles/(\d+)/?')
+STATUS_STEAMID_PATTERN = re.compile(r'STEAM_[0-5]:[01]:\d+|\[U:1:\d+]|(?<!\d)7656119\d{10}(?!\d)')
+LOBBY_MAX_PLAYERS = 100  # Steam WebAPI limit for batched requests
+STATS_COMPARE_MAX_PLAYERS = 4
+STATS_CACHE_TTL = 10 * 60
+PROFILES_CACHE_TTL = 10 * 60
+# failures left after the transport's retries, its breaker being open, or no key Steam accepts
+STEAM_OUTAGES = (EndpointUnavailable, requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                 SteamKeyRejected)
 _csgofrcode_chars = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"
 
-api = SteamWebAPI(config.STEAM_API_KEY)
+api = SteamWebAPI(getattr(config, 'STEAM_API_KEYS', None) or config.STEAM_API_KEY, lane='users')
+faceit_api = FaceitAPI(rate_limit=TokenBucket.per_minute(60, 120))
+steam_lookups_limit = TokenBucket.per_minute(60, 60)  # shared by all users to protect the API key quota
+stats_cache: TTLCache[int, UserGameStats] = TTLCache(maxsize=1024, ttl=STATS_CACHE_TTL)
+profiles_cache: TTLCache[int, ProfileInfo] = TTLCache(maxsize=4096, ttl=PROFILES_CACHE_TTL)
 
 
 def safe_div(x: float, y: float):
@@ -49,6 +69,8 @@ class ErrorCode(StrEnum):
     PROFILE_IS_PRIVATE = auto()
     UNKNOWN_ERROR = auto()
     NO_STATS_AVAILABLE = auto()
+    RATE_LIMITED = auto()
+    STEAM_UNAVAILABLE = auto()
 
 
 class ParseUserStatsError(Exception):
@@ -63,6 +85,23 @@ class ParseUserStatsError(Exception):
         return self.code == ErrorCode.UNKNOWN_ERROR
 
 
+def raise_for_http_error(e: requests.exceptions.HTTPError):
+    status_code = e.response.status_code
+
+    if status_code == 400:
+        raise ParseUserStatsError(ErrorCode.INVALID_REQUEST)
+    if status_code == 403:
+        raise ParseUserStatsError(ErrorCode.PROFILE_IS_PRIVATE)
+    raise e
+
+
+def acquire_lookup(rate_limit: TokenBucket | None):
+    """Take a token for an upstream lookup from the user's and the global buckets."""
+
+    if not acquire_all(rate_limit, steam_lookups_limit):
+        raise ParseUserStatsError(ErrorCode.RATE_LIMITED)
+
+
 class UserGameStats(NamedTuple):
     steamid: int
     total_time_played: float
@@ -253,29 +292,85 @@ class UserGameStats(NamedTuple):
         return UserGameStats(**stats)
 
     @staticmethod
-    async def get(data: str) -> UserGameStats:
+    async def get(data: str, rate_limit: TokenBucket = None) -> UserGameStats:
         try:
-            _id = parse_steamid(data)
+            _id = await resolve_steamid(data, rate_limit)
+            return await UserGameStats._fetch(_id, rate_limit)
+        except requests.exceptions.HTTPError as e:  # maybe should only wrap the request itself with these?
+            raise_for_http_error(e)
 
-            response = api.get_user_game_stats(steamid=_id.as_64, appid=730)
-            if not response:
-                raise ParseUserStatsError(ErrorCode.PROFILE_IS_PRIVATE)
+    @staticmethod
+    async def get_many(data: list[str], rate_limit: TokenBucket = None) -> list[UserGameStats]:
+        """Get stats of several users, requesting them concurrently."""
 
-            if response.get('playerstats') is None or response['playerstats'].get('stats') is None:
-                raise ParseUserStatsError(ErrorCode.NO_STATS_AVAILABLE)
+        try:
+            ids = await asyncio.gather(*(resolve_steamid(user, rate_limit) for user in data))
+            return list(await asyncio.gather(*(UserGameStats._fetch(_id, rate_limit) for _id in ids)))
+        except requests.exceptions.HTTPError as e:
+            raise_for_http_error(e)
 
-            stats_dict = {stat['name']: stat['value'] for stat in response['playerstats']['stats']}
-            stats_dict['steamid'] = _id.as_64
+    @staticmethod
+    async def _fetch(_id: SteamID, rate_limit: TokenBucket = None) -> UserGameStats:
+        if (stats := stats_cache.get(_id.as_64)) is not None:  # cache hits are free
+            return stats
 
-            return UserGameStats.from_dict(stats_dict)
-        except requests.exceptions.HTTPError as e:  # maybe should only wrap the request itself with these?
-            status_code = e.response.status_code
+        acquire_lookup(rate_limit)
 
-            if status_code == 400:
-                raise ParseUserStatsError(ErrorCode.INVALID_REQUEST)
-            if status_code == 403:
-                raise ParseUserStatsError(ErrorCode.PROFILE_IS_PRIVATE)
-            raise e
+        try:
+            response = await asyncio.to_thread(api.get_user_game_stats, steamid=_id.as_64, appid=730)
+        except SteamKeysExhausted:
+            raise ParseUserStatsError(ErrorCode.RATE_LIMITED)
+        except STEAM_OUTAGES:
+            raise ParseUserStatsError(ErrorCode.STEAM_UNAVAILABLE)
+        if not response:
+            raise ParseUserStatsError(ErrorCode.PROFILE_IS_PRIVATE)
+
+        if response.get('playerstats') is None or response['playerstats'].get('stats') is None:
+            raise ParseUserStatsError(ErrorCode.NO_STATS_AVAILABLE)
+
+        stats_dict = {stat['name']: stat['value'] for stat in response['playerstats']['stats']}
+        stats_dict['steamid'] = _id.as_64
+
+        stats = stats_cache[_id.as_64] = UserGameStats.from_dict(stats_dict)
+        return stats
+
+    def numeric_values(self) -> tuple[int | float, ...]:
+        """Values of ``NUMERIC_STATS_FIELDS`` in the same order."""
+
+        return _numeric_stats(self)
+
+    @staticmethod
+    def compare(players: list[UserGameStats]) -> StatsComparison:
+        """Compare all numeric stats of the players at once."""
+
+        values = np.array([player.numeric_values() for player in players], dtype=np.float64)
+
+        signed = values * _NUMERIC_STATS_SIGNS
+        best, worst = signed.max(axis=0), signed.min(axis=0)
+        leaders = (signed == best) & (best != worst)  # nobody leads if everyone is equal
+
+        return StatsComparison([player.steamid for player in players], values, leaders)
+
+
+NUMERIC_STATS_FIELDS = tuple(field for field in UserGameStats._fields if field not in ('steamid', 'best_map_name'))
+LOWER_IS_BETTER_STATS = ('total_deaths',)
+
+NUMERIC_STATS_INDEX = {field: i for i, field in enumerate(NUMERIC_STATS_FIELDS)}
+
+_numeric_stats = itemgetter(*(UserGameStats._fields.index(field) for field in NUMERIC_STATS_FIELDS))
+_NUMERIC_STATS_SIGNS = np.array([-1 if field in LOWER_IS_BETTER_STATS else 1 for field in NUMERIC_STATS_FIELDS])
+
+
+class StatsComparison(NamedTuple):
+    steamids: list[int]
+    values: np.ndarray  # players × NUMERIC_STATS_FIELDS
+    leaders: np.ndarray  # same shape, True where the player has the best value
+
+    def column(self, field: str) -> np.ndarray:
+        return self.values[:, NUMERIC_STATS_INDEX[field]]
+
+    def leading(self, field: str) -> np.ndarray:
+        return self.leaders[:, NUMERIC_STATS_INDEX[field]]
 
 
 @dataclass(slots=True)
@@ -296,102 +391,175 @@ class ProfileInfo:
     days_since_last_ban: int
     community_ban: bool
     trade_ban: bool
+    faceit_unavailable: bool = False
+    persona_name: str = ''
 
     @staticmethod
-    def _extract_faceit_data(data: dict):
-        faceit_lvl = faceit_elo = faceit_url = faceit_ban = None
-
-        if data:
-            faceit_result = [user for user in data for game in user['games'] if game['name'] == 'cs2']
+    def _from_api_data(_id: SteamID, bans_data: dict, user_data: dict,
+                       faceit: FaceitData | FaceitUnavailable) -> ProfileInfo:
+        faceit_unavailable = isinstance(faceit, FaceitUnavailable)
+        if faceit_unavailable:
+            faceit = FaceitData()
+
+        account_created = user_data.get('timecreated')
+
+        vanity_url = user_data['profileurl'].split('/')[-2]
+        if vanity_url == str(_id.as_64):
+            vanity_url = None
+
+        vac_bans = bans_data['NumberOfVACBans']
+        game_bans = bans_data['NumberOfGameBans']
+
+        days_since_last_ban = 0
+        if vac_bans or game_bans:
+            days_since_last_ban = bans_data['DaysSinceLastBan']
+
+        community_ban = bans_data['CommunityBanned']
+        trade_ban = (bans_data['EconomyBan'] == 'banned')
+
+        return ProfileInfo(vanity_url,
+                           _id.as_64,
+                           _id.id,
+                           account_created,
+                           _id.invite_url,
+                           _id.as_invite_code,
+                           _id.as_csgo_friend_code,
+                           faceit.url,
+                           faceit.elo,
+                           faceit.lvl,
+                           faceit.ban,
+                           game_bans,
+                           vac_bans,
+                           days_since_last_ban,
+                           community_ban,
+                           trade_ban,
+                           faceit_unavailable,
+                           user_data.get('personaname', ''))
 
-            if faceit_result:
-                user = faceit_result[0]
-                elo_api_link = f'https://api.faceit.com/users/v1/users/{user["id"]}'
-                elo_api_response = api.session.get(elo_api_link, timeout=15).json()
+    @staticmethod
+    def cached(_id: SteamID) -> ProfileInfo | None:
+        """Profile info of the user if it was looked up recently, by anyone."""
 
-                if elo_api_response.get('payload'):
-                    elo_data = elo_api_response['payload']['games']['cs2']
+        if (profile := profiles_cache.get(_id.as_64)) is not None:
+            return replace(profile)  # callers localize the fields in place
+        return None
 
-                    faceit_elo = elo_data.get('faceit_elo', 0)
-                    faceit_lvl = elo_data.get('skill_level', 0)
+    @staticmethod
+    async def get_many(ids: list[SteamID]) -> list[ProfileInfo]:
+        """
+        Get profile info of up to 100 users at once.
+
+        Recently looked up users are taken from the cache, the rest are requested:
+        bans and summaries in one batched call each, FACEIT lookups concurrently.
+        Users without public data are skipped.
+        """
+
+        profiles = {}
+        missing = []
+        for _id in ids:
+            if (profile := ProfileInfo.cached(_id)) is not None:
+                profiles[_id.as_64] = profile
             else:
-                user = data[0]
+                missing.append(_id)
 
-            faceit_url = f'https://faceit.com/en/players/{user["nickname"]}'
-            faceit_ban = ('banned' in user.get('status', ''))
+        if missing:
+            for profile in await ProfileInfo._fetch_many(missing):
+                profiles[profile.steamid64] = profile
+                if not profile.faceit_unavailable:  # otherwise FACEIT is asked again next time
+                    profiles_cache[profile.steamid64] = replace(profile)
 
-        return faceit_elo, faceit_lvl, faceit_url, faceit_ban
+        return [profiles[_id.as_64] for _id in ids if _id.as_64 in profiles]
 
     @staticmethod
-    async def get(data: str) -> ProfileInfo:
+    async def _fetch_many(ids: list[SteamID]) -> list[ProfileInfo]:
+        steamids = [str(_id.as_64) for _id in ids]
+
         try:
-            _id = parse_steamid(data)
+            bans, summaries, faceit_results = await asyncio.gather(
+                asyncio.to_thread(api.get_player_bans, steamids),
+                asyncio.to_thread(api.get_player_summaries, steamids),
+                asyncio.gather(*(faceit_api.get_player(_id.as_64) for _id in ids), return_exceptions=True)
+            )
+        except SteamKeysExhausted:
+            raise ParseUserStatsError(ErrorCode.RATE_LIMITED)
+        except STEAM_OUTAGES:
+            raise ParseUserStatsError(ErrorCode.STEAM_UNAVAILABLE)
+
+        bans = {player['SteamId']: player for player in bans.get('players', [])}
+        summaries = {player['steamid']: player for player in summaries['response']['players']}
+
+        result = []
+        for _id, faceit in zip(ids, faceit_results):
+            if isinstance(faceit, BaseException) and not isinstance(faceit, FaceitUnavailable):
+                raise faceit
 
-            bans = api.get_player_bans(steamids=str(_id.as_64))
-            user_data = api.get_player_summaries(steamids=str(_id.as_64))["response"]["players"][0]
+            bans_data = bans.get(str(_id.as_64))
+            user_data = summaries.get(str(_id.as_64))
+            if not (bans_data and user_data and user_data.get('profileurl')):
+                continue
 
-            vanity = user_data['profileurl']
+            result.append(ProfileInfo._from_api_data(_id, bans_data, user_data, faceit))
 
-            if not (bans and vanity):
+        return result
+
+    @staticmethod
+    async def get(data: str, rate_limit: TokenBucket = None) -> ProfileInfo:
+        try:
+            _id = await resolve_steamid(data, rate_limit)
+            if (profile := ProfileInfo.cached(_id)) is not None:  # cache hits are free
+                return profile
+
+            acquire_lookup(rate_limit)
+
+            profiles = await ProfileInfo.get_many([_id])
+            if not profiles:
                 raise ParseUserStatsError(ErrorCode.PROFILE_IS_PRIVATE)
 
-            account_created = user_data.get('timecreated')
-
-            vanity_url = vanity.split('/')[-2]
-            if vanity_url == str(_id.as_64):
-                vanity_url = None
-
-            faceit_api_link = f'https://api.faceit.com/search/v2/players?query={_id.as_64}'
-            faceit_api_response = api.session.get(faceit_api_link, timeout=15).json()['payload']['results']
-            faceit_elo, faceit_lvl, faceit_url, faceit_ban = ProfileInfo._extract_faceit_data(faceit_api_response)
-
-            bans_data = bans['players'][0]
-
-            vac_bans = bans_data['NumberOfVACBans']
-            game_bans = bans_data['NumberOfGameBans']
-
-            days_since_last_ban = 0
-            if vac_bans or game_bans:
-                days_since_last_ban = bans_data['DaysSinceLastBan']
-
-            community_ban = bans_data['CommunityBanned']
-            trade_ban = (bans_data['EconomyBan'] == 'banned')
-
-            return ProfileInfo(vanity_url,
-                               _id.as_64,
-                               _id.id,
-                               account_created,
-                               _id.invite_url,
-                               _id.as_invite_code,
-                               _id.as_csgo_friend_code,
-                               faceit_url,
-                               faceit_elo,
-                               faceit_lvl,
-                               faceit_ban,
-                               game_bans,
-                               vac_bans,
-                               days_since_last_ban,
-                               community_ban,
-                               trade_ban)
+            return profiles[0]
         except requests.exceptions.HTTPError as e:
-            status_code = e.response.status_code
+            raise_for_http_error(e)
 
-            if status_code == 400:
-                raise ParseUserStatsError(ErrorCode.INVALID_REQUEST)
-            if status_code == 403:
-                raise ParseUserStatsError(ErrorCode.PROFILE_IS_PRIVATE)
-            raise e
+    @staticmethod
+    async def scan_lobby(status_dump: str, rate_limit: TokenBucket = None) -> list[ProfileInfo]:
+        """Get profile info of every player mentioned in the output of CS2 ``status`` console command."""
+
+        ids = parse_status_steamids(status_dump)
+        if not ids:
+            raise ParseUserStatsError(ErrorCode.INVALID_REQUEST)
+
+        acquire_lookup(rate_limit)  # it's a single batched lookup
+
+        return await ProfileInfo.get_many(ids)
 
     def to_tuple(self) -> tuple:
         return astuple(self)
 
 
+def parse_steamid_offline(data: str) -> SteamID | None:
+    """
+    Decode a SteamID without requests: SteamID2, SteamID3, SteamID64, an account ID or a ``/profiles/`` link.
+
+    Returns ``None`` for anything else, e.g. vanity links, which have to be resolved by Steam.
+    """
+
+    data = data.strip()
+    if (match := STEAM_PROFILES_LINK_PATTERN.fullmatch(data)) is not None:
+        data = match.group(1)
+
+    if (_id := SteamID(data)).is_valid():
+        return _id
+    return None
+
+
 def parse_steamid(data: str) -> SteamID:
     if data is None:
         raise ParseUserStatsError(ErrorCode.INVALID_REQUEST)
 
     data = data.strip()
 
+    if (_id := parse_steamid_offline(data)) is not None:
+        return _id
+
     if STEAM_PROFILE_LINK_PATTERN.match(data):
         if not data.startswith('http'):
             data = 'https://' + data
@@ -401,10 +569,36 @@ def parse_steamid(data: str) -> SteamID:
 
         return _id
 
-    if (_id := SteamID(data)).is_valid():
-        return _id
-
     if (_id := steamid.from_url(f'https://steamcommunity.com/id/{data}')) is None:
         raise ParseUserStatsError(ErrorCode.INVALID_REQUEST)
 
     return _id
+
+
+async def resolve_steamid(data: str, rate_limit: TokenBucket | None = None) -> SteamID:
+    """
+    ``parse_steamid`` that doesn't block the event loop. Resolving a vanity url is an upstream lookup,
+    so it takes a token before the request is made.
+    """
+
+    if data is not None and (_id := parse_steamid_offline(data)) is not None:
+        return _id
+
+    acquire_lookup(rate_limit)
+    return await asyncio.to_thread(parse_steamid, data)
+
+
+def parse_status_steamids(text: str) -> list[SteamID]:
+    """
+    Extract all SteamIDs (SteamID2, SteamID3 or SteamID64) from the text, e.g. ``status`` command output.
+
+    Works offline, keeps the order of appearance and skips duplicates.
+    """
+
+    result = {}
+    for match in STATUS_STEAMID_PATTERN.finditer(text):
+        _id = SteamID(match.group(0))
+        if _id.is_valid():
+            result.setdefault(_id.as_64, _id)
+
+    return list(result.values())[:LOBBY_MAX_PLAYERS]
@@ -1 +1,2 @@
 from .leaderboard import ScoreLeaderboardData
+from .leaderboard_decoder import decode_match_entries, parse_detail_data
@@ -0,0 +1,128 @@
+"""
+Fast decoder of leaderboard entries' ``detailData``.
+
+``detailData`` is a hex-encoded ``ScoreLeaderboardData`` message, of which only the tag/value pairs
+of ``matchentries`` are needed. Instead of building the whole betterproto message, the bytes are walked once,
+known fields that aren't needed are skipped by their wire type. Anything unexpected falls back to betterproto.
+"""
+
+from __future__ import annotations
+
+from .leaderboard import ScoreLeaderboardData
+
+
+__all__ = ('decode_match_entries', 'parse_detail_data')
+
+
+SLD = ScoreLeaderboardData()
+
+# field numbers of ScoreLeaderboardData
+_MATCH_ENTRIES = 5
+_SKIPPED_FIELDS = frozenset((1, 2, 3, 6))  # quest_id, score, accountentries, leaderboard_name
+
+# field numbers of ScoreLeaderboardDataEntry
+_ENTRY_TAG = 1
+_ENTRY_VAL = 2
+
+_VARINT = 0
+_FIXED64 = 1
+_LENGTH_DELIMITED = 2
+_FIXED32 = 5
+
+
+class UnsupportedLayout(ValueError):
+    """The message doesn't look like the expected ``ScoreLeaderboardData``."""
+
+
+def _read_varint(data: bytes, pos: int) -> tuple[int, int]:
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+        if shift >= 64:
+            raise UnsupportedLayout('varint is too long')
+
+
+def _decode_entry(data: bytes, pos: int, end: int) -> tuple[int, int]:
+    tag = val = 0
+    while pos < end:
+        key, pos = _read_varint(data, pos)
+        if key & 7 != _VARINT:
+            raise UnsupportedLayout(f'unexpected wire type {key & 7} in a match entry')
+
+        value, pos = _read_varint(data, pos)
+        field = key >> 3
+        if field == _ENTRY_TAG:
+            tag = value
+        elif field == _ENTRY_VAL:
+            val = value
+        else:
+            raise UnsupportedLayout(f'unknown match entry field {field}')
+
+    if pos != end:
+        raise UnsupportedLayout('match entry overruns its length')
+    return tag, val
+
+
+def decode_match_entries(data: bytes) -> dict[int, int]:
+    """
+    Get ``{tag: val}`` of ``matchentries`` of a serialized ``ScoreLeaderboardData``.
+
+    Trailing zero bytes (padding of ``detailData``) are ignored.
+
+    Raises:
+        UnsupportedLayout: When the message has unknown fields or is malformed.
+    """
+
+    entries = {}
+    pos = 0
+    end = len(data)
+    try:
+        while pos < end:
+            if data[pos] == 0:  # field number 0 is invalid, so it's where the padding starts
+                if data[pos:].strip(b'\0'):
+                    raise UnsupportedLayout('zero byte in place of a field key')
+                break
+
+            key, pos = _read_varint(data, pos)
+            field, wire_type = key >> 3, key & 7
+
+            if field == _MATCH_ENTRIES and wire_type == _LENGTH_DELIMITED:
+                length, pos = _read_varint(data, pos)
+                tag, val = _decode_entry(data, pos, pos + length)
+                entries[tag] = val
+                pos += length
+            elif field not in _SKIPPED_FIELDS:
+                raise UnsupportedLayout(f'unknown field {field}')
+            elif wire_type == _VARINT:
+                _, pos = _read_varint(data, pos)
+            elif wire_type == _LENGTH_DELIMITED:
+                length, pos = _read_varint(data, pos)
+                pos += length
+            elif wire_type == _FIXED64:
+                pos += 8
+            elif wire_type == _FIXED32:
+                pos += 4
+            else:
+                raise UnsupportedLayout(f'unsupported wire type {wire_type}')
+    except IndexError:
+        raise UnsupportedLayout('message is truncated') from None
+
+    if pos > end:
+        raise UnsupportedLayout('message is truncated')
+    return entries
+
+
+def parse_detail_data(detail_data: str) -> dict[int, int]:
+    """Get ``{tag: val}`` of ``matchentries`` from the ``detailData`` of a leaderboard entry."""
+
+    try:
+        return decode_match_entries(bytes.fromhex(detail_data[2:]))
+    except ValueError:  # UnsupportedLayout or an odd hex string
+        detail_data = SLD.parse(bytes.fromhex(detail_data[2:].rstrip('0')))
+        return {entry.tag: entry.val for entry in detail_data.matchentries}
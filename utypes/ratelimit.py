@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import time
+
+
+__all__ = ('TokenBucket', 'acquire_all')
+
+
+MINUTE = 60
+
+
+class TokenBucket:
+    """
+    Classic token bucket: holds up to ``capacity`` tokens and refills ``rate`` tokens per second.
+
+    Refilling is computed lazily on access, so checks are O(1) and need no background task.
+    """
+
+    __slots__ = ('capacity', 'rate', '_tokens', '_updated_at')
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+
+    @classmethod
+    def per_minute(cls, capacity: float, requests_per_minute: float) -> TokenBucket:
+        return cls(capacity, requests_per_minute / MINUTE)
+
+    @property
+    def tokens(self) -> float:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+        return self._tokens
+
+    def has(self, cost: float = 1) -> bool:
+        return self.tokens >= cost
+
+    def consume(self, cost: float = 1):
+        self._tokens = self.tokens - cost
+
+    def try_acquire(self, cost: float = 1) -> bool:
+        if not self.has(cost):
+            return False
+        self.consume(cost)
+        return True
+
+
+def acquire_all(*buckets: TokenBucket | None, cost: float = 1) -> bool:
+    """Take ``cost`` tokens from every bucket, or from none of them if any is short. ``None`` buckets are skipped."""
+
+    buckets = [bucket for bucket in buckets if bucket is not None]
+    if not all(bucket.has(cost) for bucket in buckets):
+        return False
+
+    for bucket in buckets:
+        bucket.consume(cost)
+    return True
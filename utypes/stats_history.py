@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import time
+from typing import NamedTuple
+import zlib
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.future import select
+
+from db import db_session, StatsSnapshot
+from .profiles import NUMERIC_STATS_INDEX, UserGameStats
+
+
+__all__ = ('StatsHistory', 'StatsProgress')
+
+
+VALUES_SCALE = 100  # float stats are rounded to 2 digits, so they are stored as fixed-point integers
+_PACKED_DTYPES = ('<i1', '<i2', '<i4', '<i8')
+
+
+def pack_values(values: np.ndarray) -> bytes:
+    """Pack an integer array using the narrowest fitting dtype. The first byte is the dtype index."""
+
+    low, high = int(values.min(initial=0)), int(values.max(initial=0))
+    for i, dtype in enumerate(_PACKED_DTYPES):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            break
+
+    # noinspection PyUnboundLocalVariable
+    return bytes((i,)) + zlib.compress(values.astype(dtype).tobytes(), 9)
+
+
+def unpack_values(data: bytes) -> np.ndarray:
+    return np.frombuffer(zlib.decompress(data[1:]), dtype=_PACKED_DTYPES[data[0]]).astype(np.int64)
+
+
+def to_fixed_point(stats: UserGameStats) -> np.ndarray:
+    return np.rint(np.array(stats.numeric_values(), dtype=np.float64) * VALUES_SCALE).astype(np.int64)
+
+
+class StatsProgress(NamedTuple):
+    since: int  # when the previous snapshot was taken
+    delta: np.ndarray  # difference of NUMERIC_STATS_FIELDS
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.delta.any()
+
+    def change(self, field: str) -> float:
+        return self.delta[NUMERIC_STATS_INDEX[field]] / VALUES_SCALE
+
+
+class StatsHistory:
+    """
+    Stats snapshots of every looked up player.
+
+    Every ``KEYFRAME_INTERVAL``-th snapshot of the player (a keyframe) stores full values,
+    the others only store the difference with the previous one, which is mostly zeros and compresses
+    to a few dozen bytes. Reading any snapshot only needs the rows since the nearest keyframe.
+    """
+
+    KEYFRAME_INTERVAL = 16
+
+    @staticmethod
+    def _decode(rows: list[StatsSnapshot]) -> tuple[list[StatsSnapshot], np.ndarray]:
+        """
+        Restore full values of consecutive snapshots, starting with a keyframe.
+
+        Snapshots taken before ``NUMERIC_STATS_FIELDS`` changed can't be compared with the later ones,
+        so only the ones of the same shape as the latest keyframe are kept. Returns them and their values.
+        """
+
+        unpacked = [unpack_values(row.data) for row in rows]
+        latest_keyframe = max(i for i, row in enumerate(rows) if row.is_keyframe)
+        kept = [i for i, values in enumerate(unpacked) if values.shape == unpacked[latest_keyframe].shape]
+
+        rows = [rows[i] for i in kept]
+        values = np.stack([unpacked[i] for i in kept])
+        keyframes = np.flatnonzero([row.is_keyframe for row in rows])
+
+        for start, end in zip(keyframes, [*keyframes[1:], len(rows)]):
+            values[start:end] = values[start:end].cumsum(axis=0)
+        return rows, values
+
+    @staticmethod
+    async def _since_keyframe(db_sess, steamid: int, before_id: int = None) -> list[StatsSnapshot]:
+        # noinspection PyTypeChecker
+        keyframe_query = select(func.max(StatsSnapshot.id)).where(StatsSnapshot.steamid == steamid,
+                                                                  StatsSnapshot.is_keyframe)
+        if before_id is not None:
+            keyframe_query = keyframe_query.where(StatsSnapshot.id <= before_id)
+
+        # noinspection PyTypeChecker
+        query = (select(StatsSnapshot)
+                 .where(StatsSnapshot.steamid == steamid,
+                        StatsSnapshot.id >= keyframe_query.scalar_subquery())
+                 .order_by(StatsSnapshot.id))
+        return list((await db_sess.execute(query)).scalars())
+
+    @staticmethod
+    async def record(stats: UserGameStats) -> StatsProgress | None:
+        """
+        Save a snapshot of the player's stats.
+
+        Returns:
+            Progress since the previous snapshot or ``None`` if it's the first one.
+            Unchanged stats aren't saved again.
+        """
+
+        current = to_fixed_point(stats)
+
+        async def save(db_sess) -> StatsProgress | None:
+            rows = await StatsHistory._since_keyframe(db_sess, stats.steamid)
+
+            progress = None
+            if rows:
+                _, values = StatsHistory._decode(rows)
+                previous = values[-1]
+                if previous.shape != current.shape:  # stats fields have changed, start over
+                    rows = []
+                else:
+                    progress = StatsProgress(rows[-1].taken_at, current - previous)
+                    if progress.is_empty:
+                        return progress
+
+            is_keyframe = not rows or len(rows) >= StatsHistory.KEYFRAME_INTERVAL
+            data = pack_values(current if is_keyframe else progress.delta)
+
+            db_sess.add(StatsSnapshot(steamid=stats.steamid,
+                                      taken_at=int(time.time()),
+                                      is_keyframe=is_keyframe,
+                                      data=data))
+            return progress
+
+        return await db_session.write(save)
+
+    @staticmethod
+    async def get(steamid: int, limit: int = 10) -> list[tuple[int, np.ndarray]]:
+        """Get up to ``limit`` latest snapshots as (taken at, ``NUMERIC_STATS_FIELDS`` values) pairs, oldest first."""
+
+        async with db_session.create_session() as db_sess:
+            # noinspection PyTypeChecker
+            query = (select(StatsSnapshot.id)
+                     .where(StatsSnapshot.steamid == steamid)
+                     .order_by(StatsSnapshot.id.desc())
+                     .limit(limit))
+            ids = list((await db_sess.execute(query)).scalars())
+            if not ids:
+                return []
+
+            rows = await StatsHistory._since_keyframe(db_sess, steamid, before_id=ids[-1])
+
+        rows, values = StatsHistory._decode(rows)
+        recent = [i for i, row in enumerate(rows) if row.id >= ids[-1]]  # some might have been dropped
+        return [(rows[i].taken_at, values[i] / VALUES_SCALE) for i in recent]
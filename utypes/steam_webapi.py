@@ -1,5 +1,133 @@
+from __future__ import annotations
+
+import datetime as dt
+import json
+import logging
+import re
+import time
+from typing import Sequence
+
 import requests
 
+from .http_cache import HTTPCache
+from .transport import RetryPolicy, Transport
+
+
+__all__ = ('SteamAPIKey', 'SteamKeyPool', 'SteamKeyRejected', 'SteamKeysExhausted', 'SteamWebAPI')
+
+
+MINUTE = 60
+HOUR = 60 * MINUTE
+BAD_KEY_PATTERN = re.compile(r'verify your\s*(?:<pre>)?key=', re.IGNORECASE)  # Steam's page for a bad key
+
+
+class SteamKeysExhausted(Exception):
+    """Raised when every key of the pool is out of its daily quota or cooling down."""
+
+
+class SteamKeyRejected(Exception):
+    """Raised when Steam rejects the last available key as a bad one, e.g. it was revoked."""
+
+
+class SteamAPIKey:
+    __slots__ = ('key', 'daily_quota', 'calls_today', 'day', 'cooldown_until', 'cooldowns_in_a_row')
+
+    def __init__(self, key: str, daily_quota: int):
+        self.key = key
+        self.daily_quota = daily_quota
+        self.calls_today = 0
+        self.day = self._today()
+        self.cooldown_until = 0.
+        self.cooldowns_in_a_row = 0
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}(key=...{self.key[-4:]}, '
+                f'calls_today={self.calls_today}/{self.daily_quota}, cooldown_until={self.cooldown_until})')
+
+    @staticmethod
+    def _today() -> dt.date:
+        return dt.datetime.now(dt.timezone.utc).date()
+
+    @property
+    def calls_left(self) -> int:
+        if (today := self._today()) != self.day:  # quotas reset daily
+            self.day = today
+            self.calls_today = 0
+        return self.daily_quota - self.calls_today
+
+    @property
+    def is_available(self) -> bool:
+        return self.calls_left > 0 and time.monotonic() >= self.cooldown_until
+
+
+class SteamKeyPool:
+    """
+    Rotates Steam Web API keys, always picking the least used available one.
+
+    Each key has a daily quota, and a key that got 429 (Too Many Requests) or Steam's bad key page
+    is put on an exponentially growing cooldown. The last available key is never benched for a bad key page.
+
+    Every process gets its own lane: a fixed share of every key's daily quota (see ``LANE_SHARES``),
+    so the bot's user lookups can never eat into the quota of the collectors and vice versa.
+    """
+
+    DAILY_QUOTA = 100_000
+    LANE_SHARES = {'collectors': 0.3, 'users': 0.7}
+    RATE_LIMITED_COOLDOWN = MINUTE
+    REJECTED_COOLDOWN = HOUR
+    MAX_COOLDOWN = 6 * HOUR
+
+    def __init__(self, keys: str | Sequence[str], *, lane: str = None, daily_quota: int = None):
+        if isinstance(keys, str):
+            keys = [keys]
+        if not keys:
+            raise ValueError('at least one key is required')
+
+        daily_quota = daily_quota or self.DAILY_QUOTA
+        if lane is not None:
+            daily_quota = int(daily_quota * self.LANE_SHARES[lane])
+
+        self.lane = lane
+        self.keys = [SteamAPIKey(key, daily_quota) for key in dict.fromkeys(keys)]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def acquire(self) -> SteamAPIKey:
+        """Pick a key for the next call and count the call."""
+
+        available = [key for key in self.keys if key.is_available]
+        if not available:
+            raise SteamKeysExhausted
+
+        key = min(available, key=lambda k: k.calls_today)
+        key.calls_today += 1
+        return key
+
+    def report_success(self, key: SteamAPIKey):
+        key.cooldowns_in_a_row = 0
+
+    def report_rejected(self, key: SteamAPIKey, status_code: int) -> bool:
+        """Put the key on cooldown, returns ``False`` if it's kept instead."""
+
+        if status_code != 429 and not any(other.is_available for other in self.keys if other is not key):
+            logging.warning(f'Steam API key ...{key.key[-4:]} got {status_code}, but it\'s the last available one')
+            return False
+
+        base = self.RATE_LIMITED_COOLDOWN if status_code == 429 else self.REJECTED_COOLDOWN
+        cooldown = min(base * 2 ** key.cooldowns_in_a_row, self.MAX_COOLDOWN)
+
+        key.cooldowns_in_a_row += 1
+        key.cooldown_until = time.monotonic() + cooldown
+        logging.warning(f'Steam API key ...{key.key[-4:]} got {status_code}, cooling down for {cooldown}s')
+        return True
+
+    def usage(self) -> list[dict]:
+        return [{'key': f'...{key.key[-4:]}',
+                 'calls_today': key.calls_today,
+                 'calls_left': key.calls_left,
+                 'cooling_down': time.monotonic() < key.cooldown_until} for key in self.keys]
+
 
 class SteamWebAPI:
     """Made because `steamio` doesn't have any Steam WebAPI support."""
@@ -8,26 +136,73 @@ class SteamWebAPI:
 
     BASE_URL = 'api.steampowered.com'
     DEFAULT_HEADERS = {}
-    DEFAULT_TIMEOUT = 15
-
-    def __init__(self, api_key: str, *, headers: dict = None, timeout: int = None):
-        self.api_key = api_key
+    DEFAULT_TIMEOUT = 15  # total latency budget of a call, retries included
+    ENDPOINT_BUDGETS = {  # user lookups should fail fast
+        'ISteamUser/GetPlayerBans': 8,
+        'ISteamUser/GetPlayerSummaries': 8,
+        'ISteamUserStats/GetUserStatsForGame': 8,
+    }
+
+    def __init__(self, api_key: str | Sequence[str] | SteamKeyPool, *,
+                 lane: str = None, headers: dict = None, timeout: int = None, retry: RetryPolicy = RetryPolicy(),
+                 cache: HTTPCache = None):
+        self.keys = api_key if isinstance(api_key, SteamKeyPool) else SteamKeyPool(api_key, lane=lane)
         self.headers = headers or self.DEFAULT_HEADERS
         self.timeout = timeout or self.DEFAULT_TIMEOUT
         self.session = requests.Session()
-
-    def _method(self, interface: str, method: str, version: int, params: dict = None):  # only supports GET methods btw
+        self.transport = Transport(self.session, retry=retry,
+                                   budgets=self.ENDPOINT_BUDGETS, default_budget=self.timeout)
+        self.cache = cache  # for rarely changing data, see `_method(cached=True)`
+
+    @staticmethod
+    def _is_key_rejected(response: requests.Response) -> bool:
+        if response.status_code == 429:
+            return True
+        return response.status_code == 403 and BAD_KEY_PATTERN.search(response.text) is not None
+
+    def _method(self, interface: str, method: str, version: int, params: dict = None, *,
+                cached: bool = False):  # only supports GET methods btw
         params = params.copy() if params else {}
-        params['key'] = self.api_key
 
-        response = self.session.get(
-            f'https://{self.BASE_URL}/{interface}/{method}/v{version}/',
-            params=params,
-            headers=self.headers,
-            timeout=self.timeout
-        )
-
-        return response.json()
+        endpoint = f'{interface}/{method}'
+        headers = self.headers
+        cache_key = None
+        if cached and self.cache is not None:  # the key isn't a part of the cache key
+            cache_key = f'{endpoint}/v{version}?' + '&'.join(f'{k}={v}' for k, v in sorted(params.items()))
+            headers = headers | self.cache.conditional_headers(cache_key)
+
+        for _ in range(len(self.keys)):  # try every key at most once
+            key = self.keys.acquire()
+            params['key'] = key.key
+
+            response = self.transport.get(
+                endpoint,
+                f'https://{self.BASE_URL}/{interface}/{method}/v{version}/',
+                params=params,
+                headers=headers
+            )
+
+            if self._is_key_rejected(response):
+                if self.keys.report_rejected(key, response.status_code):
+                    continue
+                # 429 always benches the key, so it's the bad key page
+                logging.error(f'Steam rejected API key ...{key.key[-4:]} and there is no other key to use, '
+                              f'check the keys in the config')
+                raise SteamKeyRejected(f'Steam rejected API key ...{key.key[-4:]}')
+
+            if response.status_code == 403:  # e.g. a private profile, see `profiles.raise_for_http_error`
+                response.raise_for_status()
+            self.keys.report_success(key)
+            if cache_key is not None:
+                return self.cache.resolve(endpoint, cache_key, response, json.loads)
+            return response.json()
+
+        raise SteamKeysExhausted
+
+    def metrics(self) -> dict[str, dict]:
+        """Success rate and latency of every endpoint called so far."""
+
+        return {endpoint: metrics.asdict() for endpoint, metrics in self.transport.metrics.items()}
 
     def close(self):
         self.session.close()
@@ -55,7 +230,7 @@ class SteamWebAPI:
 
     def get_asset_prices(self, appid: int):
         return self._method('ISteamEconomy', 'GetAssetPrices', 1,
-                            {'appid': appid})
+                            {'appid': appid}, cached=True)
 
     def get_number_of_current_players(self, appid: int):
         return self._method('ISteamUserStats', 'GetNumberOfCurrentPlayers', 1,
@@ -0,0 +1,104 @@
+import time
+
+import pytest
+import requests
+
+from utypes.game_data import LeaderboardStats
+from utypes.leaderboard_history import LeaderboardHistory, LeaderboardRecord
+from utypes.leaderboard_store import LeaderboardStore
+from utypes.steam_webapi import SteamKeyRejected, SteamWebAPI
+from utypes.transport import EndpointUnavailable, RetryPolicy, Transport
+
+
+def board(*entries: tuple[str, int, int]) -> dict[str, list[LeaderboardStats]]:
+    """The world board of (name, rating, timestamp) entries, in rank order."""
+
+    return {'world': [LeaderboardStats(rank, rating, name, 0, 0, 0, {}, timestamp, 'EU')
+                      for rank, (name, rating, timestamp) in enumerate(entries, 1)]}
+
+
+def test_leaderboard_diff():
+    """
+    Test to check that players who share a name get their own rank and rating deltas.
+    """
+
+    previous = LeaderboardStore.from_stats(board(('a', 300, 1), ('twin', 200, 1), ('twin', 100, 1)))
+    store = LeaderboardStore.from_stats(board(('twin', 350, 2), ('a', 300, 1), ('twin', 150, 2), ('twin', 50, 2)),
+                                        previous=previous)
+
+    rows = store.tables['world'].page(0)
+    assert [(row.rank_delta, row.rating_delta) for row in rows] == [(1, 150), (-1, 0), (0, 50), (None, 0)]
+
+
+def test_leaderboard_history():
+    """
+    Test to check that players who share a name get a new record only after they've played.
+    """
+
+    history = LeaderboardHistory()
+    assert history.append(LeaderboardStore.from_stats(board(('twin', 200, 1), ('twin', 100, 2)), 10)) == 2
+    assert history.append(LeaderboardStore.from_stats(board(('twin', 200, 1), ('twin', 100, 2)), 20)) == 0
+    assert history.append(LeaderboardStore.from_stats(board(('twin', 250, 3), ('twin', 100, 2)), 30)) == 1
+
+    assert history.player('world', 'twin') == [LeaderboardRecord(10, 1, 200, 1), LeaderboardRecord(10, 2, 100, 2),
+                                               LeaderboardRecord(30, 1, 250, 3)]
+
+
+class FakeSession:
+    """Answers every request with the given responses or fails it with the given exceptions, in turn."""
+
+    def __init__(self, *outcomes: requests.Response | BaseException):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def get(self, *_, **__):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+
+def response(status_code: int, text: str = '') -> requests.Response:
+    result = requests.Response()
+    result.status_code = status_code
+    result._content = text.encode()
+    return result
+
+
+def test_transport_half_open_trial():
+    """
+    Test to check that a half-open trial failing with an error that isn't retried still lets the next trial through.
+    """
+
+    session = FakeSession(requests.exceptions.ConnectionError(), requests.exceptions.ChunkedEncodingError(),
+                            requests.exceptions.ConnectionError())
+    transport = Transport(session, retry=RetryPolicy(attempts=1), failure_threshold=1, reset_timeout=0.01)
+
+    for error in (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError):
+        with pytest.raises(error):
+            transport.get('endpoint', 'https://example.com')
+        with pytest.raises(EndpointUnavailable):
+            transport.get('endpoint', 'https://example.com')
+        time.sleep(0.02)
+
+    with pytest.raises(requests.exceptions.ConnectionError):
+        transport.get('endpoint', 'https://example.com')
+    assert session.calls == 3
+
+
+def test_steam_bad_key_page():
+    """
+    Test to check that Steam rejecting the only key isn't taken for a private profile, and the key is kept.
+    """
+
+    webapi = SteamWebAPI('key', retry=RetryPolicy(attempts=1))
+    webapi.transport.session = FakeSession(response(403, '<p>Please verify your <pre>key=</pre> parameter.</p>'),
+                                           response(403, 'Forbidden'))
+
+    with pytest.raises(SteamKeyRejected):
+        webapi.get_player_bans(['76561198000000000'])
+    assert webapi.keys.keys[0].is_available
+
+    with pytest.raises(requests.exceptions.HTTPError):  # e.g. a private profile
+        webapi.get_player_bans(['76561198000000000'])
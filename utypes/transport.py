@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+from collections import defaultdict, deque
+import logging
+import random
+import time
+from typing import NamedTuple
+
+import requests
+
+
+__all__ = ('CircuitBreaker', 'EndpointMetrics', 'EndpointUnavailable', 'RetryPolicy', 'Transport')
+
+
+MINUTE = 60
+
+
+class EndpointUnavailable(requests.exceptions.RequestException):
+    """Raised without making a request while the endpoint's circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Opens after ``failure_threshold`` consecutive failures and rejects calls for ``reset_timeout`` seconds.
+
+    After the timeout a single trial call is let through (half-open state):
+    if it succeeds, the breaker closes, otherwise it opens again.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = MINUTE, *, name: str = None):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.name = name
+
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._trial_in_progress = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allows(self) -> bool:
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self._trial_in_progress:
+            self._trial_in_progress = True
+            return True
+        return False
+
+    def record_success(self):
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_progress = False
+
+    def release(self):
+        """Let another trial through, when the trial call ended without an outcome, e.g. got cancelled."""
+
+        self._trial_in_progress = False
+
+    def record_failure(self):
+        self._failures += 1
+        self._trial_in_progress = False
+        if self._opened_at is not None or self._failures >= self.failure_threshold:
+            if self._opened_at is None:
+                name = f' for {self.name}' if self.name else ''
+                logging.warning(f'Circuit breaker{name} opened after {self._failures} failures in a row')
+            self._opened_at = time.monotonic()
+
+
+class RetryPolicy(NamedTuple):
+    """Exponential backoff with full jitter: attempt N waits a random time up to ``base_delay * 2^N``."""
+
+    attempts: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 8
+
+    def delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class EndpointMetrics:
+    __slots__ = ('calls', 'successes', 'failures', 'rejected', '_latencies')
+
+    RECENT_LATENCIES = 100
+
+    def __init__(self):
+        self.calls = 0
+        self.successes = 0
+        self.failures = 0
+        self.rejected = 0  # by the circuit breaker, without a request
+        self._latencies: deque[float] = deque(maxlen=self.RECENT_LATENCIES)
+
+    def record(self, latency: float, ok: bool):
+        self.calls += 1
+        if ok:
+            self.successes += 1
+        else:
+            self.failures += 1
+        self._latencies.append(latency)
+
+    @property
+    def success_rate(self) -> float:
+        return self.successes / self.calls if self.calls else 1.
+
+    def latency_percentile(self, percentile: float) -> float:
+        if not self._latencies:
+            return 0.
+        latencies = sorted(self._latencies)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * percentile))]
+
+    def asdict(self) -> dict:
+        return {'calls': self.calls,
+                'successes': self.successes,
+                'failures': self.failures,
+                'rejected': self.rejected,
+                'success_rate': self.success_rate,
+                'latency_p50': self.latency_percentile(0.5),
+                'latency_p95': self.latency_percentile(0.95)}
+
+
+class Transport:
+    """
+    Sends GET requests with retries, a per-endpoint circuit breaker and a per-endpoint latency budget.
+
+    The budget caps the total time of one call, retries included: every attempt gets only the time left,
+    and no retry is made if its backoff wouldn't fit. Server errors (5xx), timeouts and connection errors
+    are retried; other responses are returned as is.
+    """
+
+    DEFAULT_BUDGET = 10
+
+    def __init__(self, session: requests.Session = None, *,
+                 retry: RetryPolicy = RetryPolicy(),
+                 budgets: dict[str, float] = None,
+                 default_budget: float = None,
+                 failure_threshold: int = 3,
+                 reset_timeout: float = MINUTE):
+        self.session = session or requests.Session()
+        self.retry = retry
+        self.budgets = budgets or {}
+        self.default_budget = default_budget or self.DEFAULT_BUDGET
+
+        self.breakers: dict[str, CircuitBreaker] = {}
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self.metrics: defaultdict[str, EndpointMetrics] = defaultdict(EndpointMetrics)
+
+    def _breaker(self, endpoint: str) -> CircuitBreaker:
+        if endpoint not in self.breakers:
+            self.breakers[endpoint] = CircuitBreaker(self._failure_threshold, self._reset_timeout, name=endpoint)
+        return self.breakers[endpoint]
+
+    def get(self, endpoint: str, url: str, **kwargs) -> requests.Response:
+        """
+        Raises:
+            EndpointUnavailable: When the endpoint's circuit breaker is open.
+            requests.RequestException: When every attempt failed.
+        """
+
+        breaker = self._breaker(endpoint)
+        metrics = self.metrics[endpoint]
+
+        if not breaker.allows():
+            metrics.rejected += 1
+            raise EndpointUnavailable(f'{endpoint} is unavailable, not trying until the breaker resets')
+
+        deadline = time.monotonic() + self.budgets.get(endpoint, self.default_budget)
+        error = None
+        try:
+            for attempt in range(self.retry.attempts):
+                start = time.monotonic()
+                if start >= deadline:
+                    break
+
+                try:
+                    response = self.session.get(url, timeout=deadline - start, **kwargs)
+                    if response.status_code < 500:
+                        metrics.record(time.monotonic() - start, ok=True)
+                        breaker.record_success()
+                        return response
+                    error = requests.exceptions.HTTPError(f'{response.status_code} Server Error for {endpoint}',
+                                                          response=response)
+                except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                    error = e
+
+                metrics.record(time.monotonic() - start, ok=False)
+
+                delay = self.retry.delay(attempt)
+                if attempt + 1 == self.retry.attempts or time.monotonic() + delay >= deadline:
+                    break
+                time.sleep(delay)
+        except requests.exceptions.RequestException:  # not retried, e.g. a broken response body
+            breaker.record_failure()
+            raise
+        except BaseException:  # e.g. KeyboardInterrupt, it says nothing about the endpoint
+            breaker.release()
+            raise
+
+        breaker.record_failure()
+        raise error or requests.exceptions.Timeout(f'{endpoint} exceeded its latency budget')
@@ -0,0 +1,202 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import NamedTuple
+
+from sqlalchemy import delete, distinct, func, insert, update
+from sqlalchemy.future import select
+
+from db import db_session, BanState, User as DBUser, WatchedProfile
+from .profiles import api, STEAM_OUTAGES
+from .steam_webapi import SteamWebAPI
+
+
+__all__ = ('BanChange', 'BanWatchlist', 'PackedBans', 'WatchlistFull')
+
+
+class WatchlistFull(Exception):
+    """Raised when the user tries to watch more profiles than ``BanWatchlist.MAX_PER_USER``."""
+
+
+class PackedBans(NamedTuple):
+    """
+    Ban status of the profile that can be packed into a single integer:
+    bits 0-7 are VAC bans, bits 8-15 are game bans, bit 16 is community ban and bit 17 is trade ban.
+
+    ``DaysSinceLastBan`` is left out on purpose: it changes daily and isn't a status change.
+    """
+
+    vac_bans: int = 0
+    game_bans: int = 0
+    community_ban: bool = False
+    trade_ban: bool = False
+
+    @classmethod
+    def from_api(cls, player: dict) -> PackedBans:
+        return cls(player['NumberOfVACBans'],
+                   player['NumberOfGameBans'],
+                   player['CommunityBanned'],
+                   player['EconomyBan'] == 'banned')
+
+    @classmethod
+    def unpack(cls, state: int) -> PackedBans:
+        return cls(state & 0xFF,
+                   (state >> 8) & 0xFF,
+                   bool(state & (1 << 16)),
+                   bool(state & (1 << 17)))
+
+    def pack(self) -> int:
+        return (min(self.vac_bans, 0xFF)
+                | min(self.game_bans, 0xFF) << 8
+                | self.community_ban << 16
+                | self.trade_ban << 17)
+
+
+class BanChange(NamedTuple):
+    steamid: int
+    old: PackedBans
+    new: PackedBans
+    watchers: list[tuple[int, str]]  # (userid, language)
+
+
+class BanWatchlist:
+    """Personal lists of watched profiles and the periodic ban status sweep over all of them."""
+
+    MAX_PER_USER = 50
+    API_BATCH_SIZE = 100  # Steam WebAPI limit for batched requests
+    DB_PAGE_SIZE = 1000
+
+    @staticmethod
+    async def get(userid: int) -> list[int]:
+        async with db_session.create_session() as db_sess:
+            # noinspection PyTypeChecker
+            query = select(WatchedProfile.steamid).where(WatchedProfile.userid == userid).order_by(WatchedProfile.id)
+            return list((await db_sess.execute(query)).scalars())
+
+    @staticmethod
+    async def toggle(userid: int, steamid64: int) -> bool:
+        """
+        Add the profile to the user's watchlist or remove it if it's already there.
+
+        Returns:
+            ``True`` if the profile was added, ``False`` if it was removed.
+
+        Raises:
+            WatchlistFull: When the watchlist is already full.
+        """
+
+        async def toggle(db_sess) -> bool:
+            # noinspection PyTypeChecker
+            query = delete(WatchedProfile).where(WatchedProfile.userid == userid,
+                                                 WatchedProfile.steamid == steamid64)
+            if (await db_sess.execute(query)).rowcount:
+                return False
+
+            # noinspection PyTypeChecker
+            query = select(func.count()).select_from(WatchedProfile).where(WatchedProfile.userid == userid)
+            if (await db_sess.execute(query)).scalar() >= BanWatchlist.MAX_PER_USER:
+                raise WatchlistFull
+
+            db_sess.add(WatchedProfile(userid=userid, steamid=steamid64))
+            return True
+
+        return await db_session.write(toggle)
+
+    @staticmethod
+    async def sweep(webapi: SteamWebAPI = api) -> list[BanChange]:
+        """
+        Check ban status of every watched profile and return the ones that have changed since the last sweep.
+
+        Watched ids are walked in pages ordered by steamid, so memory use doesn't grow with the watchlist,
+        and every page is checked with ``GetPlayerBans`` in batches of ``API_BATCH_SIZE`` ids.
+        Profiles seen for the first time are only remembered.
+        """
+
+        start = time.perf_counter()
+        checked = api_calls = 0
+        changes = []
+
+        last_steamid = -1
+        while True:
+            async with db_session.create_session() as db_sess:
+                # noinspection PyTypeChecker
+                query = (select(distinct(WatchedProfile.steamid))
+                         .where(WatchedProfile.steamid > last_steamid)
+                         .order_by(WatchedProfile.steamid)
+                         .limit(BanWatchlist.DB_PAGE_SIZE))
+                steamids = list((await db_sess.execute(query)).scalars())
+            if not steamids:
+                break
+
+            last_steamid = steamids[-1]
+            checked += len(steamids)
+
+            batches = [steamids[i:i + BanWatchlist.API_BATCH_SIZE]
+                       for i in range(0, len(steamids), BanWatchlist.API_BATCH_SIZE)]
+            api_calls += len(batches)
+            try:
+                responses = await asyncio.gather(*(asyncio.to_thread(webapi.get_player_bans,
+                                                                     [str(_id) for _id in batch])
+                                                   for batch in batches))
+            except STEAM_OUTAGES:  # the rest waits for the next sweep
+                logging.warning(f'Ban watchlist sweep stopped after {checked - len(steamids)} profiles, '
+                                f'GetPlayerBans is unavailable')
+                break
+            fresh = {int(player['SteamId']): PackedBans.from_api(player)
+                     for response in responses
+                     for player in response.get('players', [])}
+
+            changes += await BanWatchlist._store_page(fresh)
+
+        logging.info(f'Ban watchlist sweep: checked {checked} profiles with {api_calls} API calls '
+                     f'in {time.perf_counter() - start:.2f}s, {len(changes)} changed')
+        return changes
+
+    @staticmethod
+    async def _store_page(fresh: dict[int, PackedBans]) -> list[BanChange]:
+        """Diff the page against the stored states, write only what differs and collect the watchers."""
+
+        if not fresh:
+            return []
+
+        now = int(time.time())
+
+        async def store(db_sess) -> dict[int, PackedBans]:
+            # noinspection PyTypeChecker
+            query = select(BanState.steamid, BanState.state).where(BanState.steamid.in_(fresh))
+            stored = dict((await db_sess.execute(query)).all())
+
+            new_rows = []
+            changed_rows = []
+            changed = {}
+            for steamid, bans in fresh.items():
+                state = bans.pack()
+                if steamid not in stored:
+                    new_rows.append({'steamid': steamid, 'state': state, 'changed_at': now})
+                elif stored[steamid] != state:
+                    changed_rows.append({'steamid': steamid, 'state': state, 'changed_at': now})
+                    changed[steamid] = PackedBans.unpack(stored[steamid])
+
+            if new_rows:
+                await db_sess.execute(insert(BanState), new_rows)
+            if changed_rows:
+                await db_sess.execute(update(BanState), changed_rows)
+            return changed
+
+        changed = await db_session.write(store)
+        if not changed:
+            return []
+
+        async with db_session.create_session() as db_sess:
+            # noinspection PyTypeChecker
+            query = (select(WatchedProfile.steamid, WatchedProfile.userid, DBUser.language)
+                     .outerjoin(DBUser, DBUser.userid == WatchedProfile.userid)
+                     .where(WatchedProfile.steamid.in_(changed)))
+            watchers = {}
+            for steamid, userid, language in await db_sess.execute(query):
+                watchers.setdefault(steamid, []).append((userid, language or 'en'))
+
+        return [BanChange(steamid, old, fresh[steamid], watchers.get(steamid, []))
+                for steamid, old in changed.items()]